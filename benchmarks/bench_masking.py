@@ -0,0 +1,371 @@
+"""
+Benchmark of speed and recall of masking synthetic screenshots.
+
+Screenshots of different sizes, densities of text and fonts are rendered
+with secret strings at known positions. Each of them is masked by
+find_secret_rects(), and images/sec, latency of each stage, peak RSS and
+recall of the secrets are reported. A secret is recalled when its rect is
+covered by the found rects.
+
+Text is rendered with real fonts and recognized by the OCR backend chosen
+by --ocr-backend (auto by default). --ocr-backend fake draws fake glyphs
+recognized by the fake OCR backend instead, which measures only masecret's
+own overhead without tesseract. The fake backend always recognizes its
+glyphs, so recall is not reported in that mode.
+
+Results can be saved as a JSON baseline, and a later run can be compared with
+it to check regressions in speed and recall together. Results of different
+OCR backends cannot be compared:
+
+    $ python benchmarks/bench_masking.py --save baseline.json
+    $ python benchmarks/bench_masking.py --compare baseline.json
+"""
+
+import re
+import sys
+import json
+import time
+import random
+import string
+import argparse
+import resource
+
+sys.path.insert(0, '.')
+
+from PIL import Image, ImageDraw, ImageFont  # noqa: E402
+
+from masecret.backends import OCRBackend, FakeBackend, get_backend, draw_fake_text  # noqa: E402
+from masecret.masking import find_secret_rects, mask_rects  # noqa: E402
+from masecret.matching import SecretMatcher  # noqa: E402
+from masecret.position_utils import merge_rects  # noqa: E402
+
+SIZES = {
+    'small': (800, 600),
+    'laptop': (1440, 900),
+    'fullhd': (1920, 1080),
+    'tall': (1280, 4000),
+}
+
+# Fraction of lines having text.
+DENSITIES = {
+    'sparse': 0.3,
+    'dense': 0.9,
+}
+
+FONT_SIZES = [12, 16, 24]
+
+SECRET_PATTERNS = [
+    r'[-\d]{12,}',
+    r'AKIA[0-9A-Z]{16}',
+    r'[a-z]+-\d+\.example\.com',
+]
+
+# Fraction of a secret rect which must be masked to be recalled.
+MIN_COVERAGE = 0.95
+
+
+class TimedBackend(OCRBackend):
+    """
+    Backend measuring time spent by another backend.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.name = backend.name
+        self.elapsed = 0.0
+
+    def default_configs(self):
+        return self.backend.default_configs()
+
+    def image_to_char_boxes(self, image, lang, tesseract_configs):
+        start = time.perf_counter()
+        try:
+            return self.backend.image_to_char_boxes(image, lang, tesseract_configs)
+        finally:
+            self.elapsed += time.perf_counter() - start
+
+
+def generate_secret(rand):
+    """
+    Generate a string matching one of SECRET_PATTERNS.
+    """
+
+    kind = rand.randrange(len(SECRET_PATTERNS))
+    if kind == 0:
+        return '-'.join(''.join(rand.choice(string.digits) for _ in range(4)) for _ in range(3))
+    if kind == 1:
+        return 'AKIA' + ''.join(rand.choice(string.ascii_uppercase + string.digits)
+                                for _ in range(16))
+    return '{0}-{1}.example.com'.format(random_word(rand).lower(), rand.randint(1, 99))
+
+
+def random_word(rand):
+    return ''.join(rand.choice(string.ascii_letters) for _ in range(rand.randint(2, 9)))
+
+
+def load_font(font_path, size):
+    if font_path:
+        return ImageFont.truetype(font_path, size)
+    return ImageFont.load_default(size)
+
+
+def draw_text(image, xy, text, font_path, font_size, fake):
+    """
+    Draw text and get its rect.
+    """
+
+    if fake:
+        glyph_size = (round(font_size * 0.6), round(font_size * 1.25))
+        rects = draw_fake_text(image, xy, text, glyph_size, spacing=max(1, font_size // 8))
+        return rects[0][0], rects[-1][1]
+
+    font = load_font(font_path, font_size)
+    draw = ImageDraw.Draw(image)
+    draw.text(xy, text, fill=(0, 0, 0), font=font)
+    left, top, right, bottom = draw.textbbox(xy, text, font=font)
+    return (left, top), (right, bottom)
+
+
+def text_width(text, font_path, font_size, fake):
+    if fake:
+        return len(text) * (round(font_size * 0.6) + max(1, font_size // 8))
+    return load_font(font_path, font_size).getlength(text)
+
+
+def generate_screenshot(size, density, font_path, font_size, fake, rand, secrets_per_image=3):
+    """
+    Render a synthetic screenshot with secrets at known positions.
+
+    return: tuple (Image, list of tuple (secret, rect))
+    """
+
+    width, height = size
+    image = Image.new('RGB', size, (255, 255, 255))
+    line_height = round(font_size * 2)
+    margin = font_size
+    lines = list(range(margin, height - line_height, line_height))
+    text_lines = [y for y in lines if rand.random() < density] or lines[:1]
+    secret_lines = set(rand.sample(text_lines, min(secrets_per_image, len(text_lines))))
+    space = text_width(' ', font_path, font_size, fake)
+
+    secrets = []
+    for y in text_lines:
+        words = []
+        while True:
+            word = str(rand.randint(0, 9999)) if rand.random() < 0.1 else random_word(rand)
+            words.append(word)
+            if text_width(' '.join(words), font_path, font_size, fake) > width - margin * 2:
+                words.pop()
+                break
+
+        secret = None
+        if y in secret_lines:
+            secret = generate_secret(rand)
+            words.insert(rand.randrange(len(words) + 1), secret)
+            while (len(words) > 1 and
+                   text_width(' '.join(words), font_path, font_size, fake) > width - margin * 2):
+                words.remove(next(word for word in reversed(words) if word != secret))
+
+        x = margin
+        for word in words:
+            rect = draw_text(image, (int(x), y), word, font_path, font_size, fake)
+            if word == secret:
+                secrets.append((secret, rect))
+            x += text_width(word, font_path, font_size, fake) + space
+
+    return image, secrets
+
+
+def coverage(rect, found_rects):
+    """
+    Get the fraction of rect covered by found_rects.
+    """
+
+    (left, top), (right, bottom) = rect
+    mask = Image.new('1', (right - left, bottom - top), 0)
+    draw = ImageDraw.Draw(mask)
+    for (found_left, found_top), (found_right, found_bottom) in found_rects:
+        draw.rectangle(((found_left - left, found_top - top),
+                        (found_right - left, found_bottom - top)), fill=1)
+    area = mask.size[0] * mask.size[1]
+    return mask.histogram()[1] / area if area else 1.0
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def run_scenario(images, secret_matcher, backend, options, measure_recall=True):
+    """
+    Mask generated images and measure them.
+
+    return: dict of metrics, without 'recall' unless measure_recall
+    """
+
+    backend.elapsed = 0.0
+    latencies = {'ocr': [], 'match': [], 'mask': [], 'total': []}
+    recalled = 0
+    num_secrets = 0
+
+    for image, secrets in images:
+        image = image.copy()
+        ocr_before = backend.elapsed
+
+        begin = time.perf_counter()
+        rects = find_secret_rects(image, secret_matcher, ocr_backend=backend, **options)
+        found = time.perf_counter()
+        mask_rects(image, merge_rects(rects), (0, 0, 0))
+        end = time.perf_counter()
+
+        ocr = backend.elapsed - ocr_before
+        latencies['ocr'].append(ocr)
+        latencies['match'].append(max(0.0, found - begin - ocr))
+        latencies['mask'].append(end - found)
+        latencies['total'].append(end - begin)
+
+        num_secrets += len(secrets)
+        recalled += sum(1 for _, rect in secrets if coverage(rect, rects) >= MIN_COVERAGE)
+    elapsed = sum(latencies['total'])
+
+    result = {
+        'images': len(images),
+        'images_per_sec': len(images) / elapsed,
+        'latency_ms': {stage: {'mean': sum(values) / len(values) * 1000,
+                               'p95': percentile(values, 0.95) * 1000}
+                       for stage, values in latencies.items()},
+        'secrets': num_secrets,
+    }
+    if measure_recall:
+        result['recall'] = recalled / num_secrets if num_secrets else 1.0
+    return result
+
+
+def format_recall(result):
+    return '{0:.3f}'.format(result['recall']) if 'recall' in result else 'n/a'
+
+
+def peak_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux, and in bytes on macOS.
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compare results with a baseline.
+
+    return: list of regressions
+    raise: ValueError if the results and the baseline are of different OCR backends
+    """
+
+    if results['ocr_backend'] != baseline['ocr_backend']:
+        raise ValueError('Cannot compare results of the {0} backend with a baseline of the {1} '
+                         'backend'.format(results['ocr_backend'], baseline['ocr_backend']))
+
+    regressions = []
+    for name, result in sorted(results['scenarios'].items()):
+        base = baseline['scenarios'].get(name)
+        if not base:
+            continue
+        if 'recall' in result and 'recall' in base and result['recall'] < base['recall']:
+            regressions.append('{0}: recall {1:.3f} < {2:.3f}'.format(
+                name, result['recall'], base['recall']))
+        if result['images_per_sec'] < base['images_per_sec'] * (1 - tolerance):
+            regressions.append('{0}: {1:.2f} images/sec < {2:.2f} images/sec'.format(
+                name, result['images_per_sec'], base['images_per_sec']))
+
+    if results['peak_rss_mb'] > baseline['peak_rss_mb'] * (1 + tolerance):
+        regressions.append('peak RSS {0:.1f} MB > {1:.1f} MB'.format(
+            results['peak_rss_mb'], baseline['peak_rss_mb']))
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of speed and recall of masking.')
+    parser.add_argument('--ocr-backend', default='auto',
+                        help='OCR backend. fake renders text as fake glyphs to measure only '
+                             'the overhead, without recall')
+    parser.add_argument('--font', dest='fonts', action='append', default=None,
+                        help='TrueType font to render text with, can be repeated. '
+                             'Defaults to the font bundled with Pillow')
+    parser.add_argument('--size', dest='sizes', action='append', choices=sorted(SIZES),
+                        default=None, help='size of screenshots, can be repeated')
+    parser.add_argument('--images', type=int, default=5, help='number of images per scenario')
+    parser.add_argument('--lang', default='eng', help='language for OCR')
+    parser.add_argument('--tile-height', type=int, default=None)
+    parser.add_argument('--coarse-scale', type=float, default=None,
+                        help='use coarse-to-fine OCR with the scale')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save', metavar='JSON', help='save results as a baseline')
+    parser.add_argument('--compare', metavar='JSON', help='compare results with a baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed fraction of slowdown compared to the baseline')
+    args = parser.parse_args()
+
+    # The fake backend is not chosen by name in masecret itself.
+    backend = TimedBackend(get_backend(FakeBackend() if args.ocr_backend == 'fake'
+                                       else args.ocr_backend))
+    fake = backend.name == 'fake'
+    fonts = [None] if fake else (args.fonts or [None])
+    secret_matcher = SecretMatcher([re.compile(pattern) for pattern in SECRET_PATTERNS])
+    options = {
+        'lang': args.lang,
+        'tile_height': args.tile_height,
+        'coarse_scale': args.coarse_scale,
+    }
+
+    rand = random.Random(args.seed)
+    results = {'ocr_backend': backend.name, 'options': options, 'scenarios': {}}
+    for size_name in args.sizes or sorted(SIZES):
+        for density_name, density in sorted(DENSITIES.items()):
+            for font_path in fonts:
+                for font_size in FONT_SIZES:
+                    name = '{0}/{1}/{2}/{3}'.format(size_name, density_name,
+                                                    font_path or 'default', font_size)
+                    images = [generate_screenshot(SIZES[size_name], density, font_path,
+                                                  font_size, fake, rand)
+                              for _ in range(args.images)]
+                    result = run_scenario(images, secret_matcher, backend, options,
+                                          measure_recall=not fake)
+                    results['scenarios'][name] = result
+                    print('{0:40} {1:8.2f} images/sec  ocr {2:8.2f} ms  match {3:7.2f} ms  '
+                          'recall {4}'.format(name, result['images_per_sec'],
+                                              result['latency_ms']['ocr']['mean'],
+                                              result['latency_ms']['match']['mean'],
+                                              format_recall(result)))
+
+    scenarios = results['scenarios'].values()
+    total_images = sum(r['images'] for r in scenarios)
+    results['images_per_sec'] = total_images / sum(r['images'] / r['images_per_sec']
+                                                    for r in scenarios)
+    if not fake:
+        results['recall'] = (sum(r['recall'] * r['secrets'] for r in scenarios) /
+                             max(1, sum(r['secrets'] for r in scenarios)))
+    results['peak_rss_mb'] = peak_rss_mb()
+    print('total: {0:.2f} images/sec, recall {1}, peak RSS {2:.1f} MB'.format(
+        results['images_per_sec'], format_recall(results), results['peak_rss_mb']))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        try:
+            regressions = compare(results, baseline, args.tolerance)
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            return 2
+        for regression in regressions:
+            print('REGRESSION: {0}'.format(regression))
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,105 @@
+"""
+Benchmark of matching many secret regexes against OCR-ed content.
+
+Compares running finditer() of every regex one by one with SecretMatcher,
+and checks that both find the same spans.
+
+Usage:
+
+    $ python benchmarks/bench_matching.py [--patterns N] [--chars N]
+"""
+
+import re
+import sys
+import random
+import string
+import argparse
+import timeit
+
+sys.path.insert(0, '.')
+
+from masecret.matching import SecretMatcher  # noqa: E402
+
+
+def generate_secrets(num_patterns, rand):
+    """
+    Generate pairs of a secret regex and a string matching it, resembling SECRETS.txt.
+    """
+
+    def hostname():
+        name = random_word(rand)
+        return r'{0}-\d+\.example\.com'.format(name), '{0}-{1}.example.com'.format(name, rand.randint(1, 99))
+
+    def access_key():
+        prefix = 'AK' + ''.join(rand.choice(string.ascii_uppercase) for _ in range(4))
+        return prefix + r'[0-9A-Z]{14}', prefix + 'X' * 14
+
+    def api_key():
+        name = random_word(rand)
+        return r'(?i){0}[_-]?key'.format(name), name.upper() + '_KEY'
+
+    def literal():
+        word = random_word(rand) + random_word(rand)
+        return re.escape(word), word
+
+    def account_id():
+        return r'[-\d]{12,}', '1234-5678-9012'
+
+    makers = [hostname, access_key, api_key, literal, literal]
+    secrets = [account_id()] + [rand.choice(makers)() for _ in range(num_patterns - 1)]
+    return [(re.compile(pattern), example) for pattern, example in secrets]
+
+
+def generate_content(num_chars, examples, rand):
+    words = []
+    while sum(len(w) for w in words) < num_chars:
+        r = rand.random()
+        if r < 0.01:
+            words.append(rand.choice(examples))
+        elif r < 0.05:
+            words.append(str(rand.randint(0, 99999)))
+        else:
+            words.append(random_word(rand))
+    # OCR-ed content does not include spaces.
+    return ''.join(words)[:num_chars]
+
+
+def random_word(rand):
+    return ''.join(rand.choice(string.ascii_letters) for _ in range(rand.randint(2, 9)))
+
+
+def find_one_by_one(secret_res, content):
+    return [(index, m.start(), m.end())
+            for index, secret_re in enumerate(secret_res)
+            for m in secret_re.finditer(content) if m.start() != m.end()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of matching many secret regexes.')
+    parser.add_argument('--patterns', type=int, default=300, help='number of regexes')
+    parser.add_argument('--chars', type=int, default=20000, help='number of OCR-ed chars')
+    parser.add_argument('--repeat', type=int, default=5, help='number of repetition')
+    args = parser.parse_args()
+
+    rand = random.Random(0)
+    secrets = generate_secrets(args.patterns, rand)
+    secret_res = [secret_re for secret_re, _ in secrets]
+    content = generate_content(args.chars, [example for _, example in secrets], rand)
+    matcher = SecretMatcher(secret_res)
+
+    expected = find_one_by_one(secret_res, content)
+    actual = list(matcher.finditer(content))
+    assert actual == expected, 'SecretMatcher found different spans'
+
+    one_by_one = min(timeit.repeat(lambda: find_one_by_one(secret_res, content),
+                                   number=1, repeat=args.repeat))
+    combined = min(timeit.repeat(lambda: list(matcher.finditer(content)),
+                                 number=1, repeat=args.repeat))
+
+    print('{0} regexes, {1} chars, {2} matches'.format(len(secret_res), len(content), len(expected)))
+    print('one by one:    {0:8.2f} ms'.format(one_by_one * 1000))
+    print('SecretMatcher: {0:8.2f} ms ({1:.1f}x faster)'.format(combined * 1000, one_by_one / combined))
+
+
+if __name__ == '__main__':
+    main()
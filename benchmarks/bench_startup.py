@@ -0,0 +1,167 @@
+"""
+Benchmark of startup time of the masecret command.
+
+Each scenario runs the command in a fresh process and reports the minimum
+wall time of --repeat runs, along with the time to import masecret.cli
+measured by `python -X importtime`. A run of --help, --version or invalid
+arguments must not import the OCR stack (PIL and pyocr), which is checked
+as well.
+
+Results can be saved as a JSON baseline, and a later run can be compared with
+it to keep startup from regressing:
+
+    $ python benchmarks/bench_startup.py --save baseline.json
+    $ python benchmarks/bench_startup.py --compare baseline.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+# Arguments of the command which must be handled without the OCR stack.
+SCENARIOS = {
+    'help': ['--help'],
+    'version': ['--version'],
+    'invalid': ['--jobs', '0', '-i', 'missing.png'],
+}
+
+HEAVY_MODULES = ['PIL', 'pyocr']
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs masecret.cli as the command does, and reports heavy modules imported before exiting.
+_RUN_CLI = """
+import sys
+import atexit
+
+def report():
+    names = sorted({{name.split('.')[0] for name in sys.modules}} & set({0!r}))
+    sys.__stderr__.write('HEAVY_MODULES ' + ' '.join(names) + '\\n')
+
+atexit.register(report)
+sys.argv = ['masecret'] + {1!r}
+from masecret.cli import main
+sys.exit(main())
+"""
+
+
+def run_command(args):
+    """
+    Run masecret with args in a fresh process.
+
+    return: tuple (wall time in seconds, list of heavy modules imported)
+    """
+
+    code = _RUN_CLI.format(HEAVY_MODULES, args)
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT_DIR, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE, universal_newlines=True)
+    elapsed = time.perf_counter() - start
+
+    heavy_modules = []
+    for line in result.stderr.splitlines():
+        if line.startswith('HEAVY_MODULES'):
+            heavy_modules = line.split()[1:]
+    return elapsed, heavy_modules
+
+
+def python_startup():
+    """
+    Measure wall time of starting and exiting the interpreter without masecret.
+
+    return: time in seconds
+    """
+
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', 'pass'])
+    return time.perf_counter() - start
+
+
+def import_time(module):
+    """
+    Measure the cumulative time to import a module with `python -X importtime`.
+
+    return: time in seconds
+    """
+
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+                            cwd=ROOT_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                            universal_newlines=True)
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        _, cumulative, name = line.split('|')
+        if name.strip() == module:
+            return int(cumulative) / 1000000
+    raise RuntimeError('Failed to import {0}: {1}'.format(module, result.stderr))
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compare results with a baseline.
+
+    return: list of regressions
+    """
+
+    regressions = []
+    for name, result in sorted(results['scenarios'].items()):
+        base = baseline['scenarios'].get(name)
+        if base and result['wall_ms'] > base['wall_ms'] * (1 + tolerance):
+            regressions.append('{0}: {1:.1f} ms > {2:.1f} ms'.format(
+                name, result['wall_ms'], base['wall_ms']))
+
+    if results['import_ms'] > baseline['import_ms'] * (1 + tolerance):
+        regressions.append('import masecret.cli: {0:.1f} ms > {1:.1f} ms'.format(
+            results['import_ms'], baseline['import_ms']))
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of startup time of masecret.')
+    parser.add_argument('--repeat', type=int, default=10, help='number of runs per scenario')
+    parser.add_argument('--save', metavar='JSON', help='save results as a baseline')
+    parser.add_argument('--compare', metavar='JSON', help='compare results with a baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed fraction of slowdown compared to the baseline')
+    args = parser.parse_args()
+
+    python_ms = min(python_startup() for _ in range(args.repeat)) * 1000
+    print('{0:10} {1:8.1f} ms (bare interpreter, for reference)'.format('python', python_ms))
+
+    results = {'scenarios': {}}
+    errors = []
+    for name, command_args in sorted(SCENARIOS.items()):
+        runs = [run_command(command_args) for _ in range(args.repeat)]
+        heavy_modules = sorted({module for _, modules in runs for module in modules})
+        results['scenarios'][name] = {
+            'wall_ms': min(elapsed for elapsed, _ in runs) * 1000,
+            'heavy_modules': heavy_modules,
+        }
+        print('{0:10} {1:8.1f} ms  {2}'.format(name, results['scenarios'][name]['wall_ms'],
+                                              ' '.join(heavy_modules) or 'no OCR stack'))
+        if heavy_modules:
+            errors.append('{0}: imported {1}'.format(name, ', '.join(heavy_modules)))
+
+    results['import_ms'] = min(import_time('masecret.cli') for _ in range(args.repeat)) * 1000
+    ocr_import_ms = min(import_time('masecret.masking') for _ in range(args.repeat)) * 1000
+    print('import masecret.cli     {0:8.1f} ms'.format(results['import_ms']))
+    print('import masecret.masking {0:8.1f} ms (OCR stack, for reference)'.format(ocr_import_ms))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            errors.extend(compare(results, json.load(f), args.tolerance))
+
+    for error in errors:
+        print('REGRESSION: {0}'.format(error))
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,299 @@
+import io
+import re
+
+from PIL import Image, ImageColor
+
+from masecret.backends import get_backend
+from masecret.cache import OCRCache, DEFAULT_MAX_SIZE
+from masecret.literals import LiteralMatcher
+from masecret.frames import is_multi_frame, frame_save_params
+from masecret.masking import find_secrets, find_secrets_in_frames, mask_rects
+from masecret.matching import SecretMatcher
+from masecret.ocr import DEFAULT_TILE_OVERLAP
+from masecret.position_utils import merge_rects
+from masecret.templates import LayoutTemplates
+
+# Format of encoded images when the source image has no format, e.g. a new Image.
+DEFAULT_FORMAT = 'PNG'
+
+
+class Secret:
+    """
+    Secret information found in an image.
+    """
+
+    def __init__(self, text, pattern, rects, frame=0):
+        """
+        param: str text recognized by OCR
+        param: str pattern regex or literal which matched the text
+        param: list rects covering the text, one per line
+        param: int frame index of the frame of a multi-frame image the secret is in
+        """
+
+        self.text = text
+        self.pattern = pattern
+        self.rects = rects
+        self.frame = frame
+
+    def __repr__(self):
+        if self.frame:
+            return 'Secret({0!r}, {1!r}, {2!r}, frame={3!r})'.format(
+                self.text, self.pattern, self.rects, self.frame)
+        return 'Secret({0!r}, {1!r}, {2!r})'.format(self.text, self.pattern, self.rects)
+
+    def __eq__(self, other):
+        return (isinstance(other, Secret) and
+                (self.text, self.pattern, self.rects, self.frame) ==
+                (other.text, other.pattern, other.rects, other.frame))
+
+    def to_dict(self):
+        """
+        Convert into a dict which can be serialized into JSON.
+
+        rtype: dict
+        """
+
+        return {
+            'text': self.text,
+            'pattern': self.pattern,
+            'rects': [[list(top_left), list(bottom_right)] for top_left, bottom_right in self.rects],
+            'frame': self.frame,
+        }
+
+
+class MaskResult:
+    """
+    Masked image and secrets found in it.
+    """
+
+    def __init__(self, image, secrets, format=None, save_params=None):
+        """
+        param: Image image masked image, or its first frame if it has multiple frames
+        param: list secrets list of Secret
+        param: str format of the source image
+        param: dict save_params params of Image.save() to save all the frames
+        """
+
+        self.image = image
+        self.secrets = secrets
+        self.format = format or DEFAULT_FORMAT
+        self.save_params = save_params or {}
+
+    @property
+    def rects(self):
+        """
+        List of rects of all the secrets.
+        """
+
+        return [rect for secret in self.secrets for rect in secret.rects]
+
+    def to_bytes(self, format=None, **params):
+        """
+        Encode the masked image.
+
+        param: str format defaults to the format of the source image
+        param: params options of the encoder passed to Image.save()
+        return: encoded image
+        rtype: bytes
+        """
+
+        output = io.BytesIO()
+        self.image.save(output, format=format or self.format, **dict(self.save_params, **params))
+        return output.getvalue()
+
+
+class Masker:
+    """
+    Reusable masker of secret information in images in memory.
+
+    Secret regexes and literals are compiled and the OCR backend is loaded
+    once when a Masker is created, so each call only costs OCR and drawing.
+    Neither files are read or written (unless cache_dir is given) nor logs
+    are printed. A Masker can be shared by threads.
+
+    Images can be given as bytes, a binary file-like object or a PIL Image.
+    Every frame of a multi-frame image, e.g. an animated GIF, is masked.
+
+        masker = Masker([r'\\d{4}-\\d{4}-\\d{4}'])
+        masked_bytes, secrets = masker.mask_bytes(png_bytes)
+    """
+
+    def __init__(self, regexes=(), literals=(), fold_confusables=False, lang='eng',
+                 fill_color='#666', tesseract_configs=None, ocr_backend='auto', cache_dir=None,
+                 cache_size=DEFAULT_MAX_SIZE, tile_height=None, tile_overlap=DEFAULT_TILE_OVERLAP,
+                 tile_jobs=None, coarse_scale=None, text_height=None, lang_cascade=False,
+                 template_dir=None, template_full_pass=False):
+        """
+        param: list regexes list of str or compiled regexes matching secret information
+        param: list literals list of secret strings
+        param: bool fold_confusables whether literals match characters OCR confuses
+        param: str lang
+        param: str or tuple fill_color
+        param: list tesseract_configs or None to use the backend's default
+        param: str or OCRBackend ocr_backend
+        param: str cache_dir directory to cache OCR results in, or None not to cache
+        param: int cache_size in bytes
+        param: int tile_height or None not to split images into tiles
+        param: int tile_overlap
+        param: int tile_jobs number of tiles recognized in parallel
+        param: float coarse_scale scale of the first pass of coarse-to-fine OCR, or None
+        param: int text_height height of lines of text to downscale images to before OCR, or None
+        param: bool lang_cascade whether to recognize lines with all the languages of lang only
+               when the first one cannot read them
+        param: str template_dir directory to learn layouts of images in, or None not to learn
+        param: bool template_full_pass whether to recognize whole images even if they match a
+               learned layout
+        raise: ValueError if neither regexes nor literals are given
+        raise: OSError if the OCR backend cannot be loaded
+        raise: re.error if a regex is invalid
+        """
+
+        literals = [literal for literal in literals if literal]
+        if not regexes and not literals:
+            raise ValueError('Specify regexes or literals.')
+
+        self.secret_matcher = SecretMatcher([re.compile(regex) if isinstance(regex, str) else regex
+                                             for regex in regexes])
+        self.literal_matcher = LiteralMatcher(literals, fold_confusables) if literals else None
+        if isinstance(fill_color, str):
+            fill_color = ImageColor.getrgb(fill_color)
+        self.fill_color = tuple(fill_color)
+        self.ocr_cache = OCRCache(cache_dir, cache_size) if cache_dir else None
+        self.options = {
+            'lang': lang,
+            'tesseract_configs': tesseract_configs,
+            'ocr_cache': self.ocr_cache,
+            'literal_matcher': self.literal_matcher,
+            'tile_height': tile_height,
+            'tile_overlap': tile_overlap,
+            'tile_jobs': tile_jobs,
+            'ocr_backend': get_backend(ocr_backend),
+            'coarse_scale': coarse_scale,
+            'text_height': text_height,
+            'lang_cascade': lang_cascade,
+            'layout_templates': (LayoutTemplates(template_dir, template_full_pass)
+                                 if template_dir else None),
+        }
+
+    def find(self, source):
+        """
+        Find secret information in an image without masking it.
+
+        param: bytes, file-like object or Image source
+        return: list of Secret
+        rtype: list
+        """
+
+        image, _ = open_image(source)
+        if is_multi_frame(image):
+            return [secret for _, _, secrets in self._find_in_frames(image) for secret in secrets]
+        return self._find(image)
+
+    def mask(self, source, in_place=False):
+        """
+        Mask secret information in an image.
+
+        param: bytes, file-like object or Image source
+        param: bool in_place whether to draw on source itself when it is an Image.
+               Otherwise a copy is masked.
+        return: masked image and secrets
+        rtype: MaskResult
+        """
+
+        image, image_format = open_image(source)
+        if is_multi_frame(image):
+            # Frames are always masked in copies, as they are composed from the source.
+            return self._mask_frames(image, image_format)
+
+        if image is source and not in_place:
+            image = image.copy()
+
+        secrets = self._find(image)
+        mask_rects(image, merge_rects([rect for secret in secrets for rect in secret.rects]),
+                   self.fill_color)
+        return MaskResult(image, secrets, image_format)
+
+    def mask_bytes(self, source, format=None, **params):
+        """
+        Mask secret information in an image and encode the masked image.
+
+        When source is bytes and no secret is found, it is returned as it is
+        without encoding unless format is given.
+
+        param: bytes, file-like object or Image source
+        param: str format defaults to the format of the source image
+        param: params options of the encoder passed to Image.save()
+        return: tuple (encoded image, list of Secret)
+        rtype: tuple
+        """
+
+        result = self.mask(source)
+        if not result.secrets and not format and isinstance(source, (bytes, bytearray, memoryview)):
+            return bytes(source), result.secrets
+        return result.to_bytes(format, **params), result.secrets
+
+    def _mask_frames(self, image, image_format):
+        frames = []
+        durations = []
+        all_secrets = []
+        for frame, duration, secrets in self._find_in_frames(image):
+            masked = frame.copy()
+            mask_rects(masked, merge_rects([rect for secret in secrets for rect in secret.rects]),
+                       self.fill_color)
+            frames.append(masked)
+            durations.append(duration)
+            all_secrets.extend(secrets)
+
+        return MaskResult(frames[0], all_secrets, image_format,
+                          frame_save_params(image, frames, durations))
+
+    def _find(self, image):
+        try:
+            secrets = find_secrets(image, self.secret_matcher, **self.options)
+        finally:
+            if self.ocr_cache:
+                self.ocr_cache.clear_memory()
+
+        return [Secret(text, pattern, rects) for text, pattern, rects in secrets]
+
+    def _find_in_frames(self, image):
+        """
+        Find secrets in every frame of an image.
+
+        return: list of tuple (frame, duration, list of Secret)
+        rtype: list
+        """
+
+        try:
+            return [(frame, duration, [Secret(text, pattern, rects, index)
+                                       for text, pattern, rects in secrets])
+                    for index, (frame, duration, secrets) in enumerate(
+                        find_secrets_in_frames(image, self.secret_matcher, **self.options))]
+        finally:
+            if self.ocr_cache:
+                self.ocr_cache.clear_memory()
+
+
+def open_image(source):
+    """
+    Open an image from bytes, a binary file-like object or an Image.
+
+    param: bytes, file-like object or Image source
+    return: tuple (Image, format name or None)
+    rtype: tuple
+    raise: TypeError if source is of another type
+    raise: OSError if source cannot be decoded as an image
+    """
+
+    if isinstance(source, Image.Image):
+        return source, source.format
+
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    elif not hasattr(source, 'read'):
+        raise TypeError('Expected bytes, a file-like object or an Image, '
+                        'got {0}'.format(type(source).__name__))
+
+    image = Image.open(source)
+    image.load()
+    return image, image.format
@@ -0,0 +1,379 @@
+import io
+import ctypes
+import ctypes.util
+import locale
+import threading
+
+from PIL import ImageChops
+from pyocr.tesseract import image_to_string, TesseractError
+
+from masecret.builders import ModifiedCharBoxBuilder, CharBoxTable, read_box_file
+from masecret.defaults import BACKEND_NAMES  # noqa: F401
+from masecret.position_utils import projection_runs
+
+# Tesseract assumes 70 dpi for an image without resolution, as the command does for a bitmap.
+DEFAULT_DPI = 70
+
+# Tesseract's default OCR engine mode (OEM_DEFAULT).
+_OEM_DEFAULT = 3
+# Page segmentation mode used by the tesseract command when --psm is not given.
+_PSM_DEFAULT = 3
+
+_LIBTESSERACT_NAMES = [
+    'libtesseract.so.5',
+    'libtesseract.so.4',
+    'libtesseract.5.dylib',
+    'libtesseract.4.dylib',
+    'libtesseract-5.dll',
+    'libtesseract-4.dll',
+]
+
+# Backends are created once per process and shared by threads.
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+class OCRBackend:
+    """
+    Interface of OCR engines recognizing characters with their boxes.
+    """
+
+    #: Name of the backend, which is part of cache keys.
+    name = None
+
+    def default_configs(self):
+        """
+        Get tesseract configs used when none is given.
+
+        return: list of configs
+        rtype: list
+        """
+
+        return ModifiedCharBoxBuilder(0).tesseract_configs
+
+    def image_to_char_boxes(self, image, lang, tesseract_configs):
+        """
+        Recognize characters in an image.
+
+        param: Image image
+        param: str lang
+        param: list tesseract_configs
+        return: table of char boxes
+        rtype: CharBoxTable
+        """
+
+        raise NotImplementedError()
+
+
+class PyOCRBackend(OCRBackend):
+    """
+    Backend running the tesseract command through pyocr for each image.
+    """
+
+    name = 'pyocr'
+
+    def image_to_char_boxes(self, image, lang, tesseract_configs):
+        builder = ModifiedCharBoxBuilder(image.size[1])
+        builder.tesseract_configs = list(tesseract_configs)
+        return image_to_string(image, lang=lang, builder=builder)
+
+
+class LibTesseractBackend(OCRBackend):
+    """
+    Backend calling libtesseract in-process via ctypes.
+
+    Pixels of an image are passed to libtesseract directly, so neither temporary
+    files nor processes are needed. Loading a language model is slow, so
+    initialized TessBaseAPI handles are kept in a pool and reused. A handle is
+    used by one thread at a time, and as many handles as concurrent threads
+    are created at most.
+
+    tesseract_configs are interpreted as the tesseract command does:
+    --psm N (or -psm N) sets the page segmentation mode, --oem N sets the OCR
+    engine mode, -c NAME=VALUE sets a variable, and other words are names of
+    config files.
+    """
+
+    name = 'libtesseract'
+
+    def __init__(self, library=None):
+        """
+        param: str library path or name of libtesseract to load
+        raise: OSError if libtesseract cannot be loaded
+        """
+
+        self.lib = _load_libtesseract(library)
+        self._pool = {}
+        self._lock = threading.Lock()
+
+    def default_configs(self):
+        return ['--psm', '6', 'makebox']
+
+    def image_to_char_boxes(self, image, lang, tesseract_configs):
+        psm, oem, variables, config_names = _parse_tesseract_configs(tesseract_configs)
+        pool_key = (lang, oem, tuple(config_names), tuple(variables))
+
+        handle = self._acquire(pool_key)
+        try:
+            return self._recognize(handle, image, psm)
+        finally:
+            with self._lock:
+                self._pool[pool_key].append(handle)
+
+    def _acquire(self, pool_key):
+        """
+        Get an idle handle initialized for pool_key or create a new one.
+        """
+
+        with self._lock:
+            handles = self._pool.setdefault(pool_key, [])
+            if handles:
+                return handles.pop()
+
+        lang, oem, config_names, variables = pool_key
+        lib = self.lib
+        handle = lib.TessBaseAPICreate()
+
+        configs = (ctypes.c_char_p * len(config_names))(
+            *[name.encode('utf-8') for name in config_names])
+        # Tesseract's parser of config files depends on LC_NUMERIC.
+        locale.setlocale(locale.LC_NUMERIC, 'C')
+        status = lib.TessBaseAPIInit1(handle, None, lang.encode('utf-8'), oem,
+                                      configs, len(config_names))
+        if status:
+            lib.TessBaseAPIDelete(handle)
+            raise TesseractError(status, 'Failed to initialize libtesseract with '
+                                         'language {0!r}'.format(lang))
+
+        for name, value in variables:
+            if not lib.TessBaseAPISetVariable(handle, name.encode('utf-8'),
+                                              value.encode('utf-8')):
+                lib.TessBaseAPIDelete(handle)
+                raise TesseractError(-1, 'Unknown tesseract variable {0!r}'.format(name))
+
+        return handle
+
+    def _recognize(self, handle, image, psm):
+        lib = self.lib
+        if image.mode not in ('L', 'RGB'):
+            image = image.convert('RGB')
+        bytes_per_pixel = len(image.mode)
+        width, height = image.size
+
+        # A pooled handle keeps the mode of its last use, so it is always set.
+        lib.TessBaseAPISetPageSegMode(handle, psm)
+        lib.TessBaseAPISetImage(handle, image.tobytes(), width, height, bytes_per_pixel,
+                                width * bytes_per_pixel)
+        lib.TessBaseAPISetSourceResolution(handle, DEFAULT_DPI)
+
+        try:
+            status = lib.TessBaseAPIRecognize(handle, None)
+            if status:
+                raise TesseractError(status, 'Failed to recognize an image')
+
+            text = lib.TessBaseAPIGetBoxText(handle, 0)
+            if not text:
+                return CharBoxTable()
+            try:
+                box_text = ctypes.string_at(text).decode('utf-8', errors='replace')
+            finally:
+                lib.TessDeleteText(text)
+        finally:
+            lib.TessBaseAPIClear(handle)
+
+        return read_box_file(io.StringIO(box_text), [height], by_page=False)[0]
+
+
+class FakeBackend(OCRBackend):
+    """
+    Deterministic backend recognizing fake glyphs drawn by draw_fake_text().
+
+    A fake glyph is a filled rectangle whose color encodes a character, so the
+    backend "recognizes" exactly the text drawn into an image, even if the
+    image is cropped. It needs no OCR engine and is fast, which makes it
+    useful for tests and benchmarks. Images must be saved losslessly and
+    must not be resized.
+
+    It cannot be chosen by name, as it recognizes nothing in real images.
+    Pass an instance to get_backend() instead.
+    """
+
+    name = 'fake'
+
+    def default_configs(self):
+        return []
+
+    def image_to_char_boxes(self, image, lang, tesseract_configs):
+        image = image.convert('RGB')
+        # Every channel of a glyph color is less than 128, so its inversion is bright.
+        mask = ImageChops.invert(image).convert('L').point(lambda v: 255 if v >= 128 else 0)
+
+        tables = []
+        for top, bottom in projection_runs(mask.getprojection()[1]):
+            band = mask.crop((0, top, image.size[0], bottom))
+            chars = []
+            rects = []
+            for left, right in projection_runs(band.getprojection()[0]):
+                _, glyph_top, _, glyph_bottom = band.crop((left, 0, right, bottom - top)).getbbox()
+                center = ((left + right) // 2, top + (glyph_top + glyph_bottom) // 2)
+                chars.append(_decode_glyph_color(image.getpixel(center)))
+                rects.append((left, top + glyph_top, right, top + glyph_bottom))
+
+            tables.append(CharBoxTable(''.join(chars), [r[0] for r in rects],
+                                       [r[1] for r in rects], [r[2] for r in rects],
+                                       [r[3] for r in rects]))
+
+        return CharBoxTable.concat(tables)
+
+
+def draw_fake_text(image, xy, text, glyph_size=(10, 20), spacing=2):
+    """
+    Draw text as fake glyphs recognized by FakeBackend.
+
+    Spaces are not drawn, as tesseract does not report boxes of spaces.
+
+    param: Image image RGB image with white background
+    param: tuple xy left top position of text
+    param: str text
+    param: tuple glyph_size (width, height) of a glyph
+    param: int spacing between glyphs
+    return: list of rects of the glyphs
+    rtype: list
+    """
+
+    x, y = xy
+    width, height = glyph_size
+    rects = []
+    for c in text:
+        if c != ' ':
+            rect = ((x, y), (x + width, y + height))
+            image.paste(_encode_glyph_color(c), (x, y, x + width, y + height))
+            rects.append(rect)
+        x += width + spacing
+
+    return rects
+
+
+def _encode_glyph_color(c):
+    code = ord(c)
+    return (code >> 14) & 0x7f, (code >> 7) & 0x7f, code & 0x7f
+
+
+def _decode_glyph_color(color):
+    r, g, b = color
+    return chr((r << 14) | (g << 7) | b)
+
+
+def get_backend(backend=None):
+    """
+    Get an OCR backend shared in the process.
+
+    'auto' (or None) selects libtesseract if it can be loaded, otherwise pyocr.
+
+    param: str or OCRBackend backend name or backend itself
+    return: backend
+    rtype: OCRBackend
+    """
+
+    if isinstance(backend, OCRBackend):
+        return backend
+
+    name = backend or 'auto'
+    with _backends_lock:
+        if name not in _backends:
+            _backends[name] = _create_backend(name)
+        return _backends[name]
+
+
+def _create_backend(name):
+    if name == 'auto':
+        try:
+            return LibTesseractBackend()
+        except OSError:
+            return PyOCRBackend()
+    if name == 'libtesseract':
+        return LibTesseractBackend()
+    if name == 'pyocr':
+        return PyOCRBackend()
+    raise ValueError('Unknown OCR backend: {0}'.format(name))
+
+
+def _parse_tesseract_configs(tesseract_configs):
+    """
+    Parse tesseract configs into a page segmentation mode, an OCR engine mode,
+    variables and config names.
+
+    param: list tesseract_configs
+    return: tuple (psm, oem, list of tuple (name, value), list of config names)
+    rtype: tuple
+    """
+
+    psm = _PSM_DEFAULT
+    oem = _OEM_DEFAULT
+    variables = []
+    config_names = []
+    configs = iter(tesseract_configs)
+    for config in configs:
+        if config in ('--psm', '-psm'):
+            psm = int(next(configs))
+        elif config in ('--oem', '-oem'):
+            oem = int(next(configs))
+        elif config == '-c':
+            name, _, value = next(configs).partition('=')
+            variables.append((name, value))
+        elif config == 'makebox':
+            continue  # Boxes are always got from libtesseract.
+        else:
+            config_names.append(config)
+
+    return psm, oem, variables, config_names
+
+
+def _load_libtesseract(library=None):
+    """
+    Load libtesseract and declare types of the functions used.
+
+    param: str library path or name of libtesseract, or None to search it
+    return: loaded library
+    rtype: CDLL
+    raise: OSError if libtesseract cannot be loaded
+    """
+
+    names = [library] if library else [ctypes.util.find_library('tesseract')] + _LIBTESSERACT_NAMES
+    names = [name for name in names if name]
+    for name in names:
+        try:
+            lib = ctypes.CDLL(name)
+            break
+        except OSError:
+            continue
+    else:
+        raise OSError('libtesseract is not found (tried {0})'.format(', '.join(names)))
+
+    handle = ctypes.c_void_p
+    lib.TessBaseAPICreate.argtypes = []
+    lib.TessBaseAPICreate.restype = handle
+    lib.TessBaseAPIDelete.argtypes = [handle]
+    lib.TessBaseAPIDelete.restype = None
+    lib.TessBaseAPIInit1.argtypes = [handle, ctypes.c_char_p, ctypes.c_char_p, ctypes.c_int,
+                                     ctypes.POINTER(ctypes.c_char_p), ctypes.c_int]
+    lib.TessBaseAPIInit1.restype = ctypes.c_int
+    lib.TessBaseAPISetVariable.argtypes = [handle, ctypes.c_char_p, ctypes.c_char_p]
+    lib.TessBaseAPISetVariable.restype = ctypes.c_int
+    lib.TessBaseAPISetPageSegMode.argtypes = [handle, ctypes.c_int]
+    lib.TessBaseAPISetPageSegMode.restype = None
+    lib.TessBaseAPISetImage.argtypes = [handle, ctypes.c_char_p, ctypes.c_int, ctypes.c_int,
+                                        ctypes.c_int, ctypes.c_int]
+    lib.TessBaseAPISetImage.restype = None
+    lib.TessBaseAPISetSourceResolution.argtypes = [handle, ctypes.c_int]
+    lib.TessBaseAPISetSourceResolution.restype = None
+    lib.TessBaseAPIRecognize.argtypes = [handle, ctypes.c_void_p]
+    lib.TessBaseAPIRecognize.restype = ctypes.c_int
+    lib.TessBaseAPIGetBoxText.argtypes = [handle, ctypes.c_int]
+    lib.TessBaseAPIGetBoxText.restype = ctypes.c_void_p  # Freed by TessDeleteText
+    lib.TessBaseAPIClear.argtypes = [handle]
+    lib.TessBaseAPIClear.restype = None
+    lib.TessDeleteText.argtypes = [ctypes.c_void_p]
+    lib.TessDeleteText.restype = None
+
+    return lib
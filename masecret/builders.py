@@ -1,5 +1,124 @@
+import math
+from array import array
+
 from pyocr.tesseract import CharBoxBuilder, psm_parameter
-from pyocr.builders import Box
+
+
+class CharBoxTable:
+    """
+    Table of char boxes, each of which contains exactly one character.
+
+    Instead of a Box object per character, the table is stored in columns:
+    a content string and int arrays of coordinates. So content[i] is a
+    character in the rect ((lefts[i], tops[i]), (rights[i], bottoms[i])).
+
+    Slicing a table by a span of content returns a new table.
+    """
+
+    def __init__(self, content='', lefts=(), tops=(), rights=(), bottoms=()):
+        """
+        param: str content
+        param: iterable lefts
+        param: iterable tops
+        param: iterable rights
+        param: iterable bottoms
+        """
+
+        self.content = content
+        self.lefts = array('i', lefts)
+        self.tops = array('i', tops)
+        self.rights = array('i', rights)
+        self.bottoms = array('i', bottoms)
+
+        assert len(self.content) == len(self.lefts) == len(self.tops) \
+            == len(self.rights) == len(self.bottoms)
+
+    def __len__(self):
+        return len(self.content)
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            raise TypeError('CharBoxTable can only be sliced')
+
+        return CharBoxTable(self.content[key], self.lefts[key], self.tops[key],
+                            self.rights[key], self.bottoms[key])
+
+    def __iter__(self):
+        """
+        Yield pairs of a character and its rect.
+        """
+
+        return zip(self.content, self.rects())
+
+    def __eq__(self, other):
+        return isinstance(other, CharBoxTable) and self.content == other.content \
+            and self.lefts == other.lefts and self.tops == other.tops \
+            and self.rights == other.rights and self.bottoms == other.bottoms
+
+    def __repr__(self):
+        return 'CharBoxTable({0!r})'.format(self.content)
+
+    def rects(self):
+        """
+        Yield rects of characters.
+
+        return: generator of Rect
+        rtype: generator
+        """
+
+        for left, top, right, bottom in zip(self.lefts, self.tops, self.rights, self.bottoms):
+            yield ((left, top), (right, bottom))
+
+    def translated(self, offset):
+        """
+        Get a new table where all the rects are translated by offset.
+
+        param: Position offset
+        return: translated table
+        rtype: CharBoxTable
+        """
+
+        dx, dy = offset
+        return CharBoxTable(self.content,
+                            [x + dx for x in self.lefts], [y + dy for y in self.tops],
+                            [x + dx for x in self.rights], [y + dy for y in self.bottoms])
+
+    def scaled(self, factor):
+        """
+        Get a new table where all the rects are scaled by factor.
+
+        Rects are rounded outward, so that a scaled rect still covers its character.
+
+        param: float factor
+        return: scaled table
+        rtype: CharBoxTable
+        """
+
+        return CharBoxTable(self.content,
+                            [math.floor(x * factor) for x in self.lefts],
+                            [math.floor(y * factor) for y in self.tops],
+                            [math.ceil(x * factor) for x in self.rights],
+                            [math.ceil(y * factor) for y in self.bottoms])
+
+    @staticmethod
+    def concat(tables):
+        """
+        Get a new table where tables are concatenated in order.
+
+        param: iterable tables
+        return: concatenated table
+        rtype: CharBoxTable
+        """
+
+        result = CharBoxTable()
+        for table in tables:
+            result.content += table.content
+            result.lefts.extend(table.lefts)
+            result.tops.extend(table.tops)
+            result.rights.extend(table.rights)
+            result.bottoms.extend(table.bottoms)
+
+        return result
 
 
 class ModifiedCharBoxBuilder(CharBoxBuilder):
@@ -18,59 +137,69 @@ class ModifiedCharBoxBuilder(CharBoxBuilder):
         self.image_height = image_height
 
     def read_file(self, file_descriptor):
-        boxes = CharBoxBuilder.read_file(file_descriptor)
+        """
+        Read a box file into a CharBoxTable.
 
-        # Though CharBoxBuilder's base position (0, 0) is top left,
-        # box file's base position (0, 0) is bottom left.
-        # Therefore position must be reflected.
-        # See: https://github.com/tesseract-ocr/tesseract/wiki/TrainingTesseract
-        for box in boxes:
-            box.position = self._reflect_rect_vertically(box.position)
+        param: file file_descriptor
+        return: table of char boxes
+        rtype: CharBoxTable
+        """
 
-        def _ensure_one_char_per_box(boxes):
-            """
-            Occasionally, a Box contains two characters.
-            So, ensure that all the boxes contains only one characters.
-            """
+        return read_box_file(file_descriptor, [self.image_height], by_page=False)[0]
 
-            char_boxes = []
-            for box in boxes:
-                if len(box.content) == 1:
-                    char_boxes.append(box)
-                else:
-                    assert len(box.content) >= 2
-                    for c in box.content:
-                        char_boxes.append(Box(c, box.position))
+    def read_pages(self, file_descriptor, image_heights):
+        """
+        Read a box file of multiple images into a CharBoxTable per image.
 
-            return char_boxes
+        param: file file_descriptor
+        param: list image_heights height of each image (page)
+        return: list of tables of char boxes
+        rtype: list
+        """
 
-        return _ensure_one_char_per_box(boxes)
+        return read_box_file(file_descriptor, image_heights, by_page=True)
 
-    def _reflect_rect_vertically(self, rect):
-        """
-        Get a new Rect where rect is reflected vertically.
 
-        param: Rect rect
-        return: vertically reflected Rect
-        rtype: Rect
-        """
+def read_box_file(file_descriptor, image_heights, by_page):
+    """
+    Read a box file into CharBoxTables.
 
-        top_left, bottom_right = rect
-        bottom_left = self._reflect_pos_vertically(top_left)
-        top_right = self._reflect_pos_vertically(bottom_right)
+    param: file file_descriptor
+    param: list image_heights
+    param: bool by_page whether to split boxes by page number
+    return: list of tables of char boxes per page
+    rtype: list
+    """
 
-        left, bottom = bottom_left
-        right, top = top_right
+    # Columns of chars, lefts, bottoms, rights and tops in box file's coordinates per page.
+    pages = [([], array('i'), array('i'), array('i'), array('i')) for _ in image_heights]
 
-        return ((left, top), (right, bottom))
+    for line in file_descriptor:
+        # Each line is: <characters> <left> <bottom> <right> <top> <page>
+        elements = line.rstrip('\r\n').split(' ')
+        if len(elements) < 6 or not elements[0]:
+            continue
 
-    def _reflect_pos_vertically(self, pos):
-        """
-        Get a new Position where pos is reflected vertically.
+        chars, lefts, box_bottoms, rights, box_tops = pages[int(elements[5]) if by_page else 0]
+        left, bottom, right, top = (int(e) for e in elements[1:5])
 
-        param: Position pos
-        return: vertically reflected Position
-        rtype: Position
-        """
+        # Occasionally, a box contains two characters.
+        # So, ensure that all the boxes contains only one characters.
+        for c in elements[0]:
+            chars.append(c)
+            lefts.append(left)
+            box_bottoms.append(bottom)
+            rights.append(right)
+            box_tops.append(top)
+
+    tables = []
+    for (chars, lefts, box_bottoms, rights, box_tops), height in zip(pages, image_heights):
+        # Though CharBoxTable's base position (0, 0) is top left,
+        # box file's base position (0, 0) is bottom left.
+        # Therefore position must be reflected.
+        # See: https://github.com/tesseract-ocr/tesseract/wiki/TrainingTesseract
+        tops = array('i', [height - y for y in box_tops])
+        bottoms = array('i', [height - y for y in box_bottoms])
+        tables.append(CharBoxTable(''.join(chars), lefts, tops, rights, bottoms))
 
-        return pos[0], self.image_height - pos[1]
+    return tables
@@ -0,0 +1,226 @@
+import os
+import json
+import hashlib
+import tempfile
+
+# Bump this when the format of cached files or the result of OCR changes.
+CACHE_FORMAT_VERSION = 3
+
+DEFAULT_MAX_SIZE = 512 * 1024 * 1024
+
+
+def image_digest(image):
+    """
+    Get a hex digest of pixels of an image.
+
+    param: Image image
+    return: hex digest
+    rtype: str
+    """
+
+    h = hashlib.sha256()
+    h.update('{0} {1}x{2}\n'.format(image.mode, image.size[0], image.size[1]).encode('utf-8'))
+    h.update(image.tobytes())
+    return h.hexdigest()
+
+
+class OCRCache:
+    """
+    Content-addressed cache of CharBoxTables recognized by OCR, and of
+    decisions made from them, e.g. lines a language cascade recognizes again.
+
+    Results are always kept in memory until clear_memory() is called, so that
+    duplicate images in a batch are recognized only once. When directory is
+    given, results are also persisted to files in the directory, and the least
+    recently used files are evicted when the total size exceeds max_size.
+    """
+
+    def __init__(self, directory=None, max_size=DEFAULT_MAX_SIZE):
+        """
+        param: str directory
+        param: int max_size in bytes
+        """
+
+        self.directory = directory
+        self.max_size = max_size
+        self._memory = {}
+        self._total_size = None
+
+    def key(self, image, lang, tesseract_configs, backend_name='pyocr'):
+        """
+        Get a cache key of OCR result of an image.
+
+        param: Image image
+        param: str lang
+        param: list tesseract_configs
+        param: str backend_name name of OCR backend
+        return: cache key
+        rtype: str
+        """
+
+        h = hashlib.sha256()
+        h.update(json.dumps([CACHE_FORMAT_VERSION, image_digest(image), lang,
+                             list(tesseract_configs), backend_name]).encode('utf-8'))
+        return h.hexdigest()
+
+    def get(self, key):
+        """
+        Get a cached table of char boxes.
+
+        param: str key
+        return: CharBoxTable or None if not cached
+        rtype: CharBoxTable
+        """
+
+        if key in self._memory:
+            return self._memory[key]
+
+        columns = self._read(key)
+        if columns is None:
+            return None
+
+        # Imported here, as the command line parser uses this module without the OCR stack.
+        from masecret.builders import CharBoxTable
+        boxes = CharBoxTable(columns['content'], columns['lefts'], columns['tops'],
+                             columns['rights'], columns['bottoms'])
+        self._memory[key] = boxes
+        return boxes
+
+    def put(self, key, boxes):
+        """
+        Store a table of char boxes to the cache.
+
+        param: str key
+        param: CharBoxTable boxes
+        """
+
+        self._memory[key] = boxes
+
+        if not self.directory:
+            return
+
+        self._write(key, {
+            'content': boxes.content,
+            'lefts': boxes.lefts.tolist(),
+            'tops': boxes.tops.tolist(),
+            'rights': boxes.rights.tolist(),
+            'bottoms': boxes.bottoms.tolist(),
+        })
+
+    def get_decision(self, key):
+        """
+        Get a cached decision.
+
+        param: str key
+        return: decision or None if not cached
+        rtype: dict
+        """
+
+        if key in self._memory:
+            return self._memory[key]
+
+        decision = self._read(key)
+        if decision is not None:
+            self._memory[key] = decision
+        return decision
+
+    def put_decision(self, key, decision):
+        """
+        Store a decision, which must be serializable into JSON, to the cache.
+
+        param: str key
+        param: dict decision
+        """
+
+        self._memory[key] = decision
+
+        if self.directory:
+            self._write(key, decision)
+
+    def clear_memory(self):
+        """
+        Forget results kept in memory. Persisted results are not affected.
+        """
+
+        self._memory.clear()
+
+    def evict(self):
+        """
+        Remove least recently used files until the total size gets below 90% of max_size.
+        """
+
+        entries = sorted(self._entries())
+        total_size = sum(size for _, _, size in entries)
+        for _, path, size in entries:
+            if total_size <= self.max_size * 0.9:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue  # Another process may have removed it.
+            total_size -= size
+
+        self._total_size = total_size
+
+    def _read(self, key):
+        if not self.directory:
+            return None
+
+        path = self._path(key)
+        try:
+            with open(path, encoding='utf-8') as f:
+                value = json.load(f)
+            os.utime(path)  # Mark as recently used.
+        except (OSError, ValueError):
+            return None
+
+        return value
+
+    def _write(self, key, value):
+        data = json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file and rename it so that concurrent readers
+        # never see a partially written file.
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        try:
+            old_size = os.path.getsize(path)  # The key may be written again.
+        except OSError:
+            old_size = 0
+        os.replace(temp_path, path)
+
+        if self._total_size is None:
+            self._total_size = sum(size for _, _, size in self._entries())
+        else:
+            self._total_size += len(data) - old_size
+
+        if self._total_size > self.max_size:
+            self.evict()
+
+    def _entries(self):
+        """
+        Yield persisted files.
+
+        return: generator of tuple (mtime, path, size)
+        rtype: generator
+        """
+
+        if not os.path.isdir(self.directory):
+            return
+
+        for subdir in os.scandir(self.directory):
+            if not subdir.is_dir():
+                continue
+            for entry in os.scandir(subdir.path):
+                if not entry.name.endswith('.json'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                yield stat.st_mtime, entry.path, stat.st_size
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + '.json')
@@ -4,57 +4,319 @@ import re
 import argparse
 import shlex
 
-from PIL import Image, ImageDraw, ImageColor
-from pyocr.tesseract import image_to_string
-
 from masecret import __version__
-from masecret.builders import ModifiedCharBoxBuilder
-from masecret.position_utils import offset_rect, padding_box, bounding_boxes_by_line
+from masecret.cache import OCRCache, DEFAULT_MAX_SIZE
+from masecret.defaults import (BACKEND_NAMES, DEFAULT_TILE_OVERLAP, DEFAULT_COARSE_SCALE,
+                               DEFAULT_TEXT_HEIGHT)
+from masecret.journal import Journal, settings_digest, file_digest, parse_shard, select_shard
+from masecret.literals import LiteralMatcher, read_literals_from_file
+from masecret.matching import SecretMatcher
+from masecret.report import ReportWriter, Profiler
+
+# Number of images waiting in each queue between stages of --pipeline.
+DEFAULT_PIPELINE_DEPTH = 2
+
+
+def add_masking_arguments(parser):
+    """
+    Add options on how to mask secrets, which are shared with the watch command.
+
+    param: ArgumentParser parser
+    """
+
+    parser.add_argument('-r', '--regex', dest='regex', default=None,
+                        help='regular expression matches secret information')
+    parser.add_argument('-s', '--secret', dest='secret_path', default='./SECRETS.txt',
+                        help='path to file containing regexes line by line that match secret information')
+    parser.add_argument('--literals', dest='literals_path', metavar='FILE', default=None,
+                        help='path to file containing literal strings line by line that are secret information')
+    parser.add_argument('--fold-confusables', dest='fold_confusables', action='store_true', default=False,
+                        help='match literals even if OCR confuses characters such as O/0, l/1/I and S/5')
+    parser.add_argument('-l', '--lang', dest='lang', default='eng',
+                        help='language for OCR, can be multiple languages joined by + sign, e.g. eng+jpn')
+    parser.add_argument('--lang-cascade', dest='lang_cascade', action='store_true', default=False,
+                        help='recognize images with the first of multiple languages of -l first, '
+                             'and only lines it cannot read with all of them')
+    parser.add_argument('-c', '--color', dest='color', default='#666',
+                        help='color to fill secrets')
+    parser.add_argument('--tesseract-params', dest='tesseract_params', metavar='PARAMS',
+                        default=None,
+                        help='(Advanced Option) additional parameters passed to tesseract. '
+                             'Defaults to "--psm 6 makebox" ("-psm" for Tesseract 3)')
+    parser.add_argument('--ocr-backend', dest='ocr_backend', choices=BACKEND_NAMES, default='auto',
+                        help='OCR backend. auto uses libtesseract in-process if available, '
+                             'otherwise runs the tesseract command through pyocr')
+    parser.add_argument('--coarse-to-fine', dest='coarse_to_fine', action='store_true', default=False,
+                        help='find lines which could contain secrets in a downscaled image first, '
+                             'and recognize only the lines at full resolution')
+    parser.add_argument('--coarse-scale', dest='coarse_scale', metavar='SCALE', type=float,
+                        default=DEFAULT_COARSE_SCALE,
+                        help='scale of images in the first pass of --coarse-to-fine')
+    parser.add_argument('--adaptive-resolution', dest='adaptive_resolution', action='store_true',
+                        default=False,
+                        help='downscale images having large text, e.g. HiDPI screenshots, '
+                             'before OCR so that lines of text are about --text-height')
+    parser.add_argument('--text-height', dest='text_height', metavar='PX', type=int,
+                        default=DEFAULT_TEXT_HEIGHT,
+                        help='height of lines of text OCR is run at with --adaptive-resolution')
+    parser.add_argument('--tile-height', dest='tile_height', metavar='PX', type=int, default=None,
+                        help='split images taller than PX pixels into tiles recognized in parallel')
+    parser.add_argument('--tile-overlap', dest='tile_overlap', metavar='PX', type=int,
+                        default=DEFAULT_TILE_OVERLAP,
+                        help='overlap between tiles, which must be larger than the height of a line')
+    parser.add_argument('--cache-dir', dest='cache_dir', metavar='DIR', default=None,
+                        help='directory to cache OCR results in, which makes re-running with other regexes fast')
+    parser.add_argument('--cache-size', dest='cache_size', metavar='MB', type=int,
+                        default=DEFAULT_MAX_SIZE // (1024 * 1024),
+                        help='maximum size of the OCR cache in megabytes')
+    parser.add_argument('--template-dir', dest='template_dir', metavar='DIR', default=None,
+                        help='directory to learn layouts of images and rows where secrets are found '
+                             'in them in, so that only those rows are recognized in images '
+                             'matching a learned layout')
+    parser.add_argument('--template-full-pass', dest='template_full_pass', action='store_true',
+                        default=False,
+                        help='recognize whole images even if they match a learned layout, '
+                             'still learning from them')
+    parser.add_argument('--png-compress-level', dest='png_compress_level', metavar='LEVEL',
+                        type=int, choices=range(10), default=None,
+                        help='zlib compression level of PNG output from 0 (fastest, largest) '
+                             'to 9 (slowest, smallest). Defaults to 6')
+    parser.add_argument('--optimize', dest='optimize', action='store_true', default=False,
+                        help='make output images as small as possible at the cost of encoding time')
+    parser.add_argument('--link-unchanged', dest='link_unchanged', action='store_true',
+                        default=False,
+                        help='hard link outputs of images without secrets to the inputs '
+                             'instead of copying them')
 
 
 parser = argparse.ArgumentParser(
     usage='''
     %(prog)s [options] INPUT -o OUTPUT
     %(prog)s [options] INPUT... -o OUTPUT
-    %(prog)s -i [options] INPUT...''',
+    %(prog)s -i [options] INPUT...
+    %(prog)s watch [options] DIR -o OUTPUT_DIR
+    %(prog)s serve [options] (--port PORT | --unix PATH)
+    %(prog)s detect [options] INPUT... -m MANIFEST
+    %(prog)s apply [options] MANIFEST (-o OUTPUT_DIR | -i)
+    %(prog)s merge-journals JOURNAL... -o OUTPUT
+    %(prog)s tune [options] MANIFEST -o CONFIG''',
     description='''
         Mask secret information in image files using OCR.
         Put regular expression matches secret information
-        into a file named SECRETS.txt or -r option.''',
-    formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+        into a file named SECRETS.txt or -r option.
+        Options can be read from a file given as @FILE, e.g. written by masecret tune.''',
+    formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    fromfile_prefix_chars='@')
 parser.add_argument('input_paths', metavar='INPUT', nargs='+',
                     help='input files')
 parser.add_argument('-V', '--version', action='version',
                     version='%(prog)s {0}'.format(__version__))
 parser.add_argument('-o', '--output', dest='output_location', metavar='OUTPUT',
                     help='output file or directory')
-parser.add_argument('-r', '--regex', dest='regex', default=None,
-                    help='regular expression matches secret information')
-parser.add_argument('-s', '--secret', dest='secret_path', default='./SECRETS.txt',
-                    help='path to file containing regexes line by line that match secret information')
-parser.add_argument('-l', '--lang', dest='lang', default='eng',
-                    help='language for OCR, can be multiple languages joined by + sign, e.g. eng+jpn')
-parser.add_argument('-c', '--color', dest='color', default='#666',
-                    help='color to fill secrets')
+add_masking_arguments(parser)
 parser.add_argument('-i', '--in-place', dest='in_place', action='store_true', default=False,
                     help='mask image files in-place. WARNING: No backup files will be saved')
-parser.add_argument('--tesseract-params', dest='tesseract_params', metavar='PARAMS',
-                    default=' '.join(ModifiedCharBoxBuilder(0).tesseract_configs),
-                    help='(Advanced Option) additional parameters passed to tesseract')
+parser.add_argument('-b', '--batch-size', dest='batch_size', metavar='N', type=int, default=1,
+                    help='number of images recognized in a single run of tesseract')
+parser.add_argument('-j', '--jobs', dest='jobs', type=int, default=1,
+                    help='number of images to mask in parallel')
+parser.add_argument('--pipeline', dest='pipeline', action='store_true', default=False,
+                    help='decode, recognize and encode images in a pipeline of threads '
+                         'overlapping each other, with JOBS threads running OCR')
+parser.add_argument('--pipeline-depth', dest='pipeline_depth', metavar='N', type=int,
+                    default=DEFAULT_PIPELINE_DEPTH,
+                    help='number of images waiting between stages of --pipeline, '
+                         'which caps memory usage')
+parser.add_argument('--journal', dest='journal_path', metavar='FILE', default=None,
+                    help='record inputs masked into FILE as they are done, and skip inputs '
+                         'recorded in it with the same content and settings')
+parser.add_argument('--shard', dest='shard', metavar='K/N', type=parse_shard, default=None,
+                    help='process only the K-th of N shards of inputs split by their paths, '
+                         'e.g. to split an archive between nodes')
+parser.add_argument('--report', dest='report_path', metavar='FILE', default=None,
+                    help='write time of each stage and counts per image into FILE as JSON lines')
+parser.add_argument('--profile', dest='profile_path', metavar='FILE', default=None,
+                    help='profile masking with cProfile and dump stats into FILE '
+                         '(FILE.PID per worker with -j)')
 
 
 def main():
+    # Modules of subcommands import this module, so they are imported here.
+    if sys.argv[1:2] == ['watch']:
+        from masecret.watch import main as watch_main
+        return watch_main(sys.argv[2:])
+    if sys.argv[1:2] == ['serve']:
+        from masecret.server import main as serve_main
+        return serve_main(sys.argv[2:])
+    if sys.argv[1:2] == ['detect']:
+        from masecret.manifest import detect_main
+        return detect_main(sys.argv[2:])
+    if sys.argv[1:2] == ['apply']:
+        from masecret.manifest import apply_main
+        return apply_main(sys.argv[2:])
+    if sys.argv[1:2] == ['merge-journals']:
+        from masecret.journal import merge_main
+        return merge_main(sys.argv[2:])
+    if sys.argv[1:2] == ['tune']:
+        from masecret.tune import tune_main
+        return tune_main(sys.argv[2:])
+
     args = parse_args()
 
-    secret_res = get_secret_res(args)
-    options = {
+    # The OCR stack is imported only after arguments are parsed, so that
+    # --help, --version and errors of arguments do not wait for it.
+    from masecret.masking import mask_secrets_batch, mask_secrets_in_parallel
+
+    secret_res = SecretMatcher(get_secret_res(args))
+    try:
+        options = build_options(args, args.jobs)
+    except OSError as e:
+        print('Failed to load OCR backend: {0}'.format(e), file=sys.stderr)
+        return 1
+
+    report = bool(args.report_path)
+    pairs = input_output_pairs(args)
+    if args.shard:
+        pairs = select_shard(pairs, *args.shard)
+    journal = None
+    if args.journal_path:
+        journal = Journal(args.journal_path, settings_digest(secret_res, options))
+        pairs = journal.pending(pairs)
+
+    if args.pipeline:
+        from masecret.pipeline import mask_secrets_pipelined
+        # Images are decoded as the pipeline proceeds, rather than listed and sorted beforehand.
+        results = mask_secrets_pipelined(pairs, secret_res, options, args.jobs,
+                                         args.pipeline_depth, report)
+    else:
+        groups = group_duplicates(largest_first(list(pairs)), journal.digest if journal else None)
+        batches = make_batches(groups, args.batch_size)
+        if args.jobs > 1:
+            results = mask_secrets_in_parallel(batches, secret_res, options, args.jobs, report,
+                                               args.profile_path)
+        else:
+            profiler = Profiler(args.profile_path) if args.profile_path else None
+            results = (result for batch in batches
+                       for result in mask_secrets_batch(batch, secret_res, options,
+                                                        report=report, profiler=profiler))
+
+    report_writer = ReportWriter(args.report_path) if report else None
+    num_processed = 0
+    failed_paths = []
+    try:
+        for input_path, log, error, record in results:
+            num_processed += 1
+            sys.stderr.write(log)
+            if error:
+                print('Failed to process {0}: {1}'.format(input_path, error), file=sys.stderr)
+                failed_paths.append(input_path)
+            if report_writer:
+                report_writer.write(dict(record, input=input_path, error=error))
+            if journal:
+                journal.record(input_path, error)
+    finally:
+        if report_writer:
+            report_writer.close()
+        if journal:
+            journal.close()
+
+    if journal and journal.num_skipped:
+        print('Skipped {0} files already done according to {1}'.format(journal.num_skipped,
+                                                                         args.journal_path),
+              file=sys.stderr)
+
+    if failed_paths:
+        print('Failed to process {0} of {1} files'.format(len(failed_paths), num_processed),
+              file=sys.stderr)
+        return 1
+
+    return 0
+
+
+def build_options(args, jobs):
+    """
+    Build keyword arguments of mask_secrets() from a Namespace object.
+
+    param: Namespace args
+    param: int jobs number of images masked in parallel
+    return: options
+    rtype: dict
+    raise: OSError if the OCR backend cannot be loaded
+    """
+
+    from PIL import ImageColor
+
+    from masecret.backends import get_backend
+    from masecret.templates import LayoutTemplates
+
+    return {
         'lang': args.lang,
         'fill_color': ImageColor.getrgb(args.color),
-        'tesseract_configs': shlex.split(args.tesseract_params),
+        'tesseract_configs': get_tesseract_configs(args),
+        # Pass the name to worker processes, which load the backend by themselves.
+        'ocr_backend': get_backend(args.ocr_backend).name,
+        'ocr_cache': OCRCache(args.cache_dir, args.cache_size * 1024 * 1024),
+        'literal_matcher': get_literal_matcher(args),
+        'tile_height': args.tile_height,
+        'tile_overlap': args.tile_overlap,
+        'coarse_scale': args.coarse_scale if args.coarse_to_fine else None,
+        'text_height': args.text_height if args.adaptive_resolution else None,
+        'lang_cascade': args.lang_cascade,
+        'layout_templates': (LayoutTemplates(args.template_dir, args.template_full_pass)
+                             if args.template_dir else None),
+        # Share CPUs between images masked in parallel.
+        'tile_jobs': max(1, (os.cpu_count() or 1) // jobs),
+        'save_options': get_save_options(args),
+        'link_unchanged': args.link_unchanged,
     }
 
-    for input_path, output_path in input_output_pairs(args):
-        mask_secrets(input_path, output_path, secret_res, **options)
+
+def get_tesseract_configs(args):
+    """
+    Get parameters passed to tesseract from a Namespace object.
+
+    The default is left to the OCR backend, as it depends on the backend and
+    the version of tesseract, which is checked only when the backend needs it.
+
+    param: Namespace args
+    return: list of parameters, or None to use the default of the OCR backend
+    rtype: list
+    """
+
+    if args.tesseract_params is None:
+        return None
+
+    return shlex.split(args.tesseract_params)
+
+
+def get_save_options(args):
+    """
+    Get options of encoders passed to Image.save() from a Namespace object.
+
+    param: Namespace args
+    return: options
+    rtype: dict
+    """
+
+    options = {}
+    if args.png_compress_level is not None:
+        options['compress_level'] = args.png_compress_level
+    if args.optimize:
+        options['optimize'] = True
+    return options
+
+
+def image_options(options):
+    """
+    Get options of mask_image() from options of mask_secrets(), dropping ones on files.
+
+    param: dict options
+    return: options
+    rtype: dict
+    """
+
+    return {name: value for name, value in options.items()
+            if name not in ('save_options', 'link_unchanged')}
 
 
 def parse_args(args=None):
@@ -78,10 +340,50 @@ def parse_args(args=None):
         if len(args.input_paths) >= 2 and not os.path.isdir(args.output_location):
             parser.error('OUTPUT must be a directory when there are multiple INPUTs.')
 
+    if args.jobs < 1:
+        parser.error('JOBS must be a positive integer.')
+
+    if args.batch_size < 1:
+        parser.error('Batch size must be a positive integer.')
+
+    if args.pipeline:
+        if args.pipeline_depth < 1:
+            parser.error('Pipeline depth must be a positive integer.')
+        if args.batch_size > 1:
+            parser.error('You MUST NOT specify both --pipeline and -b options.')
+        if args.profile_path:
+            parser.error('You MUST NOT specify both --pipeline and --profile options.')
+
+    check_masking_args(parser, args)
+
+    return args
+
+
+def check_masking_args(parser, args):
+    """
+    Check arguments added by add_masking_arguments().
+
+    param: ArgumentParser parser
+    param: Namespace args
+    """
+
     if args.regex and args.secret_path != './SECRETS.txt':
         parser.error('You MUST NOT specify both -r and -s options.')
 
-    return args
+    if not 0 < args.coarse_scale <= 1:
+        parser.error('Coarse scale must be greater than 0 and at most 1.')
+
+    if args.tile_height is not None and not 0 <= args.tile_overlap < args.tile_height:
+        parser.error('Tile overlap must be smaller than tile height.')
+
+    if args.text_height < 1:
+        parser.error('Text height must be a positive integer.')
+
+    if args.template_full_pass and not args.template_dir:
+        parser.error('You MUST specify --template-dir option with --template-full-pass.')
+
+    if args.fold_confusables and not args.literals_path:
+        parser.error('You MUST specify --literals option with --fold-confusables.')
 
 
 def get_secret_res(args):
@@ -95,10 +397,28 @@ def get_secret_res(args):
 
     if args.regex:
         return [re.compile(args.regex)]
+    elif args.literals_path and args.secret_path == './SECRETS.txt' \
+            and not os.path.exists(args.secret_path):
+        return []  # Only literals are used.
     else:
         return read_secret_res_from_file(args.secret_path)
 
 
+def get_literal_matcher(args):
+    """
+    Get a matcher of secret literals from a Namespace object.
+
+    param: Namespace args
+    return: LiteralMatcher or None if no literals file is specified
+    rtype: LiteralMatcher
+    """
+
+    if not args.literals_path:
+        return None
+
+    return LiteralMatcher(read_literals_from_file(args.literals_path), args.fold_confusables)
+
+
 def read_secret_res_from_file(secret_path):
     """
     Read secret regexes from a file secret_path.
@@ -135,100 +455,113 @@ def input_output_pairs(args):
             yield (input_path, args.output_location)
 
 
-def mask_secrets(input_path, output_path, secret_res, lang, fill_color, tesseract_configs=None):
+def largest_first(pairs):
     """
-    Mask secret infomation in an image.
+    Sort pairs of input path and output path so that the largest input comes first.
 
-    param: str input_path
-    param: str output_path
-    param: list secret_res
-    param: str lang
-    param: str tesseract_configs
-    param: tuple fill_color
-    """
+    Scheduling large images first keeps a worker pool from waiting on a single
+    large image at the end of a batch.
 
-    print('Processing {0}...'.format(input_path), file=sys.stderr)
+    param: list pairs
+    return: sorted list of tuple (input_path, output_path)
+    rtype: list
+    """
 
-    image = Image.open(input_path)
-    secret_rects = find_secret_rects(image, secret_res, lang, tesseract_configs)
-    print('Found {0} secrets at {1}'.format(len(secret_rects), secret_rects), file=sys.stderr)
-    for rect in secret_rects:
-        mask_rect(image, rect, fill_color)
+    def input_size(pair):
+        try:
+            return os.path.getsize(pair[0])
+        except OSError:
+            return 0  # The error will be reported when the input is processed.
 
-    image.save(output_path)
-    print('Saved to {0}'.format(output_path), file=sys.stderr)
+    return sorted(pairs, key=input_size, reverse=True)
 
 
-def find_secret_rects(image, secret_res, lang, tesseract_configs=None):
+def group_duplicates(pairs, known_digest=None):
     """
-    Find secret rects in an image.
+    Group pairs of input path and output path whose input files have the same content.
+
+    Images in a group are processed in a row, so that OCR results of the first
+    image can be reused for the others. Only inputs of the same size as
+    another input can be duplicates, so the others are not read at all.
 
-    param: Image image
-    param: list secret_res
-    param: str lang
-    param: str tesseract_configs
-    return: list of rects
+    param: list pairs
+    param: function known_digest returning a hex digest of an input file already
+           computed, e.g. Journal.digest(), or None to compute it
+    return: list of groups, each of which is a list of tuple (input_path, output_path)
     rtype: list
     """
 
-    # When using pyocr, an input image is converted to RGB (not RGBA).
-    # During the conversion, transparent pixels are converted into BLACK.
-    # Sometimes the black pixels get in the way of recognizing text.
-    #
-    # For example, macOS's screenshot image taken by Command+Shift+4+Space
-    # has transparent pixels around an window. This results in a black and
-    # thick border in the edge of image. The border worsen quality of OCR
-    # of text near by the border. To avoid this, convert transparent pixels
-    # into WHITE by pasting image into an white background.
-    #
-    # See: http://stackoverflow.com/questions/9166400/convert-rgba-png-to-rgb-with-pil
-    if image.mode == 'RGBA':
-        background = Image.new('RGB', image.size, (255, 255, 255))
-        background.paste(image, mask=image.split()[3])  # Paste image masked by alpha channel [3]
-        image = background
+    def input_size(pair):
+        try:
+            return os.path.getsize(pair[0])
+        except OSError:
+            return None  # The error will be reported when the input is processed.
 
-    # offset = (0, 150)
-    # cropped_image = image.crop((offset[0], offset[1], image.size[0], 220))
-    offset = (0, 0)
-    cropped_image = image
+    sizes = [input_size(pair) for pair in pairs]
+    num_sizes = {}
+    for size in sizes:
+        num_sizes[size] = num_sizes.get(size, 0) + 1
 
-    builder = ModifiedCharBoxBuilder(cropped_image.size[1])
-    if tesseract_configs:
-        builder.tesseract_configs = tesseract_configs
+    groups = {}
+    for pair, size in zip(pairs, sizes):
+        key = pair
+        if size is not None and num_sizes[size] > 1:
+            try:
+                key = (known_digest and known_digest(pair[0])) or file_digest(pair[0])
+            except OSError:
+                pass
+        groups.setdefault(key, []).append(pair)
 
-    boxes = image_to_string(cropped_image, lang=lang, builder=builder)
+    # dict preserves insertion order, so the order of the first pairs is kept.
+    return list(groups.values())
 
-    if os.environ.get('DEBUG'):
-        for box in boxes:
-            print(box.content, box.position)
 
-    content = ''.join(box.content for box in boxes)
-    assert len(boxes) == len(content)
+def make_batches(groups, batch_size):
+    """
+    Make batches of pairs of input path and output path, each of which
+    contains batch_size groups of duplicate inputs at most.
 
-    secret_rects = []
-    for secret_re in secret_res:
-        for m in secret_re.finditer(content):
-            matched_boxes = boxes[m.start():m.end()]
-            matched_rects = [b.position for b in matched_boxes]
-            for rect in bounding_boxes_by_line(matched_rects):
-                rect = offset_rect(offset, padding_box(rect, 2))
-                secret_rects.append(rect)
+    param: list groups
+    param: int batch_size
+    return: list of batches, each of which is a list of tuple (input_path, output_path)
+    rtype: list
+    """
 
-    return secret_rects
+    return [[pair for group in groups[i:i + batch_size] for pair in group]
+            for i in range(0, len(groups), batch_size)]
 
 
-def mask_rect(image, rect, color):
+def _forward_to_masking(name):
     """
-    Fill a rect in an image.
-
-    param: Image image
-    param: Rect rect
-    param: tuple color
+    Make a function calling a function of masecret.masking, which imports the
+    OCR stack on first call.
     """
 
-    draw = ImageDraw.Draw(image)
-    draw.rectangle(rect, fill=color)
+    def forward(*args, **kwargs):
+        import masecret.masking
+        return getattr(masecret.masking, name)(*args, **kwargs)
+
+    forward.__name__ = forward.__qualname__ = name
+    forward.__doc__ = 'Call masecret.masking.{0}().'.format(name)
+    return forward
+
+
+# Functions masking images were defined in this module before they were moved
+# to masecret.masking, and are still importable from here. They are forwarded
+# rather than imported, which would load the OCR stack for --help.
+mask_secrets_safely = _forward_to_masking('mask_secrets_safely')
+mask_secrets_batch = _forward_to_masking('mask_secrets_batch')
+mask_secrets_in_parallel = _forward_to_masking('mask_secrets_in_parallel')
+mask_secrets = _forward_to_masking('mask_secrets')
+open_image_file = _forward_to_masking('open_image_file')
+save_masked_image = _forward_to_masking('save_masked_image')
+mask_image = _forward_to_masking('mask_image')
+mask_image_frames = _forward_to_masking('mask_image_frames')
+find_secret_rects = _forward_to_masking('find_secret_rects')
+find_secrets = _forward_to_masking('find_secrets')
+mask_rect = _forward_to_masking('mask_rect')
+mask_rects = _forward_to_masking('mask_rects')
 
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
@@ -0,0 +1,17 @@
+# Default values of options shared by the command line parser and the OCR
+# stack. This module must not import PIL or pyocr, so that the parser is
+# built, e.g. for --help, without loading them.
+
+# Names of OCR backends which can be chosen.
+BACKEND_NAMES = ['auto', 'libtesseract', 'pyocr']
+
+# Overlap must be larger than the height of a line of text,
+# so that every line fits in at least one tile.
+DEFAULT_TILE_OVERLAP = 100
+
+# Scale of an image in the rough pass of coarse-to-fine OCR.
+DEFAULT_COARSE_SCALE = 0.5
+
+# Height of lines of text tesseract recognizes well enough. Images having
+# larger text, e.g. HiDPI screenshots, are downscaled to it by adaptive resolution.
+DEFAULT_TEXT_HEIGHT = 24
@@ -0,0 +1,135 @@
+import os
+import shutil
+import binascii
+from contextlib import contextmanager
+
+from PIL import Image
+
+# Number of names tried to create a temporary file.
+_TEMP_ATTEMPTS = 100
+
+
+def save_image_atomically(image, path, **params):
+    """
+    Save an image to a temporary file and rename it to path.
+
+    Readers never see a partially written file, and an existing file is
+    replaced only when the image is completely written, so that files
+    masked in-place are not broken by a crash or by parallel runs.
+
+    param: Image image
+    param: str path
+    param: params options of the encoder passed to Image.save(), which may
+           include save_all and append_images to save multiple frames
+    """
+
+    image_format = image_format_of(path)
+    if params.get('save_all') and image_format not in Image.SAVE_ALL:
+        # Only the first frame is saved in a format which cannot have multiple frames, e.g. JPEG.
+        params = {name: value for name, value in params.items()
+                  if name not in ('save_all', 'append_images')}
+
+    # Keep the extension, from which the format is determined.
+    with _temporary_file(path) as temp_path:
+        image.save(temp_path, format=image_format, **params)
+
+
+def copy_file_atomically(source_path, path, link=False):
+    """
+    Copy a file byte-for-byte to a temporary file and rename it to path.
+
+    param: str source_path
+    param: str path
+    param: bool link whether to make a hard link instead of copying if possible
+    """
+
+    if link:
+        try:
+            with _temporary_file(path, set_mode=False) as temp_path:
+                os.remove(temp_path)
+                os.link(source_path, temp_path)
+            return
+        except OSError:
+            pass  # e.g. across file systems
+
+    with _temporary_file(path) as temp_path:
+        shutil.copyfile(source_path, temp_path)
+
+
+def image_format_of(path):
+    """
+    Get the image format Pillow saves a file in from the extension of path.
+
+    param: str path
+    return: format name such as 'PNG', or None if the extension is unknown
+    rtype: str
+    """
+
+    return Image.registered_extensions().get(os.path.splitext(path)[1].lower())
+
+
+def is_same_file(path1, path2):
+    """
+    Whether two paths point to the same existing file.
+
+    param: str path1
+    param: str path2
+    rtype: bool
+    """
+
+    try:
+        return os.path.samefile(path1, path2)
+    except OSError:
+        return False
+
+
+@contextmanager
+def _temporary_file(path, set_mode=True):
+    """
+    Create a temporary file next to path, which is renamed to path on
+    success and removed on failure.
+
+    param: str path
+    param: bool set_mode whether to give the file the permissions of the
+           replaced file or the default ones, which must not be done to a hard link
+    """
+
+    temp_path = _create_temporary_file(path)
+    try:
+        yield temp_path
+        if set_mode and os.path.exists(path):
+            shutil.copymode(path, temp_path)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _create_temporary_file(path):
+    """
+    Create an empty file with a unique name next to path.
+
+    Unlike tempfile.mkstemp(), which creates a private file, the file gets
+    the default permissions of new files, i.e. 0o666 masked by umask.
+
+    param: str path
+    return: path of the created file
+    rtype: str
+    """
+
+    directory = os.path.dirname(os.path.abspath(path))
+    name, extension = os.path.splitext(os.path.basename(path))
+    for _ in range(_TEMP_ATTEMPTS):
+        temp_path = os.path.join(directory, '.{0}.{1}{2}'.format(
+            name, binascii.hexlify(os.urandom(4)).decode('ascii'), extension))
+        try:
+            fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+        except FileExistsError:
+            continue
+        os.close(fd)
+        return temp_path
+
+    raise FileExistsError('No usable temporary file name found in {0}'.format(directory))
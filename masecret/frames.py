@@ -0,0 +1,71 @@
+from PIL import ImageChops, ImageSequence
+
+# Difference of a pixel between frames to be regarded as changed, which
+# ignores noise of dithering and lossy compression.
+FRAME_DIFF_THRESHOLD = 16
+
+
+def is_multi_frame(image):
+    """
+    Whether an image has multiple frames, e.g. an animated GIF or a multi-page TIFF.
+
+    param: Image image
+    rtype: bool
+    """
+
+    return getattr(image, 'n_frames', 1) > 1
+
+
+def iter_frames(image):
+    """
+    Iterate frames of an image as independent images.
+
+    Each frame is composed as it is displayed and converted into RGB, or
+    RGBA if it has transparency, so frames can be compared and drawn on.
+
+    param: Image image
+    return: generator of tuple (frame, duration in milliseconds or None)
+    rtype: generator
+    """
+
+    for frame in ImageSequence.Iterator(image):
+        has_alpha = frame.mode in ('RGBA', 'LA', 'PA') or 'transparency' in frame.info
+        yield frame.convert('RGBA' if has_alpha else 'RGB'), frame.info.get('duration')
+
+
+def changed_rows(previous, frame, threshold=FRAME_DIFF_THRESHOLD):
+    """
+    Get the rows of a frame changed from the previous frame.
+
+    param: Image previous
+    param: Image frame of the same size and mode as previous
+    param: int threshold difference of a pixel to be regarded as changed
+    return: tuple (top, bottom) of the changed rows, or None if nothing is changed
+    rtype: tuple
+    """
+
+    diff = ImageChops.difference(previous, frame).convert('L') \
+        .point(lambda v: 255 if v > threshold else 0)
+    bbox = diff.getbbox()
+    if bbox is None:
+        return None
+    return bbox[1], bbox[3]
+
+
+def frame_save_params(image, frames, durations):
+    """
+    Get parameters of Image.save() to save frames as an image like image.
+
+    param: Image image source image having the frames
+    param: list frames masked frames, the first of which is saved
+    param: list durations of the frames
+    return: params
+    rtype: dict
+    """
+
+    params = {'save_all': True, 'append_images': frames[1:]}
+    if all(duration is not None for duration in durations):
+        params['duration'] = durations
+    if 'loop' in image.info:
+        params['loop'] = image.info['loop']
+    return params
@@ -0,0 +1,308 @@
+import os
+import sys
+import json
+import hashlib
+import argparse
+import tempfile
+import threading
+
+# Bump this when the format of journal entries changes incompatibly.
+JOURNAL_VERSION = 1
+
+# Options of mask_secrets() which change masked images.
+_SETTINGS_OPTIONS = ['lang', 'lang_cascade', 'fill_color', 'tesseract_configs', 'ocr_backend',
+                     'tile_height', 'tile_overlap', 'coarse_scale', 'text_height', 'save_options']
+
+
+merge_parser = argparse.ArgumentParser(
+    prog='masecret merge-journals',
+    usage='%(prog)s JOURNAL... -o OUTPUT',
+    description='''
+        Merge journals written by masecret --journal, e.g. on nodes running
+        different --shard of an archive, into a single journal.''',
+    formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+merge_parser.add_argument('journal_paths', metavar='JOURNAL', nargs='+',
+                          help='journals to merge')
+merge_parser.add_argument('-o', '--output', dest='output_path', metavar='OUTPUT', required=True,
+                          help='journal to write, which can be one of JOURNALs')
+
+
+def merge_main(argv=None):
+    args = merge_parser.parse_args(argv)
+
+    entries = {}
+    for journal_path in args.journal_paths:
+        try:
+            merge_entries(entries, read_journal(journal_path))
+        except OSError as e:
+            print('Failed to read journal: {0}'.format(e), file=sys.stderr)
+            return 1
+
+    write_journal(args.output_path, entries)
+    print('Merged {0} entries into {1}'.format(len(entries), args.output_path), file=sys.stderr)
+    return 0
+
+
+class Journal:
+    """
+    Append-only record of inputs masked by a batch run, which lets a re-run
+    skip inputs already masked with the same settings.
+
+    An entry per line has the input path, sha256 digests of the input before
+    masking and of the output, a digest of the settings and the error, and is
+    flushed as soon as the input is done, so that progress survives a crash.
+    An input is done when it has a successful entry of the same settings and
+    output path, the output exists, and the input has the digest of the input
+    or the output in the entry (the latter when masked in-place).
+    """
+
+    def __init__(self, path, settings):
+        """
+        param: str path of the journal, which is appended to
+        param: str settings digest of settings returned by settings_digest()
+        """
+
+        self.path = path
+        self.settings = settings
+        self.entries = read_journal(path) if os.path.exists(path) else {}
+        self.num_skipped = 0
+        self._digests = {}
+        self._lock = threading.Lock()
+        self._file = open(path, 'a', encoding='utf-8')
+        if self._file.tell() and not _ends_with_newline(path):
+            self._file.write('\n')  # Terminate a line partially written by a crashed run.
+
+    def pending(self, pairs):
+        """
+        Filter out pairs of input path and output path already done.
+
+        Inputs are read to compute their digests as pairs are consumed.
+
+        param: iterable pairs
+        return: generator of tuple (input_path, output_path)
+        rtype: generator
+        """
+
+        for input_path, output_path in pairs:
+            try:
+                digest = file_digest(input_path)
+            except OSError:
+                digest = None  # The error will be reported when the input is processed.
+
+            if digest and self.is_done(input_path, output_path, digest):
+                self.num_skipped += 1
+                continue
+
+            with self._lock:
+                self._digests[input_path] = (output_path, digest)
+            yield input_path, output_path
+
+    def digest(self, input_path):
+        """
+        Get the digest of an input given by pending(), which has been computed
+        when it was given.
+
+        param: str input_path
+        return: hex digest, or None if the input has not been given or could not be read
+        rtype: str
+        """
+
+        with self._lock:
+            return self._digests.get(input_path, (None, None))[1]
+
+    def is_done(self, input_path, output_path, digest):
+        """
+        Whether an input has been masked according to the journal.
+
+        param: str input_path
+        param: str output_path
+        param: str digest of the current content of input_path
+        rtype: bool
+        """
+
+        entry = self.entries.get(input_path)
+        return (entry is not None and entry['error'] is None and
+                entry['settings'] == self.settings and entry['output'] == output_path and
+                digest in (entry['digest'], entry['output_digest']) and
+                os.path.exists(output_path))
+
+    def record(self, input_path, error):
+        """
+        Append an entry of an input given by pending() which has been processed.
+
+        param: str input_path
+        param: str error or None on success
+        """
+
+        with self._lock:
+            output_path, digest = self._digests.pop(input_path, (None, None))
+
+        output_digest = None
+        if error is None and output_path:
+            try:
+                output_digest = file_digest(output_path)
+            except OSError:
+                pass
+
+        entry = {
+            'version': JOURNAL_VERSION,
+            'input': input_path,
+            'output': output_path,
+            'digest': digest,
+            'output_digest': output_digest,
+            'settings': self.settings,
+            'error': error,
+        }
+        line = json.dumps(entry, sort_keys=True)
+        with self._lock:
+            self.entries[input_path] = entry
+            self._file.write(line + '\n')
+            self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def settings_digest(secret_res, options):
+    """
+    Get a digest of settings which change masked images.
+
+    param: SecretMatcher secret_res
+    param: dict options keyword arguments of mask_secrets()
+    return: hex digest
+    rtype: str
+    """
+
+    literal_matcher = options.get('literal_matcher')
+    layout_templates = options.get('layout_templates')
+    settings = {
+        'regexes': [secret_re.pattern for secret_re in secret_res.secret_res],
+        'literals': literal_matcher.literals if literal_matcher else [],
+        'fold_confusables': literal_matcher.fold_confusables if literal_matcher else False,
+        'options': {name: options.get(name) for name in _SETTINGS_OPTIONS},
+        # Templates decide which parts of images are recognized.
+        'layout_templates': {
+            'directory': os.path.abspath(layout_templates.directory),
+            'full_pass': layout_templates.full_pass,
+        } if layout_templates else None,
+    }
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def file_digest(path):
+    """
+    Get a hex digest of content of a file.
+
+    param: str path
+    return: hex digest
+    rtype: str
+    """
+
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def parse_shard(value):
+    """
+    Parse a shard given as K/N, which is the K-th of N shards.
+
+    param: str value
+    return: tuple (K, N)
+    rtype: tuple
+    raise: ArgumentTypeError if value is not K/N where 1 <= K <= N
+    """
+
+    k, _, n = value.partition('/')
+    try:
+        k, n = int(k), int(n)
+    except ValueError:
+        raise argparse.ArgumentTypeError('Shard must be K/N, e.g. 1/4.')
+    if not 1 <= k <= n:
+        raise argparse.ArgumentTypeError('Shard K/N must satisfy 1 <= K <= N.')
+    return k, n
+
+
+def select_shard(pairs, k, n):
+    """
+    Select pairs of input path and output path in the K-th of N shards.
+
+    An input is assigned to a shard by a hash of its path, so that nodes
+    given the same inputs split them without coordination, regardless of
+    the order of the inputs.
+
+    param: iterable pairs
+    param: int k
+    param: int n
+    return: generator of tuple (input_path, output_path)
+    rtype: generator
+    """
+
+    for input_path, output_path in pairs:
+        h = hashlib.sha256(input_path.encode('utf-8', errors='surrogateescape')).digest()
+        if int.from_bytes(h[:8], 'big') % n == k - 1:
+            yield input_path, output_path
+
+
+def read_journal(path):
+    """
+    Read entries of a journal.
+
+    A line which cannot be parsed, e.g. the last line written when a run
+    crashed, is ignored.
+
+    param: str path
+    return: dict of the latest entry per input path, preferring successful ones
+    rtype: dict
+    """
+
+    entries = {}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(entry, dict) and entry.get('version') == JOURNAL_VERSION:
+                merge_entries(entries, {entry['input']: entry})
+
+    return entries
+
+
+def merge_entries(entries, other_entries):
+    """
+    Merge entries into entries in place. A later entry of an input replaces an
+    earlier one, unless the earlier one is successful and the later one failed.
+
+    param: dict entries
+    param: dict other_entries
+    """
+
+    for input_path, entry in other_entries.items():
+        current = entries.get(input_path)
+        if current is None or entry['error'] is None or current['error'] is not None:
+            entries[input_path] = entry
+
+
+def write_journal(path, entries):
+    """
+    Write entries into a journal atomically.
+
+    param: str path
+    param: dict entries
+    """
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        for _, entry in sorted(entries.items()):
+            f.write(json.dumps(entry, sort_keys=True) + '\n')
+    os.replace(temp_path, path)
+
+
+def _ends_with_newline(path):
+    with open(path, 'rb') as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b'\n'
@@ -0,0 +1,130 @@
+from collections import deque
+
+# Characters which OCR often confuses with each other. Each character is
+# folded into the character it is confused with.
+CONFUSABLES = {
+    'O': '0',
+    'o': '0',
+    'l': '1',
+    'I': '1',
+    '|': '1',
+    'S': '5',
+    's': '5',
+    'B': '8',
+}
+
+_CONFUSABLES_TABLE = str.maketrans(CONFUSABLES)
+
+
+class LiteralMatcher:
+    """
+    Matcher finding occurrences of many literal strings using the Aho-Corasick algorithm.
+
+    The automaton is built once, and then content is scanned in time linear
+    to its length regardless of the number of literals. All the occurrences,
+    including ones overlapping each other, are reported.
+
+    When fold_confusables is True, characters in CONFUSABLES are folded in
+    both literals and content, so that e.g. '1O0' matches 'l00' recognized by OCR.
+    """
+
+    def __init__(self, literals, fold_confusables=False):
+        """
+        param: list literals
+        param: bool fold_confusables
+        """
+
+        self.literals = list(literals)
+        self.fold_confusables = fold_confusables
+
+        # Node 0 is the root. Each node is represented by an index of the lists.
+        self._goto = [{}]
+        self._outputs = [[]]
+        for index, literal in enumerate(self.literals):
+            node = 0
+            for c in self._fold(literal):
+                child = self._goto[node].get(c)
+                if child is None:
+                    child = len(self._goto)
+                    self._goto[node][c] = child
+                    self._goto.append({})
+                    self._outputs.append([])
+                node = child
+            if node != 0:
+                self._outputs[node].append(index)
+
+        self._fail = [0] * len(self._goto)
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for c, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and c not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(c, 0)
+                if self._outputs[self._fail[child]]:
+                    self._outputs[child] = self._outputs[child] + self._outputs[self._fail[child]]
+
+        self._lengths = [len(literal) for literal in self.literals]
+
+    def finditer(self, content):
+        """
+        Find occurrences of the literals in content.
+
+        param: str content
+        return: generator of tuple (index of literal, start, end) ordered by end
+        rtype: generator
+        """
+
+        goto = self._goto
+        fail = self._fail
+        outputs = self._outputs
+        lengths = self._lengths
+
+        node = 0
+        for end, c in enumerate(self._fold(content), 1):
+            while node and c not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(c, 0)
+            for index in outputs[node]:
+                yield index, end - lengths[index], end
+
+    def requirements(self):
+        """
+        Get the characters and the minimum length the literals require to match.
+
+        return: list of tuple (alphabet, minimum length)
+        rtype: list
+        """
+
+        if not self.literals:
+            return []
+        return [(frozenset(''.join(self.literals)), min(self._lengths))]
+
+    def _fold(self, s):
+        if self.fold_confusables:
+            return s.translate(_CONFUSABLES_TABLE)
+        return s
+
+
+def read_literals_from_file(literals_path):
+    """
+    Read secret literals from a file literals_path.
+
+    Since OCR-ed content does not include whitespaces, whitespaces in a line
+    are removed. Empty lines are ignored.
+
+    param: str literals_path
+    return: list of literals
+    rtype: list
+    """
+
+    literals = []
+    with open(literals_path) as f:
+        for line in f:
+            literal = ''.join(line.split())
+            if literal:
+                literals.append(literal)
+
+    return literals
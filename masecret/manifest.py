@@ -0,0 +1,386 @@
+import os
+import sys
+import json
+import argparse
+import tempfile
+import traceback
+from multiprocessing import Pool
+
+from PIL import Image, ImageColor, ImageDraw
+
+from masecret.cache import image_digest
+from masecret.cli import (add_masking_arguments, check_masking_args, build_options, image_options,
+                          get_secret_res)
+from masecret.files import save_image_atomically
+from masecret.frames import is_multi_frame, iter_frames, frame_save_params
+from masecret.masking import find_secret_rects, find_secrets_in_frames, mask_rects
+from masecret.matching import SecretMatcher
+from masecret.position_utils import merge_rects
+
+# Bump this when the format of manifests changes incompatibly.
+MANIFEST_VERSION = 2
+
+# Versions of manifests which can be read. Manifests of version 1 have no
+# rects of frames other than the first one.
+SUPPORTED_MANIFEST_VERSIONS = (1, 2)
+
+# Width of outlines drawn by apply --outline.
+OUTLINE_WIDTH = 3
+
+
+detect_parser = argparse.ArgumentParser(
+    prog='masecret detect',
+    usage='%(prog)s [options] INPUT... -m MANIFEST',
+    description='''
+        Find secret information in image files using OCR, and write the rects
+        of the secrets into MANIFEST without masking the images. Masked images
+        can be made later by masecret apply without OCR.''',
+    formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    fromfile_prefix_chars='@')
+detect_parser.add_argument('input_paths', metavar='INPUT', nargs='+',
+                           help='input files')
+detect_parser.add_argument('-m', '--manifest', dest='manifest_path', metavar='MANIFEST',
+                           required=True,
+                           help='manifest file to write')
+add_masking_arguments(detect_parser)
+detect_parser.add_argument('-j', '--jobs', dest='jobs', type=int, default=1,
+                           help='number of images to recognize in parallel')
+
+apply_parser = argparse.ArgumentParser(
+    prog='masecret apply',
+    usage='%(prog)s [options] MANIFEST (-o OUTPUT_DIR | -i)',
+    description='''
+        Mask secret information in image files at the rects in MANIFEST written
+        by masecret detect. No OCR is run.''',
+    formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+apply_parser.add_argument('manifest_path', metavar='MANIFEST',
+                          help='manifest file written by masecret detect')
+apply_parser.add_argument('-o', '--output', dest='output_dir', metavar='OUTPUT_DIR',
+                          help='directory to save masked images into')
+apply_parser.add_argument('-i', '--in-place', dest='in_place', action='store_true', default=False,
+                          help='mask image files in-place. WARNING: No backup files will be saved')
+apply_parser.add_argument('-c', '--color', dest='color', default=None,
+                          help='color to fill secrets. Defaults to the color given to detect')
+apply_parser.add_argument('--outline', dest='outline', action='store_true', default=False,
+                          help='draw outlines of secrets instead of filling them, '
+                               'e.g. to make a copy for reviewers')
+apply_parser.add_argument('--format', dest='format', default=None,
+                          help='extension of output images such as png or jpg, '
+                               'which is the same as input by default')
+
+
+def detect_main(argv=None):
+    args = parse_detect_args(argv)
+
+    secret_res = SecretMatcher(get_secret_res(args))
+    try:
+        options = build_options(args, args.jobs)
+    except OSError as e:
+        print('Failed to load OCR backend: {0}'.format(e), file=sys.stderr)
+        return 1
+
+    manifest_dir = os.path.dirname(os.path.abspath(args.manifest_path))
+    entries = []
+    failed_paths = []
+    for input_path, entry, error in detect_images(args.input_paths, secret_res, options, args.jobs):
+        if error:
+            print('Failed to process {0}: {1}'.format(input_path, error), file=sys.stderr)
+            failed_paths.append(input_path)
+            continue
+        num_rects = sum(len(frame['rects']) for frame in entry.get('frames', [entry]))
+        print('Found {0} secrets in {1}'.format(num_rects, input_path), file=sys.stderr)
+        entry['path'] = os.path.relpath(os.path.abspath(input_path), manifest_dir)
+        entries.append(entry)
+
+    write_manifest(args.manifest_path, {
+        'version': MANIFEST_VERSION,
+        'settings': manifest_settings(options),
+        'images': entries,
+    })
+    print('Saved manifest to {0}'.format(args.manifest_path), file=sys.stderr)
+
+    if failed_paths:
+        print('Failed to process {0} of {1} files'.format(len(failed_paths),
+                                                          len(args.input_paths)),
+              file=sys.stderr)
+        return 1
+
+    return 0
+
+
+def apply_main(argv=None):
+    args = parse_apply_args(argv)
+
+    try:
+        manifest = read_manifest(args.manifest_path)
+    except (OSError, ValueError) as e:
+        print('Failed to read manifest: {0}'.format(e), file=sys.stderr)
+        return 1
+
+    color = ImageColor.getrgb(args.color or manifest['settings']['fill_color'])
+    manifest_dir = os.path.dirname(os.path.abspath(args.manifest_path))
+    failed_paths = []
+    for entry in manifest['images']:
+        input_path = os.path.join(manifest_dir, entry['path'])
+        output_path = input_path if args.in_place else os.path.join(args.output_dir,
+                                                                    os.path.basename(input_path))
+        if args.format:
+            output_path = '{0}.{1}'.format(os.path.splitext(output_path)[0],
+                                           args.format.lower().lstrip('.'))
+
+        try:
+            apply_entry(entry, input_path, output_path, color, args.outline)
+        except Exception as e:
+            if os.environ.get('DEBUG'):
+                traceback.print_exc()
+            print('Failed to process {0}: {1}: {2}'.format(input_path, type(e).__name__, e),
+                  file=sys.stderr)
+            failed_paths.append(input_path)
+            continue
+        print('Saved to {0}'.format(output_path), file=sys.stderr)
+
+    if failed_paths:
+        print('Failed to process {0} of {1} files'.format(len(failed_paths),
+                                                          len(manifest['images'])),
+              file=sys.stderr)
+        return 1
+
+    return 0
+
+
+def parse_detect_args(args=None):
+    """
+    Parse command line arguments of the detect command.
+
+    param: list args
+    return: parsed arguments
+    rtype: Namespace
+    """
+
+    args = detect_parser.parse_args(args)
+
+    if args.jobs < 1:
+        detect_parser.error('JOBS must be a positive integer.')
+
+    check_masking_args(detect_parser, args)
+
+    return args
+
+
+def parse_apply_args(args=None):
+    """
+    Parse command line arguments of the apply command.
+
+    param: list args
+    return: parsed arguments
+    rtype: Namespace
+    """
+
+    args = apply_parser.parse_args(args)
+
+    if args.in_place == bool(args.output_dir):
+        apply_parser.error('Specify either -o or -i.')
+
+    if args.output_dir and not os.path.isdir(args.output_dir):
+        apply_parser.error('OUTPUT_DIR must be a directory.')
+
+    return args
+
+
+def detect_images(input_paths, secret_res, options, jobs=1):
+    """
+    Find secrets in images.
+
+    param: list input_paths
+    param: SecretMatcher secret_res
+    param: dict options keyword arguments of mask_secrets()
+    param: int jobs number of worker processes
+    return: generator of tuple (input_path, entry of the manifest, error) in order of input_paths
+    rtype: generator
+    """
+
+    if jobs <= 1:
+        for input_path in input_paths:
+            yield detect_image_safely(input_path, secret_res, options)
+        return
+
+    with Pool(jobs, initializer=_init_worker, initargs=(secret_res, options)) as pool:
+        for result in pool.imap(_detect_in_worker, input_paths):
+            yield result
+
+
+def detect_image_safely(input_path, secret_res, options):
+    """
+    Find secrets in an image without raising an exception.
+
+    param: str input_path
+    param: SecretMatcher secret_res
+    param: dict options keyword arguments of mask_secrets()
+    return: tuple (input_path, entry, error) where error is None on success
+    rtype: tuple
+    """
+
+    try:
+        image = Image.open(input_path)
+        image.load()
+        frames = None
+        if is_multi_frame(image):
+            frames = []
+            for frame, _, secrets in find_secrets_in_frames(image, secret_res,
+                                                            **_find_options(options)):
+                rects = [rect for _, _, secret_rects in secrets for rect in secret_rects]
+                frames.append({'digest': image_digest(frame), 'rects': _rects_to_json(rects)})
+            image.seek(0)
+        else:
+            rects = find_secret_rects(image, secret_res, **_find_options(options))
+    except Exception as e:
+        if os.environ.get('DEBUG'):
+            traceback.print_exc()
+        return input_path, None, '{0}: {1}'.format(type(e).__name__, e)
+    finally:
+        if options.get('ocr_cache'):
+            options['ocr_cache'].clear_memory()
+
+    entry = {
+        'digest': image_digest(image),
+        'size': list(image.size),
+        'rects': frames[0]['rects'] if frames else _rects_to_json(rects),
+    }
+    if frames:
+        entry['frames'] = frames
+    return input_path, entry, None
+
+
+def _rects_to_json(rects):
+    return [[list(top_left), list(bottom_right)] for top_left, bottom_right in rects]
+
+
+_worker_state = {}
+
+
+def _init_worker(secret_res, options):
+    _worker_state['secret_res'] = secret_res
+    _worker_state['options'] = options
+
+
+def _detect_in_worker(input_path):
+    return detect_image_safely(input_path, _worker_state['secret_res'], _worker_state['options'])
+
+
+def _find_options(options):
+    return {name: value for name, value in image_options(options).items()
+            if name != 'fill_color'}
+
+
+def manifest_settings(options):
+    """
+    Get settings of OCR and masking recorded in a manifest.
+
+    param: dict options keyword arguments of mask_secrets()
+    return: settings which can be serialized into JSON
+    rtype: dict
+    """
+
+    return {
+        'lang': options['lang'],
+        'lang_cascade': options.get('lang_cascade'),
+        'tesseract_configs': options.get('tesseract_configs'),
+        'ocr_backend': options.get('ocr_backend'),
+        'tile_height': options.get('tile_height'),
+        'coarse_scale': options.get('coarse_scale'),
+        'text_height': options.get('text_height'),
+        'fill_color': '#{0:02x}{1:02x}{2:02x}'.format(*options['fill_color'][:3]),
+    }
+
+
+def apply_entry(entry, input_path, output_path, color, outline=False):
+    """
+    Mask secrets in an image at the rects in an entry of a manifest.
+
+    Every frame of a multi-frame image is masked at the rects of the frame.
+
+    param: dict entry
+    param: str input_path
+    param: str output_path
+    param: tuple color
+    param: bool outline whether to draw outlines instead of filling rects
+    raise: ValueError if the image has been changed since it was detected, or
+           the entry has no rects of frames of a multi-frame image
+    """
+
+    image = Image.open(input_path)
+    image.load()
+    if list(image.size) != entry['size'] or image_digest(image) != entry['digest']:
+        raise ValueError('Image has been changed since secrets were detected')
+
+    params = {}
+    if is_multi_frame(image):
+        frame_entries = entry.get('frames')
+        if frame_entries is None:
+            raise ValueError('Secrets were detected only in the first frame. Detect them again')
+        if len(frame_entries) != image.n_frames:
+            raise ValueError('Image has been changed since secrets were detected')
+
+        frames = []
+        durations = []
+        for (frame, duration), frame_entry in zip(iter_frames(image), frame_entries):
+            if image_digest(frame) != frame_entry['digest']:
+                raise ValueError('Image has been changed since secrets were detected')
+            _draw_rects(frame, frame_entry['rects'], color, outline)
+            frames.append(frame)
+            durations.append(duration)
+        params = frame_save_params(image, frames, durations)
+        image = frames[0]
+    else:
+        _draw_rects(image, entry['rects'], color, outline)
+
+    if os.path.splitext(output_path)[1].lower() in ('.jpg', '.jpeg') and \
+            image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')  # JPEG cannot have alpha or a palette.
+    save_image_atomically(image, output_path, **params)
+
+
+def _draw_rects(image, rects, color, outline):
+    rects = merge_rects([tuple(tuple(position) for position in rect) for rect in rects])
+    if outline:
+        draw = ImageDraw.Draw(image)
+        for rect in rects:
+            draw.rectangle(rect, outline=color, width=OUTLINE_WIDTH)
+    else:
+        mask_rects(image, rects, color)
+
+
+def write_manifest(path, manifest):
+    """
+    Write a manifest atomically.
+
+    param: str path
+    param: dict manifest
+    """
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+        f.write('\n')
+    os.replace(temp_path, path)
+
+
+def read_manifest(path):
+    """
+    Read a manifest.
+
+    param: str path
+    return: manifest
+    rtype: dict
+    raise: ValueError if the file is not a manifest of a supported version
+    """
+
+    with open(path, encoding='utf-8') as f:
+        manifest = json.load(f)
+
+    if not isinstance(manifest, dict) or \
+            manifest.get('version') not in SUPPORTED_MANIFEST_VERSIONS:
+        raise ValueError('Unsupported manifest: {0}'.format(path))
+
+    return manifest
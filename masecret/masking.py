@@ -0,0 +1,579 @@
+import os
+import sys
+import io
+import traceback
+from contextlib import redirect_stderr
+from multiprocessing import Pool
+
+from PIL import Image, ImageDraw
+
+from masecret.backends import get_backend
+from masecret.files import save_image_atomically, copy_file_atomically, image_format_of, is_same_file
+from masecret.frames import is_multi_frame, iter_frames, changed_rows, frame_save_params
+from masecret.matching import SecretMatcher, CandidateFilter
+from masecret.ocr import (flatten_transparency, image_to_char_boxes_tiled,
+                          image_to_char_boxes_coarse_to_fine, image_to_char_boxes_cascade,
+                          image_to_char_boxes_in_bands,
+                          prefetch_char_boxes, adaptive_scale, needs_all_languages,
+                          DEFAULT_TILE_OVERLAP)
+from masecret.position_utils import padding_boxes, bounding_boxes_by_line, merge_rects
+from masecret.report import StageTimer, NULL_TIMER, Profiler
+from masecret.templates import template_scope
+
+# Margin around changed rows of a frame to recognize again, which must be
+# larger than the height of a line of text.
+FRAME_OCR_MARGIN = 50
+
+
+def mask_secrets_safely(input_path, output_path, secret_res, options, capture_log=False,
+                        timer=None):
+    """
+    Call mask_secrets() without raising an exception.
+
+    param: str input_path
+    param: str output_path
+    param: list secret_res
+    param: dict options
+    param: bool capture_log
+    param: StageTimer timer
+    return: tuple (input_path, log, error) where log is captured stderr output
+            (empty unless capture_log is True) and error is None on success
+    rtype: tuple
+    """
+
+    log = io.StringIO()
+    try:
+        if capture_log:
+            with redirect_stderr(log):
+                mask_secrets(input_path, output_path, secret_res, timer=timer, **options)
+        else:
+            mask_secrets(input_path, output_path, secret_res, timer=timer, **options)
+    except Exception as e:
+        if os.environ.get('DEBUG'):
+            traceback.print_exc(file=log if capture_log else sys.stderr)
+        return input_path, log.getvalue(), '{0}: {1}'.format(type(e).__name__, e)
+
+    return input_path, log.getvalue(), None
+
+
+def mask_secrets_batch(batch, secret_res, options, capture_log=False, report=False,
+                       profiler=None):
+    """
+    Mask secret information in a batch of images.
+
+    The images are recognized in a single run of tesseract beforehand, and
+    images having the same content are recognized only once.
+
+    param: list batch
+    param: list secret_res
+    param: dict options
+    param: bool capture_log
+    param: bool report whether to record time of each stage
+    param: Profiler profiler
+    return: list of tuple (input_path, log, error, record) where record is a dict
+            of StageTimer.record() or None unless report is True
+    rtype: list
+    """
+
+    if profiler:
+        with profiler:
+            return mask_secrets_batch(batch, secret_res, options, capture_log, report)
+
+    ocr_cache = options.get('ocr_cache')
+    if ocr_cache and len(batch) >= 2 and _recognizes_whole_images(options):
+        try:
+            prefetch_char_boxes([input_path for input_path, _ in batch], options['lang'],
+                                options.get('tesseract_configs'), ocr_cache,
+                                options.get('tile_height'))
+        except Exception as e:
+            # Fall back to recognizing images one by one.
+            print('Failed to recognize a batch of images: {0}'.format(e), file=sys.stderr)
+
+    results = []
+    for input_path, output_path in batch:
+        timer = StageTimer() if report else None
+        result = mask_secrets_safely(input_path, output_path, secret_res, options, capture_log,
+                                     timer)
+        results.append(result + (timer.record() if timer else None,))
+
+    if ocr_cache:
+        ocr_cache.clear_memory()
+
+    return results
+
+
+def _recognizes_whole_images(options):
+    """
+    Tell whether images are recognized as a whole at their resolution with
+    the pyocr backend, so that results prefetched by prefetch_char_boxes()
+    are read afterwards.
+
+    Other backends do not start a process per image. Coarse-to-fine OCR and
+    adaptive resolution recognize scaled images, a language cascade
+    recognizes images with its first language rather than all of them, and
+    layout templates recognize bands of images.
+
+    param: dict options
+    rtype: bool
+    """
+
+    if any(options.get(key) for key in
+           ['coarse_scale', 'text_height', 'lang_cascade', 'layout_templates']):
+        return False
+    return get_backend(options.get('ocr_backend')).name == 'pyocr'
+
+
+def mask_secrets_in_parallel(batches, secret_res, options, jobs, report=False, profile_path=None):
+    """
+    Mask secret information in images using a pool of worker processes.
+
+    Results are yielded as soon as each batch is done, so the order of results
+    is not the same as batches.
+
+    param: list batches
+    param: list secret_res
+    param: dict options
+    param: int jobs
+    param: bool report
+    param: str profile_path to which each worker dumps its stats with suffix of the pid
+    return: generator of tuple (input_path, log, error, record)
+    rtype: generator
+    """
+
+    initargs = (secret_res, options, report, profile_path)
+    with Pool(jobs, initializer=_init_worker, initargs=initargs) as pool:
+        for results in pool.imap_unordered(_mask_secrets_in_worker, batches):
+            for result in results:
+                yield result
+
+
+_worker_state = {}
+
+
+def _init_worker(secret_res, options, report, profile_path):
+    _worker_state['secret_res'] = secret_res
+    _worker_state['options'] = options
+    _worker_state['report'] = report
+    _worker_state['profiler'] = (Profiler('{0}.{1}'.format(profile_path, os.getpid()))
+                                 if profile_path else None)
+
+
+def _mask_secrets_in_worker(batch):
+    return mask_secrets_batch(batch, _worker_state['secret_res'], _worker_state['options'],
+                              capture_log=True, report=_worker_state['report'],
+                              profiler=_worker_state['profiler'])
+
+
+def mask_secrets(input_path, output_path, secret_res, lang, fill_color, tesseract_configs=None,
+                 ocr_cache=None, literal_matcher=None, tile_height=None,
+                 tile_overlap=DEFAULT_TILE_OVERLAP, tile_jobs=None, ocr_backend=None,
+                 coarse_scale=None, text_height=None, lang_cascade=False, layout_templates=None,
+                 save_options=None, link_unchanged=False, timer=None):
+    """
+    Mask secret infomation in an image.
+
+    The image is written atomically, so that the input is never broken even
+    if it is masked in-place. When no secret is found, the image is not
+    encoded again: an in-place input is left untouched, and an input is
+    copied byte-for-byte (or hard linked) to output_path of the same format.
+
+    param: str input_path
+    param: str output_path
+    param: list secret_res
+    param: str lang
+    param: str tesseract_configs
+    param: tuple fill_color
+    param: OCRCache ocr_cache
+    param: LiteralMatcher literal_matcher
+    param: int tile_height
+    param: int tile_overlap
+    param: int tile_jobs
+    param: str ocr_backend
+    param: float coarse_scale
+    param: int text_height
+    param: bool lang_cascade
+    param: LayoutTemplates layout_templates
+    param: dict save_options options of the encoder passed to Image.save()
+    param: bool link_unchanged whether to hard link output_path to input_path if no secret is found
+    param: StageTimer timer
+    """
+
+    print('Processing {0}...'.format(input_path), file=sys.stderr)
+
+    image = open_image_file(input_path, timer)
+    image, secret_rects, frame_params = mask_image_frames(
+        image, secret_res, lang, fill_color, tesseract_configs, ocr_cache, literal_matcher,
+        tile_height, tile_overlap, tile_jobs, ocr_backend, coarse_scale, text_height,
+        lang_cascade, layout_templates, timer)
+    save_masked_image(image, input_path, output_path, secret_rects,
+                      dict(save_options or {}, **frame_params), link_unchanged, timer)
+
+
+def open_image_file(input_path, timer=None):
+    """
+    Decode an image file.
+
+    param: str input_path
+    param: StageTimer timer to record time of decode stage
+    return: loaded image
+    rtype: Image
+    """
+
+    timer = timer or NULL_TIMER
+    with timer.stage('decode'):
+        image = Image.open(input_path)
+        image.load()
+    timer.count('input_bytes', os.path.getsize(input_path))
+    timer.count('pixels', image.size[0] * image.size[1])
+    return image
+
+
+def save_masked_image(image, input_path, output_path, secret_rects, save_options=None,
+                      link_unchanged=False, timer=None, log=None):
+    """
+    Save an image masked by mask_image() as described in mask_secrets().
+
+    param: Image image
+    param: str input_path
+    param: str output_path
+    param: list secret_rects returned by mask_image()
+    param: dict save_options options of the encoder passed to Image.save()
+    param: bool link_unchanged whether to hard link output_path to input_path if no secret is found
+    param: StageTimer timer to record time of encode stage
+    param: file log to print messages to, defaults to sys.stderr
+    """
+
+    timer = timer or NULL_TIMER
+    log = log or sys.stderr
+    print('Found {0} secrets at {1}'.format(len(secret_rects), secret_rects), file=log)
+
+    with timer.stage('encode'):
+        if secret_rects or image_format_of(output_path) != image.format:
+            save_image_atomically(image, output_path, **(save_options or {}))
+        elif is_same_file(input_path, output_path):
+            print('Left {0} unchanged'.format(output_path), file=log)
+            return
+        else:
+            copy_file_atomically(input_path, output_path, link_unchanged)
+    timer.count('output_bytes', os.path.getsize(output_path))
+    print('Saved to {0}'.format(output_path), file=log)
+
+
+def mask_image(image, secret_res, lang, fill_color, tesseract_configs=None, ocr_cache=None,
+               literal_matcher=None, tile_height=None, tile_overlap=DEFAULT_TILE_OVERLAP,
+               tile_jobs=None, ocr_backend=None, coarse_scale=None, text_height=None,
+               lang_cascade=False, layout_templates=None, timer=None):
+    """
+    Mask secret information in an image in place.
+
+    param: Image image
+    param: list or SecretMatcher secret_res
+    param: str lang
+    param: tuple fill_color
+    param: str tesseract_configs
+    param: OCRCache ocr_cache
+    param: LiteralMatcher literal_matcher
+    param: int tile_height
+    param: int tile_overlap
+    param: int tile_jobs
+    param: str ocr_backend
+    param: float coarse_scale
+    param: int text_height
+    param: bool lang_cascade
+    param: LayoutTemplates layout_templates
+    param: StageTimer timer
+    return: list of secret rects
+    rtype: list
+    """
+
+    timer = timer or NULL_TIMER
+    secret_rects = find_secret_rects(image, secret_res, lang, tesseract_configs, ocr_cache,
+                                     literal_matcher, tile_height, tile_overlap, tile_jobs,
+                                     ocr_backend, coarse_scale, text_height, lang_cascade,
+                                     layout_templates, timer)
+    with timer.stage('draw'):
+        merged_rects = merge_rects(secret_rects)
+        mask_rects(image, merged_rects, fill_color)
+    timer.count('rects', len(merged_rects))
+    return secret_rects
+
+
+def mask_image_frames(image, secret_res, lang, fill_color, tesseract_configs=None, ocr_cache=None,
+                      literal_matcher=None, tile_height=None, tile_overlap=DEFAULT_TILE_OVERLAP,
+                      tile_jobs=None, ocr_backend=None, coarse_scale=None, text_height=None,
+                      lang_cascade=False, layout_templates=None, timer=None):
+    """
+    Mask secret information in every frame of an image, which may have
+    multiple frames like an animated GIF or a multi-page TIFF. Secrets are
+    found by find_secrets_in_frames().
+
+    Parameters are the same as mask_image().
+
+    return: tuple (masked image to save, list of secret rects in all frames,
+            params of Image.save() to save all the frames)
+    rtype: tuple
+    """
+
+    if not is_multi_frame(image):
+        secret_rects = mask_image(image, secret_res, lang, fill_color, tesseract_configs,
+                                  ocr_cache, literal_matcher, tile_height, tile_overlap, tile_jobs,
+                                  ocr_backend, coarse_scale, text_height, lang_cascade,
+                                  layout_templates, timer)
+        return image, secret_rects, {}
+
+    timer = timer or NULL_TIMER
+    frames = []
+    durations = []
+    all_rects = []
+    for frame, duration, secrets in find_secrets_in_frames(
+            image, secret_res, lang, tesseract_configs, ocr_cache, literal_matcher, tile_height,
+            tile_overlap, tile_jobs, ocr_backend, coarse_scale, text_height, lang_cascade,
+            layout_templates, timer):
+        rects = [rect for _, _, secret_rects in secrets for rect in secret_rects]
+        masked = frame.copy()
+        with timer.stage('draw'):
+            merged_rects = merge_rects(rects)
+            mask_rects(masked, merged_rects, fill_color)
+        timer.count('rects', len(merged_rects))
+        frames.append(masked)
+        durations.append(duration)
+        all_rects.extend(rects)
+
+    # The format of the source is kept, so that an image without secrets is not encoded again.
+    frames[0].format = image.format
+    return frames[0], all_rects, frame_save_params(image, frames, durations)
+
+
+def find_secrets_in_frames(image, secret_res, lang, tesseract_configs=None, ocr_cache=None,
+                           literal_matcher=None, tile_height=None,
+                           tile_overlap=DEFAULT_TILE_OVERLAP, tile_jobs=None, ocr_backend=None,
+                           coarse_scale=None, text_height=None, lang_cascade=False,
+                           layout_templates=None, timer=None):
+    """
+    Find secret information in every frame of an image.
+
+    Consecutive frames of a screen recording are mostly the same. A frame
+    unchanged from the previous one reuses its secrets, and only a band of a
+    changed frame around the changed rows is recognized, padded by
+    FRAME_OCR_MARGIN so that every line touching the changed rows is in the
+    band. Rects of the previous frame not touching the changed rows are kept,
+    and secrets found in the band are added if they touch the changed rows.
+
+    Parameters are the same as find_secrets().
+
+    return: generator of tuple (frame, duration in milliseconds or None, list of secrets
+            as find_secrets() returns). A frame must not be modified, as the next one is
+            compared with it.
+    rtype: generator
+    """
+
+    def find(frame, layout_templates=None):
+        return find_secrets(frame, secret_res, lang, tesseract_configs, ocr_cache,
+                            literal_matcher, tile_height, tile_overlap, tile_jobs, ocr_backend,
+                            coarse_scale, text_height, lang_cascade, layout_templates, timer)
+
+    timer = timer or NULL_TIMER
+    previous = None
+    secrets = []
+    num_frames = 0
+    for frame, duration in iter_frames(image):
+        width, height = frame.size
+        rows = (0, height)
+        if previous is not None and previous.size == frame.size and previous.mode == frame.mode:
+            rows = changed_rows(previous, frame)
+
+        if rows is None:
+            timer.count('reused_frames', 1)
+        elif rows[1] - rows[0] + FRAME_OCR_MARGIN * 2 >= height:
+            secrets = find(frame, layout_templates)
+        else:
+            def touches_changed_rows(rect):
+                return rect[0][1] < rows[1] and rect[1][1] > rows[0]
+
+            top = max(0, rows[0] - FRAME_OCR_MARGIN)
+            bottom = min(height, rows[1] + FRAME_OCR_MARGIN)
+            kept_secrets = []
+            for text, pattern, rects in secrets:
+                rects = [rect for rect in rects if not touches_changed_rows(rect)]
+                if rects:
+                    kept_secrets.append((text, pattern, rects))
+            # Bands of changed rows are not learned as layouts of their own.
+            for text, pattern, rects in find(frame.crop((0, top, width, bottom))):
+                rects = [((left, rect_top + top), (right, rect_bottom + top))
+                         for (left, rect_top), (right, rect_bottom) in rects]
+                if any(touches_changed_rows(rect) for rect in rects):
+                    kept_secrets.append((text, pattern, rects))
+            secrets = kept_secrets
+
+        previous = frame
+        num_frames += 1
+        yield frame, duration, secrets
+
+    timer.count('frames', num_frames)
+
+
+def find_secret_rects(image, secret_res, lang, tesseract_configs=None, ocr_cache=None,
+                      literal_matcher=None, tile_height=None, tile_overlap=DEFAULT_TILE_OVERLAP,
+                      tile_jobs=None, ocr_backend=None, coarse_scale=None, text_height=None,
+                      lang_cascade=False, layout_templates=None, timer=None):
+    """
+    Find secret rects in an image.
+
+    Parameters are the same as find_secrets().
+
+    return: list of rects
+    rtype: list
+    """
+
+    secrets = find_secrets(image, secret_res, lang, tesseract_configs, ocr_cache, literal_matcher,
+                           tile_height, tile_overlap, tile_jobs, ocr_backend, coarse_scale,
+                           text_height, lang_cascade, layout_templates, timer)
+    return [rect for _, _, rects in secrets for rect in rects]
+
+
+def find_secrets(image, secret_res, lang, tesseract_configs=None, ocr_cache=None,
+                 literal_matcher=None, tile_height=None, tile_overlap=DEFAULT_TILE_OVERLAP,
+                 tile_jobs=None, ocr_backend=None, coarse_scale=None, text_height=None,
+                 lang_cascade=False, layout_templates=None, timer=None):
+    """
+    Find secret information in an image.
+
+    param: Image image
+    param: list or SecretMatcher secret_res
+    param: str lang
+    param: str tesseract_configs
+    param: OCRCache ocr_cache
+    param: LiteralMatcher literal_matcher
+    param: int tile_height or None not to split the image into tiles
+    param: int tile_overlap
+    param: int tile_jobs number of tiles recognized in parallel
+    param: str or OCRBackend ocr_backend
+    param: float coarse_scale scale of the first pass of coarse-to-fine OCR, or None to
+           recognize the whole image at once
+    param: int text_height height of lines of text to downscale the image to before OCR,
+           or None to recognize the image at its resolution
+    param: bool lang_cascade whether to recognize lines with all the languages of lang only
+           when the first one cannot read them
+    param: LayoutTemplates layout_templates to recognize only regions where secrets have been
+           found in images of the same layout, or None to recognize the whole image
+    param: StageTimer timer to record time of flatten, ocr and match stages
+    return: list of tuple (recognized text, regex pattern or literal matching it, list of rects)
+    rtype: list
+    """
+
+    timer = timer or NULL_TIMER
+    if not isinstance(secret_res, SecretMatcher):
+        secret_res = SecretMatcher(secret_res)
+
+    with timer.stage('flatten'):
+        image = flatten_transparency(image)
+
+    def recognize(image):
+        return _recognize(image, secret_res, lang, tesseract_configs, ocr_cache, literal_matcher,
+                          tile_height, tile_overlap, tile_jobs, ocr_backend, coarse_scale,
+                          text_height, lang_cascade)
+
+    with timer.stage('ocr'):
+        layout = None
+        if layout_templates:
+            layout = layout_templates.plan(image, template_scope(secret_res, literal_matcher))
+        if layout and layout.bands is not None:
+            boxes = image_to_char_boxes_in_bands(image, layout.bands, recognize)
+            timer.count('template_hits', 1)
+        else:
+            boxes = recognize(image)
+
+    if os.environ.get('DEBUG'):
+        for c, rect in boxes:
+            print(c, rect)
+
+    with timer.stage('match'):
+        content = boxes.content
+
+        spans = [(secret_res.secret_res[index].pattern, start, end)
+                 for index, start, end in secret_res.finditer(content)]
+        if literal_matcher:
+            spans.extend((literal_matcher.literals[index], start, end)
+                         for index, start, end in literal_matcher.finditer(content))
+
+        secrets = []
+        for pattern, start, end in spans:
+            line_rects = bounding_boxes_by_line(boxes[start:end].rects())
+            secrets.append((content[start:end], pattern, padding_boxes(line_rects, 2)))
+
+    if layout:
+        layout_templates.learn(layout, [rect for _, _, rects in secrets for rect in rects])
+
+    timer.count('chars', len(content))
+    timer.count('matches', len(secrets))
+    return secrets
+
+
+def _recognize(image, secret_res, lang, tesseract_configs, ocr_cache, literal_matcher,
+               tile_height, tile_overlap, tile_jobs, ocr_backend, coarse_scale, text_height=None,
+               lang_cascade=False):
+    """
+    Recognize characters in an image as configured by parameters of find_secrets().
+    """
+
+    scale = adaptive_scale(image, text_height) if text_height else 1
+    if scale < 1:
+        # Boxes are mapped back to the original coordinates before padding and masking.
+        width, height = image.size
+        small_image = image.resize((max(1, round(width * scale)), max(1, round(height * scale))),
+                                   Image.LANCZOS)
+        small_tile_height = tile_height and max(1, int(tile_height * scale))
+        small_tile_overlap = min(int(tile_overlap * scale), (small_tile_height or 1) - 1)
+        boxes = _recognize(small_image, secret_res, lang, tesseract_configs, ocr_cache,
+                           literal_matcher, small_tile_height, max(0, small_tile_overlap),
+                           tile_jobs, ocr_backend, coarse_scale, lang_cascade=lang_cascade)
+        return boxes.scaled(1 / scale)
+
+    requirements = secret_res.requirements()
+    if literal_matcher:
+        requirements = requirements + literal_matcher.requirements()
+
+    if lang_cascade and not needs_all_languages(requirements):
+        def recognize(image, lang):
+            return _recognize(image, secret_res, lang, tesseract_configs, ocr_cache,
+                              literal_matcher, tile_height, tile_overlap, tile_jobs, ocr_backend,
+                              coarse_scale)
+
+        return image_to_char_boxes_cascade(image, lang, recognize, tesseract_configs, ocr_cache,
+                                           ocr_backend)
+
+    if coarse_scale:
+        return image_to_char_boxes_coarse_to_fine(image, lang, CandidateFilter(requirements),
+                                                  tesseract_configs, ocr_cache, ocr_backend,
+                                                  coarse_scale, tile_height, tile_overlap,
+                                                  tile_jobs)
+
+    return image_to_char_boxes_tiled(image, lang, tesseract_configs, ocr_cache,
+                                     tile_height, tile_overlap, tile_jobs, ocr_backend)
+
+
+def mask_rect(image, rect, color):
+    """
+    Fill a rect in an image.
+
+    param: Image image
+    param: Rect rect
+    param: tuple color
+    """
+
+    draw = ImageDraw.Draw(image)
+    draw.rectangle(rect, fill=color)
+
+
+def mask_rects(image, rects, color):
+    """
+    Fill rects in an image in a single drawing pass.
+
+    param: Image image
+    param: list rects
+    param: tuple color
+    """
+
+    draw = ImageDraw.Draw(image)
+    for rect in rects:
+        draw.rectangle(rect, fill=color)
@@ -0,0 +1,432 @@
+import re
+import string
+import unicodedata
+
+try:
+    from re import _parser as sre_parse, _constants as sre_constants
+except ImportError:  # Python < 3.11
+    import sre_parse
+    import sre_constants
+
+from masecret.literals import CONFUSABLES
+
+# Below this number of regexes having literal prefixes, scanning content for
+# each regex is faster than scanning it once for a trie.
+MIN_TRIE_SIZE = 20
+
+# Key of a trie node holding indexes of regexes whose literal prefix ends at the node.
+_END = None
+
+# A line recognized roughly is a candidate when it contains a run of characters
+# that a regex can match, at least this ratio of the regex's minimum length.
+CANDIDATE_LENGTH_RATIO = 0.5
+
+# Character classes larger than this are regarded as matching any character.
+_MAX_ALPHABET_SIZE = 1024
+
+_CATEGORY_ALPHABETS = {
+    sre_constants.CATEGORY_DIGIT: string.digits,
+    sre_constants.CATEGORY_SPACE: string.whitespace,
+}
+
+# Non-ASCII characters equal to an ASCII character in case insensitive regex,
+# other than ones whose lower() is the ASCII character (e.g. KELVIN SIGN).
+_ASCII_CASE_FIXES = {
+    'İ': 'i',  # LATIN CAPITAL LETTER I WITH DOT ABOVE
+    'ı': 'i',  # LATIN SMALL LETTER DOTLESS I
+    'ſ': 's',  # LATIN SMALL LETTER LONG S
+}
+
+
+class SecretMatcher:
+    """
+    Matcher finding matches of many secret regexes in a single pass.
+
+    Matches are exactly the same as calling finditer() of every regex one by
+    one, including matches of different regexes overlapping each other,
+    except that empty matches are never reported.
+
+    Literal prefixes of regexes (e.g. 'AKIA' of 'AKIA[0-9A-Z]{16}') are put
+    into a trie, which is compiled into a single scanner regex. The scanner
+    finds positions where any of the prefixes occurs while reading content
+    once. Only regexes whose prefix occurs at the position are tried there.
+    Case insensitive prefixes are put into another trie, which is scanned
+    over lowercased content.
+
+    A regex without a literal prefix (e.g. '[-\\d]{12,}') cannot be put into
+    a trie, so it is matched separately with its own finditer(). When there
+    are only a few regexes, all of them are matched separately.
+    """
+
+    def __init__(self, secret_res):
+        """
+        param: list secret_res
+        """
+
+        self.secret_res = list(secret_res)
+
+        prefixes = [literal_prefix(secret_re) for secret_re in self.secret_res]
+        if sum(1 for prefix, _ in prefixes if prefix) < MIN_TRIE_SIZE:
+            prefixes = [('', False)] * len(prefixes)
+
+        self._separate_indexes = []
+        tries = {False: {}, True: {}}  # case sensitive trie and case insensitive one
+        for index, (prefix, ignore_case) in enumerate(prefixes):
+            if not prefix:
+                self._separate_indexes.append(index)
+                continue
+
+            node = tries[ignore_case]
+            for c in prefix:
+                node = node.setdefault(c, {})
+            node.setdefault(_END, []).append(index)
+
+        self._tries = [_Trie(trie, ignore_case) for ignore_case, trie in sorted(tries.items())
+                       if trie]
+        self._requirements = None
+
+    def requirements(self):
+        """
+        Get the characters and the minimum length each regex requires to match.
+
+        return: list of tuple (alphabet or None for any character, minimum length)
+        rtype: list
+        """
+
+        if self._requirements is None:
+            self._requirements = [(pattern_alphabet(secret_re), min_match_length(secret_re))
+                                  for secret_re in self.secret_res]
+        return self._requirements
+
+    def finditer(self, content):
+        """
+        Find matches of the secret regexes in content.
+
+        Matches are ordered by index of regex, then by start position, which is
+        the same order as running finditer() of secret_res one by one.
+
+        param: str content
+        return: generator of tuple (index of regex, start, end)
+        rtype: generator
+        """
+
+        spans_by_index = {}
+
+        for index in self._separate_indexes:
+            spans_by_index[index] = [m.span() for m in self.secret_res[index].finditer(content)
+                                     if m.start() != m.end()]
+
+        lowered_content = None
+        for trie in self._tries:
+            scanned_content = content
+            if trie.ignore_case:
+                if lowered_content is None:
+                    lowered_content = _lower(content)
+                scanned_content = lowered_content
+            spans_by_index.update(trie.scan(content, scanned_content, self.secret_res))
+
+        for index in range(len(self.secret_res)):
+            for start, end in spans_by_index[index]:
+                yield index, start, end
+
+
+class _Trie:
+    """
+    Trie of literal prefixes of regexes with a scanner compiled from it.
+    """
+
+    def __init__(self, root, ignore_case):
+        self.root = root
+        self.ignore_case = ignore_case
+        self.indexes = list(_trie_indexes(root))
+        # Keys of a case insensitive trie are lowercase, and it is scanned
+        # over lowercased content, so the scanner is always case sensitive.
+        self.scanner = re.compile(_trie_pattern(root))
+
+    def scan(self, content, scanned_content, secret_res):
+        """
+        Find matches of regexes in the trie.
+
+        param: str content
+        param: str scanned_content which is content itself or lowercased content
+        param: list secret_res
+        return: dict of index of regex to list of spans
+        rtype: dict
+        """
+
+        spans = {index: [] for index in self.indexes}
+        # Position where finditer() of each regex would search the next match from.
+        cursors = dict.fromkeys(self.indexes, 0)
+
+        search = self.scanner.search
+        pos = 0
+        while True:
+            m = search(scanned_content, pos)
+            if m is None:
+                break
+
+            position = m.start()
+            for index in self._candidates(scanned_content, position):
+                if cursors[index] > position:
+                    continue  # Inside of the previous match of the regex.
+                match = secret_res[index].match(content, position)
+                if match is None or match.end() == position:
+                    continue
+                spans[index].append((position, match.end()))
+                cursors[index] = match.end()
+
+            pos = position + 1
+
+        return spans
+
+    def _candidates(self, scanned_content, position):
+        """
+        Get indexes of regexes whose literal prefix occurs at position.
+        """
+
+        candidates = []
+        node = self.root
+        i = position
+        while node is not None:
+            candidates.extend(node.get(_END, ()))
+            if i >= len(scanned_content):
+                break
+            node = node.get(scanned_content[i])
+            i += 1
+
+        return candidates
+
+
+def literal_prefix(secret_re):
+    """
+    Get the literal string which every match of a regex starts with.
+
+    A case insensitive prefix is lowercased and contains only ASCII characters.
+
+    param: Pattern secret_re
+    return: tuple (prefix, whether the prefix is case insensitive)
+    rtype: tuple
+    """
+
+    if not isinstance(secret_re.pattern, str):
+        return '', False
+
+    try:
+        parsed = sre_parse.parse(secret_re.pattern, secret_re.flags)
+    except (re.error, sre_constants.error):
+        return '', False
+
+    ignore_case = bool(parsed.state.flags & re.IGNORECASE)
+    prefix = []
+    for op, av in parsed:
+        if op is not sre_constants.LITERAL:
+            break
+        c = chr(av)
+        if ignore_case:
+            if ord(c) >= 128:
+                break
+            c = c.lower()
+        prefix.append(c)
+
+    return ''.join(prefix), ignore_case
+
+
+def pattern_alphabet(secret_re):
+    """
+    Get the set of characters which matches of a regex can consist of.
+
+    Case insensitive regexes include both cases. Categories except digits and
+    spaces, such as \\w, are too broad, so such regexes get None.
+
+    param: Pattern secret_re
+    return: frozenset of characters, or None if any character can be matched
+    rtype: frozenset
+    """
+
+    if not isinstance(secret_re.pattern, str):
+        return None
+
+    try:
+        parsed = sre_parse.parse(secret_re.pattern, secret_re.flags)
+    except (re.error, sre_constants.error):
+        return None
+
+    alphabet = set()
+    if not _collect_alphabet(parsed, alphabet):
+        return None
+
+    if parsed.state.flags & re.IGNORECASE:
+        alphabet.update([c.swapcase() for c in alphabet if len(c.swapcase()) == 1])
+
+    return frozenset(alphabet)
+
+
+def min_match_length(secret_re):
+    """
+    Get the minimum length of matches of a regex.
+
+    param: Pattern secret_re
+    return: minimum length
+    rtype: int
+    """
+
+    try:
+        return sre_parse.parse(secret_re.pattern, secret_re.flags).getwidth()[0]
+    except (re.error, sre_constants.error, TypeError):
+        return 0
+
+
+def _collect_alphabet(parsed, alphabet):
+    """
+    Add characters a parsed regex can consume to alphabet.
+
+    return: False if any character can be consumed
+    """
+
+    for op, av in parsed:
+        if op is sre_constants.LITERAL:
+            alphabet.add(chr(av))
+        elif op is sre_constants.IN:
+            for item_op, item_av in av:
+                if item_op is sre_constants.LITERAL:
+                    alphabet.add(chr(item_av))
+                elif item_op is sre_constants.RANGE:
+                    low, high = item_av
+                    if high - low >= _MAX_ALPHABET_SIZE:
+                        return False
+                    alphabet.update(chr(code) for code in range(low, high + 1))
+                elif item_op is sre_constants.CATEGORY and item_av in _CATEGORY_ALPHABETS:
+                    alphabet.update(_CATEGORY_ALPHABETS[item_av])
+                else:
+                    return False  # NEGATE, other categories, etc.
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+            if not _collect_alphabet(av[2], alphabet):
+                return False
+        elif op is sre_constants.SUBPATTERN:
+            if not _collect_alphabet(av[-1], alphabet):
+                return False
+        elif op is sre_constants.BRANCH:
+            for branch in av[1]:
+                if not _collect_alphabet(branch, alphabet):
+                    return False
+        elif op in (sre_constants.AT, sre_constants.ASSERT, sre_constants.ASSERT_NOT,
+                    sre_constants.GROUPREF):
+            continue  # Consumes nothing, or only characters already collected.
+        else:
+            return False
+
+    return True
+
+
+class CandidateFilter:
+    """
+    Filter of roughly recognized lines of text which could contain secrets.
+
+    A line is a candidate when it contains a run of characters in the alphabet
+    of a requirement, at least CANDIDATE_LENGTH_RATIO of the minimum length of
+    the requirement. Since a rough recognition often confuses characters,
+    both cases of letters and confusable characters (e.g. O and 0) are
+    accepted as well, and characters are normalized by NFKC (e.g. fullwidth
+    digits into ASCII ones).
+    """
+
+    def __init__(self, requirements):
+        """
+        param: list requirements list of tuple (alphabet or None, minimum length)
+        """
+
+        # Minimum run length per alphabet, as many regexes share an alphabet.
+        thresholds = {}
+        for alphabet, min_length in requirements:
+            threshold = max(1, int(min_length * CANDIDATE_LENGTH_RATIO))
+            accepted = None if alphabet is None else _accepted_chars(alphabet)
+            thresholds[accepted] = min(threshold, thresholds.get(accepted, threshold))
+        self.thresholds = sorted(thresholds.items(), key=lambda item: item[1])
+
+    def is_candidate(self, text):
+        """
+        Whether a line could contain secrets.
+
+        param: str text
+        rtype: bool
+        """
+
+        text = ''.join(_normalize_char(c) for c in text)
+        for accepted, threshold in self.thresholds:
+            if accepted is None:
+                if len(text) >= threshold:
+                    return True
+                continue
+
+            run = 0
+            for c in text:
+                run = run + 1 if c in accepted else 0
+                if run >= threshold:
+                    return True
+
+        return False
+
+
+def _accepted_chars(alphabet):
+    accepted = set(alphabet)
+    accepted.update(c.swapcase() for c in alphabet if len(c.swapcase()) == 1)
+    for c, confused in CONFUSABLES.items():
+        if c in accepted or confused in accepted:
+            accepted.update((c, confused))
+    return frozenset(accepted)
+
+
+def _normalize_char(c):
+    normalized = unicodedata.normalize('NFKC', c)
+    return normalized if len(normalized) == 1 else c
+
+
+def _lower(content):
+    """
+    Lowercase content keeping its length, so that a character in content
+    equals to an ASCII character in case insensitive regex only if the
+    lowercased character equals to the lowercase of the ASCII character.
+    """
+
+    try:
+        content.encode('ascii')
+    except UnicodeEncodeError:
+        pass
+    else:
+        # str.isascii() is not available before Python 3.7.
+        return content.lower()
+
+    return ''.join(_ASCII_CASE_FIXES.get(c) or (c.lower() if len(c.lower()) == 1 else c)
+                   for c in content)
+
+
+def _trie_pattern(node):
+    """
+    Get a regex pattern matching any of the prefixes in a trie.
+
+    Since the scanner only has to find a position where any of the prefixes
+    occurs, a node where a prefix ends needs no more descendants.
+    """
+
+    if _END in node:
+        return ''
+
+    alternatives = [re.escape(c) + _trie_pattern(child)
+                    for c, child in sorted(node.items())]
+    if len(alternatives) == 1:
+        return alternatives[0]
+    return '(?:{0})'.format('|'.join(alternatives))
+
+
+def _trie_indexes(node):
+    """
+    Yield all the indexes of regexes in a trie.
+    """
+
+    for key, value in node.items():
+        if key is _END:
+            for index in value:
+                yield index
+        else:
+            for index in _trie_indexes(value):
+                yield index
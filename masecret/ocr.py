@@ -0,0 +1,615 @@
+import os
+import math
+import codecs
+import string
+import tempfile
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageChops
+from pyocr.tesseract import run_tesseract, TesseractError
+
+from masecret.backends import get_backend
+from masecret.builders import ModifiedCharBoxBuilder, CharBoxTable
+from masecret.defaults import DEFAULT_TILE_OVERLAP, DEFAULT_COARSE_SCALE, DEFAULT_TEXT_HEIGHT
+from masecret.position_utils import line_spans, projection_runs
+
+# Blank space between bands of candidate lines stacked for the fine pass.
+_BAND_GAP = 10
+
+# Images are not downscaled by adaptive resolution less than this,
+# as OCR time saved is not worth the loss of detail.
+_MIN_DOWNSCALE = 0.8
+
+# Images are not downscaled smaller than this scale.
+_MIN_SCALE = 0.25
+
+# Difference of a pixel from the background color to be regarded as ink.
+_INK_THRESHOLD = 64
+
+# Runs of rows lower than this are regarded as rules or noise rather than text.
+_MIN_LINE_HEIGHT = 4
+
+# Number of vertical strips text height is estimated in, and their minimum width.
+_STRIPS = 32
+_MIN_STRIP_WIDTH = 32
+
+# Characters the first language of a cascade reads in lines of its own
+# script. Others are mostly what it makes of a script it cannot read.
+_PLAIN_CHARS = frozenset(string.ascii_letters + string.digits + '.,:;-_/@\'"()')
+
+# A line recognized by the first language of a cascade is recognized again
+# with all the languages when at least this fraction of its characters are
+# not plain, or have boxes as wide as square glyphs of CJK scripts.
+_UNREADABLE_CHAR_RATIO = 0.3
+_SQUARE_GLYPH_RATIO = 0.5
+
+# Width of a box relative to the height of its line to be regarded as a square glyph.
+_SQUARE_GLYPH_WIDTH = 0.8
+
+# When at least this fraction of lines are unreadable, the whole image is
+# recognized again rather than bands of it.
+_UNREADABLE_LINE_RATIO = 0.5
+
+
+def flatten_transparency(image):
+    """
+    Get an image where transparent pixels are converted into WHITE.
+
+    When using pyocr, an input image is converted to RGB (not RGBA).
+    During the conversion, transparent pixels are converted into BLACK.
+    Sometimes the black pixels get in the way of recognizing text.
+
+    For example, macOS's screenshot image taken by Command+Shift+4+Space
+    has transparent pixels around an window. This results in a black and
+    thick border in the edge of image. The border worsen quality of OCR
+    of text near by the border. To avoid this, convert transparent pixels
+    into WHITE by pasting image into an white background.
+
+    See: http://stackoverflow.com/questions/9166400/convert-rgba-png-to-rgb-with-pil
+
+    param: Image image
+    return: flattened Image, or image itself if it is not RGBA
+    rtype: Image
+    """
+
+    if image.mode != 'RGBA':
+        return image
+
+    background = Image.new('RGB', image.size, (255, 255, 255))
+    background.paste(image, mask=image.split()[3])  # Paste image masked by alpha channel [3]
+    return background
+
+
+def image_to_char_boxes(image, lang, tesseract_configs=None, ocr_cache=None, backend=None):
+    """
+    Recognize characters in an image.
+
+    param: Image image
+    param: str lang
+    param: list tesseract_configs
+    param: OCRCache ocr_cache
+    param: str or OCRBackend backend name of OCR backend or backend itself
+    return: table of char boxes
+    rtype: CharBoxTable
+    """
+
+    backend = get_backend(backend)
+    if not tesseract_configs:
+        tesseract_configs = backend.default_configs()
+
+    if ocr_cache is None:
+        return backend.image_to_char_boxes(image, lang, tesseract_configs)
+
+    key = ocr_cache.key(image, lang, tesseract_configs, backend.name)
+    boxes = ocr_cache.get(key)
+    if boxes is None:
+        boxes = backend.image_to_char_boxes(image, lang, tesseract_configs)
+        ocr_cache.put(key, boxes)
+
+    return boxes
+
+
+def tiles(image_height, tile_height, tile_overlap):
+    """
+    Split an image into horizontal bands overlapping each other.
+
+    Each tile has a core, which is the tile without halves of the overlaps.
+    Cores of tiles cover the image without overlapping each other.
+
+    param: int image_height
+    param: int tile_height
+    param: int tile_overlap
+    return: list of tuple (top, bottom, core_top, core_bottom)
+    rtype: list
+    """
+
+    if tile_overlap >= tile_height:
+        raise ValueError('Tile overlap must be smaller than tile height.')
+
+    half_overlap = tile_overlap // 2
+    result = []
+    top = 0
+    while True:
+        bottom = min(top + tile_height, image_height)
+        core_top = top + half_overlap if top > 0 else 0
+        core_bottom = bottom - half_overlap if bottom < image_height else image_height
+        result.append((top, bottom, core_top, core_bottom))
+        if bottom >= image_height:
+            return result
+        top += tile_height - tile_overlap
+
+
+def image_to_char_boxes_tiled(image, lang, tesseract_configs=None, ocr_cache=None,
+                              tile_height=None, tile_overlap=DEFAULT_TILE_OVERLAP, jobs=None,
+                              backend=None):
+    """
+    Recognize characters in an image split into tiles.
+
+    Tiles are recognized in parallel, and the boxes are mapped back to the
+    coordinates of the image. A line of text in the overlap of two tiles is
+    recognized in both of them, so the line is taken only from the tile
+    whose core contains the center of the line. Lines are concatenated in the
+    order of tiles, so that a secret straddling a seam still matches.
+
+    param: Image image
+    param: str lang
+    param: list tesseract_configs
+    param: OCRCache ocr_cache
+    param: int tile_height or None not to split the image
+    param: int tile_overlap
+    param: int jobs number of tiles recognized in parallel
+    param: str or OCRBackend backend
+    return: table of char boxes
+    rtype: CharBoxTable
+    """
+
+    if not tile_height or image.size[1] <= tile_height:
+        return image_to_char_boxes(image, lang, tesseract_configs, ocr_cache, backend)
+
+    def recognize_tile(tile):
+        top, bottom, core_top, core_bottom = tile
+        # Only a tile is cropped at a time in a worker, so that memory is capped by tile size.
+        boxes = image_to_char_boxes(image.crop((0, top, image.size[0], bottom)),
+                                    lang, tesseract_configs, ocr_cache, backend)
+
+        lines = []
+        for start, end, ((_, line_top), (_, line_bottom)) in line_spans(boxes.rects()):
+            center = top + (line_top + line_bottom) // 2
+            if core_top <= center < core_bottom:
+                lines.append(boxes[start:end])
+
+        return CharBoxTable.concat(lines).translated((0, top))
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        return CharBoxTable.concat(executor.map(recognize_tile,
+                                                tiles(image.size[1], tile_height, tile_overlap)))
+
+
+def image_to_char_boxes_coarse_to_fine(image, lang, candidate_filter, tesseract_configs=None,
+                                       ocr_cache=None, backend=None, scale=DEFAULT_COARSE_SCALE,
+                                       tile_height=None, tile_overlap=DEFAULT_TILE_OVERLAP,
+                                       jobs=None):
+    """
+    Recognize characters in an image in two passes.
+
+    The first pass roughly recognizes a downscaled image to find lines of text
+    which could contain secrets, judged by candidate_filter. Only bands of the
+    image around those lines, including the lines just before and after them
+    so that a secret wrapped over lines is kept, are recognized again at full
+    resolution. The bands are stacked into a single image so that the second
+    pass is also a single run of OCR, and the boxes are mapped back to the
+    coordinates of the image. When every line is a candidate, or no line is
+    found, the whole image is recognized.
+
+    param: Image image
+    param: str lang
+    param: CandidateFilter candidate_filter
+    param: list tesseract_configs
+    param: OCRCache ocr_cache
+    param: str or OCRBackend backend
+    param: float scale of the image in the first pass
+    param: int tile_height
+    param: int tile_overlap
+    param: int jobs
+    return: table of char boxes
+    rtype: CharBoxTable
+    """
+
+    def recognize(image, scale=1):
+        return image_to_char_boxes_tiled(image, lang, tesseract_configs, ocr_cache,
+                                         tile_height and int(tile_height * scale),
+                                         int(tile_overlap * scale), jobs, backend)
+
+    width, height = image.size
+    small_image = image.resize((max(1, round(width * scale)), max(1, round(height * scale))),
+                               Image.LANCZOS)
+    bands = candidate_bands(recognize(small_image, scale), candidate_filter, scale, height)
+    if bands is None:
+        return recognize(image)
+    if not bands:
+        return CharBoxTable()
+
+    return CharBoxTable.concat(_recognize_bands(image, bands, recognize))
+
+
+def image_to_char_boxes_in_bands(image, bands, recognize):
+    """
+    Recognize only bands of an image, e.g. regions of a layout template.
+
+    param: Image image
+    param: list bands list of tuple (top, bottom) not overlapping each other
+    param: function recognize taking an image and returning a CharBoxTable
+    return: table of char boxes in the coordinates of image
+    rtype: CharBoxTable
+    """
+
+    if not bands:
+        return CharBoxTable()
+
+    return CharBoxTable.concat(_recognize_bands(image, bands, recognize))
+
+
+def _recognize_bands(image, bands, recognize):
+    """
+    Recognize bands of an image stacked into a single image, so that they
+    are recognized in a single run of OCR.
+
+    param: Image image
+    param: list bands list of tuple (top, bottom) not overlapping each other
+    param: function recognize taking an image and returning a CharBoxTable
+    return: list of CharBoxTable per line in the coordinates of image
+    rtype: list
+    """
+
+    width = image.size[0]
+    if image.mode not in ('L', 'RGB'):
+        image = image.convert('RGB')
+    stacked_image = Image.new(image.mode, (width, sum(bottom - top + _BAND_GAP
+                                                      for top, bottom in bands) + _BAND_GAP),
+                              'white')
+    stacked_tops = []
+    y = _BAND_GAP
+    for top, bottom in bands:
+        stacked_image.paste(image.crop((0, top, width, bottom)), (0, y))
+        stacked_tops.append(y)
+        y += bottom - top + _BAND_GAP
+
+    boxes = recognize(stacked_image)
+
+    lines = []
+    for start, end, ((_, line_top), (_, line_bottom)) in line_spans(boxes.rects()):
+        i = bisect_right(stacked_tops, (line_top + line_bottom) // 2) - 1
+        if i >= 0:
+            lines.append(boxes[start:end].translated((0, bands[i][0] - stacked_tops[i])))
+
+    return lines
+
+
+def candidate_bands(boxes, candidate_filter, scale, image_height):
+    """
+    Get bands of an image around lines which could contain secrets.
+
+    param: CharBoxTable boxes recognized in the image downscaled by scale
+    param: CandidateFilter candidate_filter
+    param: float scale
+    param: int image_height
+    return: list of tuple (top, bottom) of bands not overlapping each other in
+            the original image, or None if every line is a candidate or no line is found
+    rtype: list
+    """
+
+    lines = list(line_spans(boxes.rects()))
+    candidates = set()
+    for i, (start, end, _) in enumerate(lines):
+        if candidate_filter.is_candidate(boxes.content[start:end]):
+            candidates.update((i - 1, i, i + 1))  # Also keep neighbors of wrapped secrets.
+
+    if not lines or all(i in candidates for i in range(len(lines))):
+        return None
+
+    line_bands = []
+    for i in candidates:
+        if not 0 <= i < len(lines):
+            continue
+        (_, line_top), (_, line_bottom) = lines[i][2]
+        top, bottom = int(line_top / scale), int(math.ceil(line_bottom / scale))
+        # Pad by half a line, as lines are roughly positioned in the first pass.
+        padding = (bottom - top) // 2 + 1
+        line_bands.append((max(0, top - padding), min(image_height, bottom + padding)))
+
+    bands = []
+    for top, bottom in sorted(line_bands):
+        if bands and top <= bands[-1][1]:
+            bands[-1] = (bands[-1][0], max(bottom, bands[-1][1]))
+        else:
+            bands.append((top, bottom))
+
+    return bands
+
+
+def image_to_char_boxes_cascade(image, lang, recognize, tesseract_configs=None, ocr_cache=None,
+                                backend=None):
+    """
+    Recognize characters in an image with the first of multiple languages,
+    and recognize again with all of them only lines the first one cannot read.
+
+    A model of multiple languages, e.g. eng+jpn, is much slower than the
+    first language alone, which is enough for most screenshots. Lines whose
+    characters are mostly not plain ASCII or have square boxes are regarded
+    as text of another script; bands of the image around them are stacked
+    and recognized with all the languages, replacing those lines. When most
+    lines are such, the whole image is recognized with all the languages.
+
+    Which lines are recognized again is cached in ocr_cache per image, so that
+    the first pass is skipped for an image needing all the languages as a whole.
+
+    param: Image image
+    param: str lang languages joined by + sign, the first of which should be
+           the fastest and written in Latin script, e.g. eng+jpn
+    param: function recognize taking an image and a language, and returning a CharBoxTable
+    param: list tesseract_configs
+    param: OCRCache ocr_cache
+    param: str or OCRBackend backend
+    return: table of char boxes
+    rtype: CharBoxTable
+    """
+
+    first_lang = lang.split('+')[0]
+    if first_lang == lang:
+        return recognize(image, lang)
+
+    decision = None
+    if ocr_cache is not None:
+        backend = get_backend(backend)
+        key = ocr_cache.key(image, 'cascade:' + lang,
+                            tesseract_configs or backend.default_configs(), backend.name)
+        decision = ocr_cache.get_decision(key)
+
+    if decision and decision['whole']:
+        return recognize(image, lang)
+
+    boxes = recognize(image, first_lang)
+    if decision is None:
+        decision = cascade_decision(boxes)
+        if ocr_cache is not None:
+            ocr_cache.put_decision(key, decision)
+
+    if decision['whole']:
+        return recognize(image, lang)
+    if not decision['lines']:
+        return boxes
+
+    def is_unreadable(line_top, line_bottom):
+        center = (line_top + line_bottom) // 2
+        return any(top <= center < bottom for top, bottom in decision['lines'])
+
+    lines = []
+    for start, end, ((_, line_top), (_, line_bottom)) in line_spans(boxes.rects()):
+        if not is_unreadable(line_top, line_bottom):
+            lines.append((line_top, start, boxes[start:end]))
+
+    bands = []
+    for top, bottom in decision['lines']:
+        # Pad by half a line, as tesseract recognizes a line cut too closely poorly.
+        padding = (bottom - top) // 2 + 1
+        top, bottom = max(0, top - padding), min(image.size[1], bottom + padding)
+        if bands and top <= bands[-1][1]:
+            bands[-1] = (bands[-1][0], max(bottom, bands[-1][1]))
+        else:
+            bands.append((top, bottom))
+
+    # Parts of neighbor lines in the padding are dropped, as they are taken from the first pass.
+    for line in _recognize_bands(image, bands, lambda band_image: recognize(band_image, lang)):
+        line_top, line_bottom = min(line.tops), max(line.bottoms)
+        if is_unreadable(line_top, line_bottom):
+            lines.append((line_top, -1, line))
+
+    return CharBoxTable.concat(line for _, _, line in sorted(lines, key=lambda l: l[:2]))
+
+
+def cascade_decision(boxes):
+    """
+    Decide which lines recognized by the first language of a cascade are
+    recognized again with all the languages.
+
+    param: CharBoxTable boxes recognized by the first language
+    return: dict having keys 'whole', which is True to recognize the whole
+            image again, and 'lines', a list of [top, bottom] of lines to recognize again
+    rtype: dict
+    """
+
+    lines = list(line_spans(boxes.rects()))
+    unreadable_lines = []
+    for start, end, ((_, top), (_, bottom)) in lines:
+        if is_unreadable_line(boxes[start:end]):
+            unreadable_lines.append([top, bottom])
+
+    whole = bool(lines) and len(unreadable_lines) >= len(lines) * _UNREADABLE_LINE_RATIO
+    return {'whole': whole, 'lines': [] if whole else unreadable_lines}
+
+
+def is_unreadable_line(line):
+    """
+    Whether a line recognized by the first language of a cascade looks like
+    text of a script the language cannot read.
+
+    param: CharBoxTable line
+    rtype: bool
+    """
+
+    if not len(line):
+        return False
+
+    not_plain = sum(1 for c in line.content if c not in _PLAIN_CHARS)
+    if not_plain >= len(line) * _UNREADABLE_CHAR_RATIO:
+        return True
+
+    line_height = max(line.bottoms) - min(line.tops)
+    square = sum(1 for left, right in zip(line.lefts, line.rights)
+                 if right - left >= line_height * _SQUARE_GLYPH_WIDTH)
+    return square >= len(line) * _SQUARE_GLYPH_RATIO
+
+
+def needs_all_languages(requirements):
+    """
+    Whether secrets could consist of characters the first language of a
+    cascade cannot read, i.e. the regexes or literals require characters
+    other than ASCII. Then every line has to be recognized with all the languages.
+
+    param: list requirements list of tuple (alphabet or None, minimum length)
+    rtype: bool
+    """
+
+    return any(alphabet is not None and any(ord(c) > 0x7f for c in alphabet)
+               for alphabet, _ in requirements)
+
+
+def estimate_text_height(image):
+    """
+    Estimate the height of lines of text in an image without OCR.
+
+    The image is split into vertical strips, so that columns of different
+    backgrounds, e.g. a dark toolbar next to a white page, and vertical rules
+    do not join lines. In each strip, pixels different enough from the most
+    common color are regarded as ink, and runs of rows having ink are lines
+    of text. The median of their heights is returned, which is robust against
+    icons and rules in a screenshot mostly consisting of text.
+
+    param: Image image
+    return: height in pixels, or None if no text is found
+    rtype: int
+    """
+
+    gray = image.convert('L')
+    width, height = gray.size
+    strip_width = max(_MIN_STRIP_WIDTH, width // _STRIPS)
+
+    heights = []
+    for left in range(0, width, strip_width):
+        strip = gray.crop((left, 0, min(width, left + strip_width), height))
+        histogram = strip.histogram()
+        background = histogram.index(max(histogram))
+        ink = ImageChops.difference(strip, Image.new('L', strip.size, background)) \
+            .point(lambda v: 255 if v > _INK_THRESHOLD else 0)
+        heights.extend(bottom - top for top, bottom in projection_runs(ink.getprojection()[1])
+                       if _MIN_LINE_HEIGHT <= bottom - top <= height // 2)
+
+    if not heights:
+        return None
+
+    heights.sort()
+    return heights[len(heights) // 2]
+
+
+def adaptive_scale(image, text_height=DEFAULT_TEXT_HEIGHT):
+    """
+    Get a scale to downscale an image to, so that its lines of text are about text_height.
+
+    Images are never upscaled.
+
+    param: Image image
+    param: int text_height target height of lines of text
+    return: scale, which is 1 not to resize the image
+    rtype: float
+    """
+
+    estimated_height = estimate_text_height(image)
+    if not estimated_height:
+        return 1
+
+    scale = max(_MIN_SCALE, text_height / estimated_height)
+    if scale > _MIN_DOWNSCALE:
+        return 1
+
+    return scale
+
+
+def images_to_char_boxes(images, lang, tesseract_configs=None):
+    """
+    Recognize characters in many images in a single run of the tesseract command.
+
+    Tesseract is started and loads the language model only once for all
+    the images, which are passed as a list file. Boxes of all the images are
+    written into a single box file, which is split by page numbers.
+
+    param: list images
+    param: str lang
+    param: list tesseract_configs
+    return: list of tables of char boxes per image
+    rtype: list
+    """
+
+    builder = ModifiedCharBoxBuilder(0)
+    if tesseract_configs:
+        builder.tesseract_configs = tesseract_configs
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filenames = []
+        for i, image in enumerate(images):
+            filename = 'input{0}.bmp'.format(i)
+            if image.mode != 'RGB':
+                image = image.convert('RGB')
+            image.save(os.path.join(tmpdir, filename))
+            filenames.append(filename)
+
+        with open(os.path.join(tmpdir, 'inputs.txt'), 'w') as f:
+            f.write(''.join(filename + '\n' for filename in filenames))
+
+        status, errors = run_tesseract('inputs.txt', 'output', cwd=tmpdir, lang=lang,
+                                       flags=builder.tesseract_flags,
+                                       configs=builder.tesseract_configs)
+        if status:
+            raise TesseractError(status, errors)
+
+        with codecs.open(os.path.join(tmpdir, 'output.box'), 'r', encoding='utf-8',
+                         errors='replace') as f:
+            return builder.read_pages(f, [image.size[1] for image in images])
+
+
+def prefetch_char_boxes(input_paths, lang, tesseract_configs, ocr_cache, tile_height=None):
+    """
+    Recognize characters in images in a single run of the tesseract command
+    and store the results to ocr_cache, so that recognizing the images one by
+    one with the pyocr backend afterwards hits the cache.
+
+    Images which are already cached, duplicated, unreadable or split into
+    tiles are skipped. Nothing is done when fewer than two images are left.
+
+    param: list input_paths
+    param: str lang
+    param: list tesseract_configs
+    param: OCRCache ocr_cache
+    param: int tile_height
+    return: number of images recognized
+    rtype: int
+    """
+
+    if tesseract_configs is None:
+        tesseract_configs = ModifiedCharBoxBuilder(0).tesseract_configs
+
+    keys = []
+    images = []
+    for input_path in input_paths:
+        try:
+            image = flatten_transparency(Image.open(input_path))
+        except OSError:
+            continue  # The error will be reported when the input is processed.
+
+        if tile_height and image.size[1] > tile_height:
+            continue
+
+        key = ocr_cache.key(image, lang, tesseract_configs, 'pyocr')
+        if key in keys or ocr_cache.get(key) is not None:
+            continue
+
+        keys.append(key)
+        images.append(image)
+
+    if len(images) < 2:
+        return 0
+
+    for key, boxes in zip(keys, images_to_char_boxes(images, lang, tesseract_configs)):
+        ocr_cache.put(key, boxes)
+
+    return len(images)
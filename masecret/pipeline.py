@@ -0,0 +1,188 @@
+import io
+import os
+import queue
+import threading
+import traceback
+
+from masecret.cli import image_options
+from masecret.masking import open_image_file, mask_image_frames, save_masked_image
+from masecret.report import StageTimer
+
+# Seconds blocking operations on queues wait before checking whether the pipeline is stopped.
+_POLL_INTERVAL = 0.1
+
+# Marks the end of items in a queue.
+_DONE = object()
+
+
+class _Item:
+    """
+    Image passed through stages of a pipeline.
+    """
+
+    def __init__(self, input_path, output_path, timer):
+        self.input_path = input_path
+        self.output_path = output_path
+        self.timer = timer
+        self.log = io.StringIO()
+        self.image = None
+        self.secret_rects = None
+        self.frame_params = None
+        self.error = None
+
+    def fail(self, e):
+        if os.environ.get('DEBUG'):
+            traceback.print_exc(file=self.log)
+        self.error = '{0}: {1}'.format(type(e).__name__, e)
+        self.image = None  # Release memory as soon as possible.
+
+    def result(self):
+        return (self.input_path, self.log.getvalue(), self.error,
+                self.timer.record() if self.timer else None)
+
+
+def mask_secrets_pipelined(pairs, secret_res, options, ocr_workers=1, depth=2, report=False):
+    """
+    Mask secret information in images in a pipeline of threads.
+
+    A decode thread reads images, ocr_workers threads find and mask secrets,
+    and an encode thread writes masked images. They are connected by queues
+    of depth images at most, so decoding and encoding overlap OCR of other
+    images, and pairs are consumed only as fast as OCR proceeds. At most
+    depth * 2 + ocr_workers + 2 images are kept in memory.
+
+    OCR engines run outside the GIL (libtesseract) or in another process
+    (pyocr), so OCR workers run in parallel as well.
+
+    param: iterable pairs of input path and output path, e.g. input_output_pairs()
+    param: SecretMatcher secret_res
+    param: dict options keyword arguments of mask_secrets()
+    param: int ocr_workers number of threads running OCR
+    param: int depth maximum number of images in a queue between stages
+    param: bool report whether to record time of each stage
+    return: generator of tuple (input_path, log, error, record) in order of completion,
+            as mask_secrets_batch() returns
+    rtype: generator
+    """
+
+    decoded = queue.Queue(depth)
+    masked = queue.Queue(depth)
+    done = queue.Queue()
+    stop = threading.Event()
+
+    threads = [threading.Thread(target=_decode, args=(pairs, decoded, ocr_workers, report, stop))]
+    threads.extend(threading.Thread(target=_mask, args=(decoded, masked, secret_res, options, stop))
+                   for _ in range(ocr_workers))
+    threads.append(threading.Thread(target=_encode, args=(masked, done, ocr_workers, options, stop)))
+
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    try:
+        while True:
+            item = done.get()
+            if item is _DONE:
+                break
+            yield item.result()
+    finally:
+        # Unblock the threads when the caller stops iterating early.
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+
+def _decode(pairs, decoded, ocr_workers, report, stop):
+    try:
+        for input_path, output_path in pairs:
+            item = _Item(input_path, output_path, StageTimer() if report else None)
+            print('Processing {0}...'.format(input_path), file=item.log)
+            try:
+                item.image = open_image_file(input_path, item.timer)
+            except Exception as e:
+                item.fail(e)
+
+            if not _put(decoded, item, stop):
+                return
+    finally:
+        for _ in range(ocr_workers):
+            _put(decoded, _DONE, stop)
+
+
+def _mask(decoded, masked, secret_res, options, stop):
+    ocr_cache = options.get('ocr_cache')
+    try:
+        while True:
+            item = _get(decoded, stop)
+            if item is _DONE:
+                return
+
+            if not item.error:
+                try:
+                    item.image, item.secret_rects, item.frame_params = mask_image_frames(
+                        item.image, secret_res, timer=item.timer, **image_options(options))
+                except Exception as e:
+                    item.fail(e)
+                finally:
+                    # Results of an image are not reused, as the pipeline does not group duplicates.
+                    if ocr_cache:
+                        ocr_cache.clear_memory()
+
+            if not _put(masked, item, stop):
+                return
+    finally:
+        _put(masked, _DONE, stop)
+
+
+def _encode(masked, done, ocr_workers, options, stop):
+    num_done = 0
+    try:
+        while num_done < ocr_workers:
+            item = _get(masked, stop)
+            if item is _DONE:
+                num_done += 1
+                continue
+
+            if not item.error:
+                try:
+                    save_masked_image(item.image, item.input_path, item.output_path,
+                                      item.secret_rects,
+                                      dict(options.get('save_options') or {}, **item.frame_params),
+                                      options.get('link_unchanged'), item.timer, item.log)
+                except Exception as e:
+                    item.fail(e)
+                item.image = None
+
+            done.put(item)
+    finally:
+        done.put(_DONE)
+
+
+def _put(q, item, stop):
+    """
+    Put an item into a bounded queue unless the pipeline is stopped.
+
+    return: whether the item is put
+    rtype: bool
+    """
+
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=_POLL_INTERVAL)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _get(q, stop):
+    """
+    Get an item from a queue, or _DONE if the pipeline is stopped.
+    """
+
+    while not stop.is_set():
+        try:
+            return q.get(timeout=_POLL_INTERVAL)
+        except queue.Empty:
+            continue
+    return _DONE
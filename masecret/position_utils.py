@@ -72,25 +72,164 @@ def bounding_boxes_by_line(rects):
     """
     Get bounding Rects by line from list of Rects.
 
-    :param list rects
+    A line break is detected when a rect goes back to the left or does not
+    overlap vertically with the current line. Rects are read only once, so
+    this takes linear time.
+
+    :param iterable rects
     :return generator of bouding Rects
     :rtype generator
     """
 
-    if not rects:
+    for _, _, rect in line_spans(rects):
+        yield rect
+
+
+def line_spans(rects):
+    """
+    Get spans of lines and their bounding Rects from list of Rects.
+
+    See bounding_boxes_by_line() for how a line break is detected.
+
+    :param iterable rects
+    :return generator of tuple (start index, end index, bounding Rect)
+    :rtype generator
+    """
+
+    rects = iter(rects)
+    for first_rect in rects:
+        break
+    else:
         return
 
-    oneline_rects = [rects.pop(0)]
-    while rects:
-        rect = rects.pop(0)
-        x = rect[0][0]
-        prev_rect = oneline_rects[-1]
-        prev_x = prev_rect[0][0]
-        if prev_x <= x:
-            oneline_rects.append(rect)
-        else:
+    (left, top), (right, bottom) = first_rect
+    prev_x = left
+    start = 0
+    end = 1
+    for i, rect in enumerate(rects, 1):
+        (x, y), (x2, y2) = rect
+        if x < prev_x or y >= bottom or y2 <= top:
             # Detect line break
-            yield bounding_box(oneline_rects)
-            oneline_rects = [rect]
+            yield start, i, ((left, top), (right, bottom))
+            start = i
+            left, top, right, bottom = x, y, x2, y2
+        else:
+            left = min(left, x)
+            top = min(top, y)
+            right = max(right, x2)
+            bottom = max(bottom, y2)
+        prev_x = x
+        end = i + 1
+
+    yield start, end, ((left, top), (right, bottom))
+
+
+def offset_rects(offset, rects):
+    """
+    Get new Rects where each of rects is translated by offset.
+
+    :param Position offset
+    :param iterable rects
+    :return translated Rects
+    :rtype list
+    """
+
+    dx, dy = offset
+    return [((left + dx, top + dy), (right + dx, bottom + dy))
+            for (left, top), (right, bottom) in rects]
+
+
+def padding_boxes(rects, padding):
+    """
+    Get new Rects where each of rects is enlarged by padding width.
+
+    :param iterable rects
+    :param int padding
+    :return enlarged Rects
+    :rtype list
+    """
+
+    return [((left - padding, top - padding), (right + padding, bottom + padding))
+            for (left, top), (right, bottom) in rects]
+
+
+def merge_rects(rects):
+    """
+    Get a set of Rects covering exactly the same area as rects, where rects
+    overlapping or touching each other are merged only when their bounding
+    Rect is their union, e.g. one contains the other or both are in the same
+    row. Other rects are kept as they are, so that rects of wrapped lines
+    do not grow into a block covering text between them.
+
+    :param iterable rects
+    :return merged Rects ordered by top and left
+    :rtype list
+    """
+
+    rects = list(rects)
+    while True:
+        merged = _merge_rects_once(rects)
+        if len(merged) == len(rects):
+            return sorted(merged, key=lambda rect: (rect[0][1], rect[0][0]))
+        # A merged Rect may be merged with another one, so merge them again.
+        rects = merged
+
+
+def _merge_rects_once(rects):
+    """
+    Merge each rect into a mergeable one of merged rects using a sweep line
+    moving from left to right.
+    """
+
+    merged = []
+    active = []  # indices of merged rects crossing the sweep line
+    for rect in sorted(rects, key=lambda rect: rect[0][0]):
+        left = rect[0][0]
+        active = [i for i in active if merged[i][1][0] >= left]
+        for i in active:
+            if _is_union_rect(merged[i], rect):
+                merged[i] = bounding_box([merged[i], rect])
+                break
+        else:
+            active.append(len(merged))
+            merged.append(rect)
+
+    return merged
+
+
+def _is_union_rect(rect1, rect2):
+    """
+    Whether the bounding Rect of two overlapping or touching rects is their union.
+    """
+
+    (left1, top1), (right1, bottom1) = rect1
+    (left2, top2), (right2, bottom2) = rect2
+    if left1 > right2 or left2 > right1 or top1 > bottom2 or top2 > bottom1:
+        return False
+
+    return ((top1, bottom1) == (top2, bottom2) or (left1, right1) == (left2, right2) or
+            (left1 <= left2 and top1 <= top2 and right1 >= right2 and bottom1 >= bottom2) or
+            (left2 <= left1 and top2 <= top1 and right2 >= right1 and bottom2 >= bottom1))
+
+
+def projection_runs(projection):
+    """
+    Get spans of consecutive non-zero values in a projection of an image,
+    e.g. ranges of rows having any ink.
+
+    :param sequence projection
+    :return list of tuple (start, end)
+    :rtype list
+    """
 
-    yield bounding_box(oneline_rects)
+    runs = []
+    start = None
+    for i, value in enumerate(projection):
+        if value and start is None:
+            start = i
+        elif not value and start is not None:
+            runs.append((start, i))
+            start = None
+    if start is not None:
+        runs.append((start, len(projection)))
+    return runs
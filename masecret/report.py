@@ -0,0 +1,149 @@
+import json
+import time
+import cProfile
+import threading
+
+# Stages of masking an image, in the order they run.
+STAGES = ['decode', 'flatten', 'ocr', 'match', 'draw', 'encode']
+
+
+class StageTimer:
+    """
+    Recorder of time spent in each stage and counts of things processed in
+    masking an image.
+
+    Time of a stage entered more than once, e.g. ocr in coarse-to-fine, is summed up.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.counts = {}
+        self._started = time.perf_counter()
+
+    def stage(self, name):
+        """
+        Measure time of a stage in a with statement.
+
+        param: str name of the stage
+        return: context manager
+        """
+
+        return _Stage(self, name)
+
+    def count(self, name, value):
+        """
+        Add to a count, e.g. number of recognized chars.
+
+        param: str name
+        param: int value
+        """
+
+        self.counts[name] = self.counts.get(name, 0) + value
+
+    def record(self):
+        """
+        Get the recorded time and counts.
+
+        return: dict having keys 'total', 'stages' and 'counts', where times are in seconds
+        rtype: dict
+        """
+
+        return {
+            'total': time.perf_counter() - self._started,
+            'stages': dict(self.stages),
+            'counts': dict(self.counts),
+        }
+
+
+class _Stage:
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+        self.started = None
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        stages = self.timer.stages
+        stages[self.name] = stages.get(self.name, 0.0) + time.perf_counter() - self.started
+
+
+class NullTimer:
+    """
+    Timer recording nothing, which is used when instrumentation is disabled.
+    """
+
+    def stage(self, name):
+        return _NULL_STAGE
+
+    def count(self, name, value):
+        pass
+
+
+class _NullStage:
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+NULL_TIMER = NullTimer()
+
+
+class ReportWriter:
+    """
+    Writer of a report having a JSON object per line.
+    """
+
+    def __init__(self, path):
+        """
+        param: str path of the report file, which is overwritten
+        """
+
+        self.path = path
+        self._file = open(path, 'w', encoding='utf-8')
+        self._lock = threading.Lock()
+
+    def write(self, record):
+        """
+        Write a record in a line. Records are flushed immediately, so that a
+        report of a running batch can be watched.
+
+        param: dict record
+        """
+
+        line = json.dumps(record, sort_keys=True)
+        with self._lock:
+            self._file.write(line + '\n')
+            self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class Profiler:
+    """
+    cProfile profiler of the hot path, which dumps stats to a file readable
+    with pstats every time profiling is stopped.
+    """
+
+    def __init__(self, path):
+        """
+        param: str path to dump stats into
+        """
+
+        self.path = path
+        self._profile = cProfile.Profile()
+
+    def __enter__(self):
+        self._profile.enable()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._profile.disable()
+        self._profile.dump_stats(self.path)
@@ -0,0 +1,413 @@
+import io
+import os
+import sys
+import json
+import base64
+import signal
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+
+from PIL import Image
+
+from masecret.cli import add_masking_arguments, check_masking_args, build_options, image_options
+from masecret.masking import mask_image_frames
+from masecret.watch import ReloadingSecrets
+
+DEFAULT_TIMEOUT = 60.0
+
+DEFAULT_MAX_BODY_SIZE = 32 * 1024 * 1024
+
+_REASONS = {
+    200: 'OK',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    411: 'Length Required',
+    413: 'Payload Too Large',
+    500: 'Internal Server Error',
+    503: 'Service Unavailable',
+    504: 'Gateway Timeout',
+}
+
+
+parser = argparse.ArgumentParser(
+    prog='masecret serve',
+    usage='%(prog)s [options] (--port PORT | --unix PATH)',
+    description='''
+        Serve masking of images over HTTP. POST image bytes to /mask, and the
+        masked image is returned with the rects of secrets in X-Secret-Rects header,
+        or as JSON with ?format=json.''',
+    formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    fromfile_prefix_chars='@')
+parser.add_argument('--host', dest='host', default='127.0.0.1',
+                    help='host to listen on')
+parser.add_argument('--port', dest='port', type=int, default=None,
+                    help='TCP port to listen on')
+parser.add_argument('--unix', dest='unix_path', metavar='PATH', default=None,
+                    help='path of a Unix domain socket to listen on instead of TCP')
+add_masking_arguments(parser)
+parser.add_argument('-j', '--jobs', dest='jobs', type=int, default=1,
+                    help='number of images to mask in parallel')
+parser.add_argument('--queue-size', dest='queue_size', metavar='N', type=int, default=16,
+                    help='number of requests waiting for a job at most. '
+                         'More requests are rejected with 503')
+parser.add_argument('--timeout', dest='timeout', metavar='SECONDS', type=float,
+                    default=DEFAULT_TIMEOUT,
+                    help='time to read a request or to mask an image, after which 504 is returned')
+parser.add_argument('--max-body-size', dest='max_body_size', metavar='MB', type=int,
+                    default=DEFAULT_MAX_BODY_SIZE // (1024 * 1024),
+                    help='maximum size of a request body in megabytes')
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    secrets = ReloadingSecrets(args)
+    try:
+        secrets.get()
+        options = build_options(args, args.jobs)
+    except (OSError, ValueError) as e:
+        print('Failed to start serving: {0}'.format(e), file=sys.stderr)
+        return 1
+
+    server = MaskingServer(secrets.get, options, args.jobs, args.queue_size, args.timeout,
+                           args.max_body_size * 1024 * 1024)
+    # asyncio.run() is not available before Python 3.7.
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        loop.run_until_complete(serve(server, args.host, args.port, args.unix_path))
+    finally:
+        server.close()
+        loop.close()
+
+    return 0
+
+
+def parse_args(args=None):
+    """
+    Parse command line arguments of the serve command.
+
+    param: list args
+    return: parsed arguments
+    rtype: Namespace
+    """
+
+    args = parser.parse_args(args)
+
+    if (args.port is None) == (args.unix_path is None):
+        parser.error('Specify either --port or --unix.')
+
+    if args.jobs < 1:
+        parser.error('JOBS must be a positive integer.')
+
+    if args.queue_size < 0:
+        parser.error('Queue size must not be negative.')
+
+    if args.timeout <= 0:
+        parser.error('Timeout must be positive.')
+
+    check_masking_args(parser, args)
+
+    return args
+
+
+async def serve(server, host=None, port=None, unix_path=None):
+    """
+    Serve until SIGINT or SIGTERM is received.
+
+    param: MaskingServer server
+    param: str host
+    param: int port
+    param: str unix_path
+    """
+
+    if unix_path:
+        listener = await asyncio.start_unix_server(server.handle_connection, path=unix_path)
+    else:
+        listener = await asyncio.start_server(server.handle_connection, host, port)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_event_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+
+    for sock in listener.sockets:
+        print('Serving on {0}'.format(sock.getsockname()), file=sys.stderr)
+
+    try:
+        await stop.wait()
+    finally:
+        listener.close()
+        await listener.wait_closed()
+
+    if unix_path and os.path.exists(unix_path):
+        os.remove(unix_path)
+
+
+class HTTPError(Exception):
+    """
+    Error returned to a client as an HTTP response.
+    """
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class MaskingServer:
+    """
+    Minimal HTTP/1.1 server masking images in memory.
+
+    Images are masked in a pool of jobs threads, sharing the compiled secrets
+    and the OCR backend. When jobs images are being masked and queue_size
+    requests are waiting, further requests are rejected with 503 immediately,
+    so that clients can back off instead of piling up. A request taking more
+    than timeout seconds is answered with 504, though the masking itself
+    cannot be interrupted and keeps its slot until it finishes.
+    """
+
+    def __init__(self, get_secrets, options, jobs=1, queue_size=16, timeout=DEFAULT_TIMEOUT,
+                 max_body_size=DEFAULT_MAX_BODY_SIZE):
+        """
+        param: function get_secrets returning tuple (SecretMatcher, LiteralMatcher or None)
+        param: dict options keyword arguments of mask_image_frames()
+        param: int jobs
+        param: int queue_size
+        param: float timeout seconds
+        param: int max_body_size in bytes
+        """
+
+        self.get_secrets = get_secrets
+        self.options = options
+        self.jobs = jobs
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.max_body_size = max_body_size
+        self.executor = ThreadPoolExecutor(max_workers=jobs)
+        self.in_flight = 0
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+    async def handle_connection(self, reader, writer):
+        """
+        Handle requests in a connection until it is closed.
+        """
+
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(read_request(reader, self.max_body_size),
+                                                     self.timeout)
+                except asyncio.TimeoutError:
+                    break  # Idle or too slow client.
+                except HTTPError as e:
+                    await write_response(writer, *error_response(e.status, e.message),
+                                         keep_alive=False)
+                    break
+
+                if request is None:
+                    break
+
+                method, target, headers, body, keep_alive = request
+                status, response_headers, response_body = await self.handle_request(
+                    method, target, headers, body)
+                await write_response(writer, status, response_headers, response_body, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def handle_request(self, method, target, headers, body):
+        """
+        Handle a request.
+
+        param: str method
+        param: str target
+        param: dict headers whose names are lowercased
+        param: bytes body
+        return: tuple (status, headers, body)
+        rtype: tuple
+        """
+
+        url = urlsplit(target)
+        if url.path == '/health':
+            if method != 'GET':
+                return error_response(405, 'Use GET.')
+            return json_response(200, {'status': 'ok', 'in_flight': self.in_flight})
+
+        if url.path != '/mask':
+            return error_response(404, 'Not found.')
+        if method != 'POST':
+            return error_response(405, 'Use POST.')
+
+        try:
+            data, rects, content_type = await self.mask(body)
+        except HTTPError as e:
+            return error_response(e.status, e.message)
+
+        if parse_qs(url.query).get('format') == ['json']:
+            return json_response(200, {
+                'rects': rects,
+                'content_type': content_type,
+                'image': base64.b64encode(data).decode('ascii'),
+            })
+
+        return 200, {'Content-Type': content_type, 'X-Secret-Rects': json.dumps(rects)}, data
+
+    async def mask(self, data):
+        """
+        Mask secret information in image bytes in the pool of jobs threads.
+
+        param: bytes data
+        return: tuple (masked image bytes, list of secret rects, content type)
+        rtype: tuple
+        raise: HTTPError
+        """
+
+        if self.in_flight >= self.jobs + self.queue_size:
+            raise HTTPError(503, 'Too many requests are being processed.')
+
+        self.in_flight += 1
+        future = asyncio.get_event_loop().run_in_executor(self.executor, self.mask_bytes, data)
+        future.add_done_callback(self._release)
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            raise HTTPError(504, 'Masking the image timed out.')
+        except HTTPError:
+            raise
+        except Exception as e:
+            raise HTTPError(500, '{0}: {1}'.format(type(e).__name__, e))
+
+    def _release(self, future):
+        self.in_flight -= 1
+        if not future.cancelled():
+            future.exception()  # Retrieved, even when the request has timed out.
+
+    def mask_bytes(self, data):
+        """
+        Mask secret information in image bytes.
+
+        The masked image is encoded in the same format as the input, with all
+        its frames. When no secret is found, data is returned as it is without
+        encoding.
+
+        param: bytes data
+        return: tuple (masked image bytes, list of secret rects, content type)
+        rtype: tuple
+        raise: HTTPError if data is not an image
+        """
+
+        try:
+            image = Image.open(io.BytesIO(data))
+            image.load()
+        except Exception as e:
+            raise HTTPError(400, 'Invalid image: {0}'.format(e))
+        image_format = image.format
+
+        secret_res, literal_matcher = self.get_secrets()
+        try:
+            image, rects, frame_params = mask_image_frames(
+                image, secret_res, **dict(image_options(self.options),
+                                          literal_matcher=literal_matcher))
+        finally:
+            if self.options.get('ocr_cache'):
+                self.options['ocr_cache'].clear_memory()
+
+        content_type = Image.MIME.get(image_format, 'application/octet-stream')
+        if not rects:
+            return data, rects, content_type
+
+        output = io.BytesIO()
+        image.save(output, format=image_format,
+                   **dict(self.options.get('save_options') or {}, **frame_params))
+        return output.getvalue(), rects, content_type
+
+
+async def read_request(reader, max_body_size):
+    """
+    Read an HTTP/1.x request.
+
+    param: StreamReader reader
+    param: int max_body_size
+    return: tuple (method, target, headers, body, keep_alive) or None at the end of stream
+    rtype: tuple
+    raise: HTTPError if the request is malformed
+    """
+
+    try:
+        line = await reader.readline()
+        if not line:
+            return None
+
+        parts = line.decode('latin-1').split()
+        if len(parts) != 3 or not parts[2].startswith('HTTP/1.'):
+            raise HTTPError(400, 'Malformed request line.')
+        method, target, version = parts
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+    except ValueError:
+        raise HTTPError(400, 'Too long request line or header.')
+
+    if 'transfer-encoding' in headers:
+        raise HTTPError(411, 'Content-Length is required.')
+
+    try:
+        length = int(headers.get('content-length', '0'))
+    except ValueError:
+        raise HTTPError(400, 'Invalid Content-Length.')
+    if length < 0:
+        raise HTTPError(400, 'Invalid Content-Length.')
+    if length > max_body_size:
+        raise HTTPError(413, 'Request body is larger than {0} bytes.'.format(max_body_size))
+
+    body = await reader.readexactly(length)
+
+    connection = headers.get('connection', '').lower()
+    keep_alive = connection == 'keep-alive' if version == 'HTTP/1.0' else connection != 'close'
+
+    return method, target, headers, body, keep_alive
+
+
+async def write_response(writer, status, headers, body, keep_alive):
+    """
+    Write an HTTP/1.1 response.
+
+    param: StreamWriter writer
+    param: int status
+    param: dict headers
+    param: bytes body
+    param: bool keep_alive
+    """
+
+    lines = ['HTTP/1.1 {0} {1}'.format(status, _REASONS.get(status, ''))]
+    headers = dict(headers, **{'Content-Length': str(len(body)),
+                               'Connection': 'keep-alive' if keep_alive else 'close'})
+    lines.extend('{0}: {1}'.format(name, value) for name, value in headers.items())
+    writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+    await writer.drain()
+
+
+def json_response(status, obj):
+    return status, {'Content-Type': 'application/json'}, json.dumps(obj).encode('utf-8')
+
+
+def error_response(status, message):
+    status, headers, body = json_response(status, {'error': message})
+    if status == 503:
+        headers['Retry-After'] = '1'
+    return status, headers, body
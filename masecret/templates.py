@@ -0,0 +1,257 @@
+import os
+import json
+import hashlib
+import tempfile
+
+from PIL import Image
+
+# Bump this when the format of template files changes.
+TEMPLATE_FORMAT_VERSION = 1
+
+# Width and height of the grid of the perceptual hash, which has HASH_SIZE ** 2 bits.
+HASH_SIZE = 8
+
+# Maximum number of different bits between hashes of an image and a template
+# for the image to match the template strongly.
+MAX_DISTANCE = 6
+
+# Number of images of a layout recognized as a whole before its template is
+# trusted to tell where secrets are.
+MIN_FULL_PASSES = 3
+
+# Every FULL_PASS_INTERVAL-th image of a layout is recognized as a whole, so
+# that secrets in new places are learned, and an image which only looks like
+# the layout is not left unrecognized outside the regions forever.
+FULL_PASS_INTERVAL = 10
+
+# Margin around rows of a region to recognize, which must be larger than the
+# height of a line of text, and absorbs small shifts of the layout.
+REGION_MARGIN = 50
+
+
+class Layout:
+    """
+    Layout of an image and the template it matches.
+    """
+
+    def __init__(self, scope, size, fingerprint, template, bands):
+        """
+        param: str scope digest of patterns returned by template_scope()
+        param: tuple size of the image
+        param: int fingerprint perceptual hash of the image
+        param: dict template matching the image, or None
+        param: list bands list of tuple (top, bottom) to recognize, or None to recognize
+               the whole image
+        """
+
+        self.scope = scope
+        self.size = size
+        self.fingerprint = fingerprint
+        self.template = template
+        self.bands = bands
+
+
+class LayoutTemplates:
+    """
+    Templates of recurring layouts of images, e.g. screenshots of the same
+    application, and rows of them where secrets have been found.
+
+    A layout is identified by the size and a perceptual hash of an image,
+    which mostly reflects static parts of the layout rather than text in it.
+    An image whose hash differs from a template of the same size by at most
+    MAX_DISTANCE bits matches the template strongly. Once a template has
+    learned regions of secrets from MIN_FULL_PASSES images recognized as a
+    whole, only bands around its regions are recognized in images matching
+    it, except every FULL_PASS_INTERVAL-th image. Images matching no template
+    strongly or a template without regions are recognized as a whole, and so
+    are all images when full_pass is True. Every image is learned from.
+
+    Templates are persisted to a file each in directory, so they are shared
+    by processes and runs. An update made concurrently by another process may
+    be lost, which only delays learning.
+    """
+
+    def __init__(self, directory, full_pass=False):
+        """
+        param: str directory
+        param: bool full_pass whether to recognize whole images even if they match a template
+        """
+
+        self.directory = directory
+        self.full_pass = full_pass
+
+    def plan(self, image, scope):
+        """
+        Find the template an image matches and decide which bands of it to recognize.
+
+        param: Image image
+        param: str scope returned by template_scope()
+        return: layout of the image
+        rtype: Layout
+        """
+
+        fingerprint = image_fingerprint(image)
+        template = self._find(scope, image.size, fingerprint)
+        bands = None
+        # Recognizing no band of an image would leave any secret in it unmasked.
+        if template is not None and template['regions'] and \
+                template['full_passes'] >= MIN_FULL_PASSES and \
+                template['images'] % FULL_PASS_INTERVAL != 0 and not self.full_pass:
+            bands = region_bands(template['regions'], image.size[1])
+        return Layout(scope, image.size, fingerprint, template, bands)
+
+    def learn(self, layout, rects):
+        """
+        Record rects of secrets found in an image into the template of its layout.
+
+        param: Layout layout returned by plan()
+        param: list rects of secrets found in the image
+        """
+
+        template = layout.template
+        if template is None:
+            template = {
+                'version': TEMPLATE_FORMAT_VERSION,
+                'size': list(layout.size),
+                'fingerprint': '{0:016x}'.format(layout.fingerprint),
+                'images': 0,
+                'full_passes': 0,
+                'regions': [],
+            }
+
+        template['images'] += 1
+        if layout.bands is None:
+            template['full_passes'] += 1
+        regions = template['regions']
+        for (_, top), (_, bottom) in rects:
+            regions.append([top, bottom, 1])
+        template['regions'] = merge_regions(regions)
+
+        self._write(layout.scope, template)
+
+    def _find(self, scope, size, fingerprint):
+        """
+        Find the template of the same size nearest to a fingerprint.
+
+        return: template or None if no template matches strongly
+        rtype: dict
+        """
+
+        directory = self._directory(scope, size)
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            return None
+
+        best = None
+        best_distance = MAX_DISTANCE + 1
+        for name in names:
+            if not name.endswith('.json'):
+                continue
+            distance = bin(int(name[:-len('.json')], 16) ^ fingerprint).count('1')
+            if distance < best_distance:
+                best, best_distance = name, distance
+
+        if best is None:
+            return None
+
+        try:
+            with open(os.path.join(directory, best), encoding='utf-8') as f:
+                template = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if template.get('version') != TEMPLATE_FORMAT_VERSION:
+            return None
+        return template
+
+    def _write(self, scope, template):
+        directory = self._directory(scope, template['size'])
+        os.makedirs(directory, exist_ok=True)
+        # Write to a temporary file and rename it so that concurrent readers
+        # never see a partially written file.
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(template, f)
+        os.replace(temp_path, os.path.join(directory, template['fingerprint'] + '.json'))
+
+    def _directory(self, scope, size):
+        return os.path.join(self.directory, scope, '{0}x{1}'.format(*size))
+
+
+def template_scope(secret_res, literal_matcher=None):
+    """
+    Get a digest of patterns of secrets, which templates are learned for.
+
+    param: SecretMatcher secret_res
+    param: LiteralMatcher literal_matcher
+    return: hex digest
+    rtype: str
+    """
+
+    patterns = {
+        'regexes': [secret_re.pattern for secret_re in secret_res.secret_res],
+        'literals': literal_matcher.literals if literal_matcher else [],
+    }
+    return hashlib.sha256(json.dumps(patterns, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+def image_fingerprint(image):
+    """
+    Get a perceptual hash (dHash) of an image, comparing average brightness
+    of adjacent cells of a grid laid over the image. A line of text changes
+    the average of a cell little, while panes and bars of a layout do.
+
+    param: Image image
+    return: hash of HASH_SIZE ** 2 bits
+    rtype: int
+    """
+
+    small = image.convert('L').resize((HASH_SIZE + 1, HASH_SIZE), Image.BOX)
+    pixels = small.tobytes()
+    fingerprint = 0
+    for y in range(HASH_SIZE):
+        row = y * (HASH_SIZE + 1)
+        for x in range(HASH_SIZE):
+            fingerprint = fingerprint << 1 | (pixels[row + x] > pixels[row + x + 1])
+    return fingerprint
+
+
+def merge_regions(regions):
+    """
+    Merge regions of overlapping rows, summing up their hits.
+
+    param: list regions list of [top, bottom, hits]
+    return: merged regions in ascending order of top
+    rtype: list
+    """
+
+    merged = []
+    for top, bottom, hits in sorted(regions):
+        if merged and top <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], bottom)
+            merged[-1][2] += hits
+        else:
+            merged.append([top, bottom, hits])
+    return merged
+
+
+def region_bands(regions, height, margin=REGION_MARGIN):
+    """
+    Get bands of an image to recognize around regions of a template.
+
+    param: list regions
+    param: int height of the image
+    param: int margin
+    return: list of tuple (top, bottom) not overlapping each other
+    rtype: list
+    """
+
+    bands = []
+    for top, bottom, _ in regions:
+        top, bottom = max(0, top - margin), min(height, bottom + margin)
+        if bands and top <= bands[-1][1]:
+            bands[-1] = (bands[-1][0], max(bands[-1][1], bottom))
+        else:
+            bands.append((top, bottom))
+    return bands
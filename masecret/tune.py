@@ -0,0 +1,295 @@
+import os
+import sys
+import json
+import time
+import shlex
+import argparse
+
+from PIL import Image, ImageDraw
+from pyocr.tesseract import psm_parameter
+
+from masecret.backends import get_backend
+from masecret.cache import image_digest
+from masecret.cli import (add_masking_arguments, check_masking_args, build_options, image_options,
+                          get_secret_res, get_tesseract_configs)
+from masecret.manifest import read_manifest
+from masecret.masking import find_secret_rects
+from masecret.matching import SecretMatcher
+
+# Page segmentation modes tried by default: fully automatic, a single column
+# of text, a single uniform block of text, and sparse text.
+DEFAULT_PSMS = ['3', '4', '6', '11']
+
+# Parameters combined with each page segmentation mode by default: none, the
+# LSTM engine only, and skipping recognition of inverted text, which is slow.
+DEFAULT_EXTRA_PARAMS = ['', '--oem 1', '-c tessedit_do_invert=0']
+
+# Fraction of an expected rect which must be masked to be recalled.
+MIN_COVERAGE = 0.95
+
+
+tune_parser = argparse.ArgumentParser(
+    prog='masecret tune',
+    usage='%(prog)s [options] MANIFEST -o CONFIG',
+    description='''
+        Find tesseract parameters for your images. Candidate parameters are
+        run over the images in MANIFEST, whose rects are the expected secrets,
+        e.g. written by masecret detect and corrected by hand. Latency and
+        recall of each candidate are measured, and the fastest of the
+        Pareto-optimal candidates reaching --min-recall is written into
+        CONFIG, which can be given to masecret as @CONFIG.''',
+    formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    fromfile_prefix_chars='@')
+tune_parser.add_argument('manifest_path', metavar='MANIFEST',
+                         help='manifest of images and expected rects of secrets')
+tune_parser.add_argument('-o', '--output', dest='config_path', metavar='CONFIG', required=True,
+                         help='file to write the selected options into')
+add_masking_arguments(tune_parser)
+tune_parser.add_argument('--candidate', dest='candidates', metavar='PARAMS', action='append',
+                         default=None,
+                         help='tesseract parameters to try, can be repeated. Defaults to '
+                              'combinations of page segmentation modes {0} and {1}, '
+                              'in addition to --tesseract-params'.format(
+                                  ', '.join(DEFAULT_PSMS),
+                                  ', '.join(repr(p) for p in DEFAULT_EXTRA_PARAMS)))
+tune_parser.add_argument('--min-recall', dest='min_recall', type=float, default=None,
+                         help='minimum recall of the selected candidate. '
+                              'Defaults to the best recall of the candidates')
+tune_parser.add_argument('--results', dest='results_path', metavar='FILE', default=None,
+                         help='write latency and recall of all the candidates into FILE as JSON')
+
+
+def tune_main(argv=None):
+    args = parse_tune_args(argv)
+
+    try:
+        manifest = read_manifest(args.manifest_path)
+    except (OSError, ValueError) as e:
+        print('Failed to read manifest: {0}'.format(e), file=sys.stderr)
+        return 1
+
+    secret_res = SecretMatcher(get_secret_res(args))
+    try:
+        options = image_options(build_options(args, 1))
+    except OSError as e:
+        print('Failed to load OCR backend: {0}'.format(e), file=sys.stderr)
+        return 1
+    del options['fill_color']
+    # Cached results would make later candidates look faster, and learned
+    # layouts would make them recognize less.
+    options['ocr_cache'] = None
+    options['layout_templates'] = None
+
+    try:
+        corpus = load_corpus(manifest, os.path.dirname(os.path.abspath(args.manifest_path)))
+    except (OSError, ValueError) as e:
+        print('Failed to load images: {0}'.format(e), file=sys.stderr)
+        return 1
+
+    results = []
+    for params in candidate_params(args):
+        try:
+            result = evaluate(corpus, secret_res, dict(options, tesseract_configs=shlex.split(params)))
+        except Exception as e:
+            print('Failed to evaluate {0!r}: {1}: {2}'.format(params, type(e).__name__, e),
+                  file=sys.stderr)
+            continue
+        result['params'] = params
+        results.append(result)
+        print('{0:40} {1:8.1f} ms/image  recall {2:.3f}'.format(
+            params, result['latency'] * 1000, result['recall']), file=sys.stderr)
+
+    if not results:
+        print('No candidate succeeded', file=sys.stderr)
+        return 1
+
+    front = pareto_front(results)
+    for result in results:
+        result['pareto'] = result in front
+    selected = select(front, args.min_recall)
+
+    print('Pareto-optimal: {0}'.format(', '.join(repr(r['params']) for r in front)),
+          file=sys.stderr)
+    print('Selected {0!r}: {1:.1f} ms/image, recall {2:.3f}'.format(
+        selected['params'], selected['latency'] * 1000, selected['recall']), file=sys.stderr)
+
+    write_config(args.config_path, selected)
+    print('Saved to {0}'.format(args.config_path), file=sys.stderr)
+
+    if args.results_path:
+        with open(args.results_path, 'w', encoding='utf-8') as f:
+            json.dump({'results': results, 'selected': selected['params']}, f, indent=2)
+            f.write('\n')
+
+    return 0
+
+
+def parse_tune_args(args=None):
+    """
+    Parse command line arguments of the tune command.
+
+    param: list args
+    return: parsed arguments
+    rtype: Namespace
+    """
+
+    args = tune_parser.parse_args(args)
+
+    if args.min_recall is not None and not 0 <= args.min_recall <= 1:
+        tune_parser.error('Minimum recall must be between 0 and 1.')
+
+    check_masking_args(tune_parser, args)
+
+    return args
+
+
+def candidate_params(args):
+    """
+    Get tesseract parameters to try.
+
+    param: Namespace args
+    return: list of parameters in the format of --tesseract-params
+    rtype: list
+    """
+
+    if args.candidates:
+        return args.candidates
+
+    backend = get_backend(args.ocr_backend)
+    tesseract_configs = get_tesseract_configs(args)
+    if tesseract_configs is None:
+        tesseract_configs = backend.default_configs()
+    # Only the tesseract command of an old version needs -psm instead of --psm.
+    psm_option = psm_parameter() if backend.name == 'pyocr' else '--psm'
+    candidates = [' '.join(tesseract_configs)]
+    for psm in DEFAULT_PSMS:
+        for extra_params in DEFAULT_EXTRA_PARAMS:
+            params = ' '.join([psm_option, psm, extra_params, 'makebox']).replace('  ', ' ')
+            if params not in candidates:
+                candidates.append(params)
+    return candidates
+
+
+def load_corpus(manifest, manifest_dir):
+    """
+    Load images and expected rects in a manifest.
+
+    param: dict manifest
+    param: str manifest_dir directory paths in the manifest are relative to
+    return: list of tuple (path, Image, list of expected rects)
+    rtype: list
+    raise: ValueError if an image has been changed since the manifest was written
+    """
+
+    corpus = []
+    for entry in manifest['images']:
+        path = os.path.join(manifest_dir, entry['path'])
+        image = Image.open(path)
+        image.load()
+        if list(image.size) != entry['size'] or image_digest(image) != entry['digest']:
+            raise ValueError('{0} has been changed since it was labeled'.format(path))
+        rects = [tuple(tuple(position) for position in rect) for rect in entry['rects']]
+        corpus.append((path, image, rects))
+
+    return corpus
+
+
+def evaluate(corpus, secret_res, options):
+    """
+    Measure latency and recall of finding secrets in images.
+
+    The first image is processed once before measuring, so that loading a
+    language model or starting a handle is not counted as latency.
+
+    param: list corpus returned by load_corpus()
+    param: SecretMatcher secret_res
+    param: dict options keyword arguments of find_secret_rects()
+    return: dict having keys 'latency' in seconds per image, 'recall', 'recalled' and 'expected'
+    rtype: dict
+    """
+
+    elapsed = 0.0
+    recalled = 0
+    expected = 0
+    if corpus:
+        find_secret_rects(corpus[0][1], secret_res, **options)
+    for _, image, expected_rects in corpus:
+        start = time.perf_counter()
+        rects = find_secret_rects(image, secret_res, **options)
+        elapsed += time.perf_counter() - start
+
+        expected += len(expected_rects)
+        recalled += sum(1 for rect in expected_rects if coverage(rect, rects) >= MIN_COVERAGE)
+
+    return {
+        'latency': elapsed / len(corpus) if corpus else 0.0,
+        'recall': recalled / expected if expected else 1.0,
+        'recalled': recalled,
+        'expected': expected,
+    }
+
+
+def coverage(rect, found_rects):
+    """
+    Get the fraction of a rect covered by found rects.
+
+    param: Rect rect
+    param: list found_rects
+    return: fraction from 0 to 1
+    rtype: float
+    """
+
+    (left, top), (right, bottom) = rect
+    mask = Image.new('1', (right - left, bottom - top), 0)
+    draw = ImageDraw.Draw(mask)
+    for (found_left, found_top), (found_right, found_bottom) in found_rects:
+        draw.rectangle(((found_left - left, found_top - top),
+                        (found_right - left, found_bottom - top)), fill=1)
+    area = mask.size[0] * mask.size[1]
+    return mask.histogram()[1] / area if area else 1.0
+
+
+def pareto_front(results):
+    """
+    Get results which no other result beats in both latency and recall.
+
+    param: list results
+    return: Pareto-optimal results in ascending order of latency
+    rtype: list
+    """
+
+    front = []
+    for result in sorted(results, key=lambda r: (r['latency'], -r['recall'])):
+        if not front or result['recall'] > front[-1]['recall']:
+            front.append(result)
+    return front
+
+
+def select(front, min_recall=None):
+    """
+    Select the fastest result reaching min_recall from a Pareto front.
+
+    param: list front returned by pareto_front()
+    param: float min_recall or None for the best recall in front
+    return: result
+    rtype: dict
+    """
+
+    if min_recall is None:
+        return front[-1]
+    for result in front:
+        if result['recall'] >= min_recall:
+            return result
+    return front[-1]
+
+
+def write_config(path, result):
+    """
+    Write options of a result into a file, which can be given to masecret as @path.
+
+    param: str path
+    param: dict result
+    """
+
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('--tesseract-params={0}\n'.format(result['params']))
@@ -0,0 +1,462 @@
+import os
+import sys
+import time
+import errno
+import ctypes
+import ctypes.util
+import select
+import signal
+import struct
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from masecret.cli import (add_masking_arguments, check_masking_args, build_options, get_secret_res,
+                          get_literal_matcher)
+from masecret.masking import mask_secrets_safely
+from masecret.matching import SecretMatcher
+
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tif', '.tiff', '.webp'}
+
+# Flags of inotify. See: man 7 inotify
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_Q_OVERFLOW = 0x00004000
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+
+# struct inotify_event { int wd; uint32_t mask; uint32_t cookie; uint32_t len; char name[]; }
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+parser = argparse.ArgumentParser(
+    prog='masecret watch',
+    usage='%(prog)s [options] DIR -o OUTPUT_DIR',
+    description='''
+        Watch a directory, and mask secret information in image files
+        put into it. Masked images are saved into OUTPUT_DIR with the same names.''',
+    formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    fromfile_prefix_chars='@')
+parser.add_argument('directory', metavar='DIR',
+                    help='directory to watch')
+parser.add_argument('-o', '--output', dest='output_dir', metavar='OUTPUT_DIR', required=True,
+                    help='directory to save masked images into')
+add_masking_arguments(parser)
+parser.add_argument('-j', '--jobs', dest='jobs', type=int, default=1,
+                    help='number of images to mask in parallel')
+parser.add_argument('--queue-size', dest='queue_size', metavar='N', type=int, default=16,
+                    help='number of images waiting for a job at most. '
+                         'Watching is paused while the queue is full')
+parser.add_argument('--debounce', dest='debounce', metavar='SECONDS', type=float, default=1.0,
+                    help='time a file must stay unchanged before it is masked, '
+                         'so that partially written files are not masked')
+parser.add_argument('--poll-interval', dest='poll_interval', metavar='SECONDS', type=float,
+                    default=0.5,
+                    help='interval of checking the directory')
+parser.add_argument('--polling', dest='polling', action='store_true', default=False,
+                    help='scan the directory periodically instead of using inotify')
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    secrets = ReloadingSecrets(args)
+    try:
+        secrets.get()
+        options = build_options(args, args.jobs)
+    except (OSError, ValueError) as e:
+        print('Failed to start watching: {0}'.format(e), file=sys.stderr)
+        return 1
+
+    ocr_cache = options['ocr_cache']
+
+    def handle(input_path):
+        output_path = os.path.join(args.output_dir, os.path.basename(input_path))
+        if not needs_masking(input_path, output_path):
+            return
+
+        secret_res, literal_matcher = secrets.get()
+        _, log, error = mask_secrets_safely(input_path, output_path, secret_res,
+                                            dict(options, literal_matcher=literal_matcher),
+                                            capture_log=True)
+        # Reused images are rare in an inbox, so do not keep results in memory.
+        ocr_cache.clear_memory()
+
+        sys.stderr.write(log)
+        if error:
+            print('Failed to process {0}: {1}'.format(input_path, error), file=sys.stderr)
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+
+    watcher = create_watcher(args.directory, args.poll_interval, args.polling)
+    print('Watching {0}...'.format(args.directory), file=sys.stderr)
+    try:
+        watch(watcher, handle, args.debounce, args.poll_interval, args.jobs, args.queue_size, stop)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+
+    return 0
+
+
+def parse_args(args=None):
+    """
+    Parse command line arguments of the watch command.
+
+    param: list args
+    return: parsed arguments
+    rtype: Namespace
+    """
+
+    args = parser.parse_args(args)
+
+    if not os.path.isdir(args.directory):
+        parser.error('DIR must be a directory.')
+
+    if not os.path.isdir(args.output_dir):
+        parser.error('OUTPUT_DIR must be a directory.')
+
+    if os.path.realpath(args.directory) == os.path.realpath(args.output_dir):
+        parser.error('OUTPUT_DIR must be different from DIR.')
+
+    if args.jobs < 1:
+        parser.error('JOBS must be a positive integer.')
+
+    if args.queue_size < 0:
+        parser.error('Queue size must not be negative.')
+
+    check_masking_args(parser, args)
+
+    return args
+
+
+def watch(watcher, handler, debounce, poll_interval, jobs, queue_size, stop):
+    """
+    Call handler with files in a watched directory once they are completely written.
+
+    Files are handled by a pool of jobs threads. When jobs + queue_size files
+    are being handled or waiting, watching is paused until a job is done.
+
+    param: PollingWatcher or InotifyWatcher watcher
+    param: function handler called with a path of a file
+    param: float debounce seconds a file must stay unchanged
+    param: float poll_interval seconds to wait for changes at a time
+    param: int jobs
+    param: int queue_size
+    param: Event stop event to stop watching
+    """
+
+    inbox = Inbox(debounce)
+    slots = threading.BoundedSemaphore(jobs + queue_size)
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        while not stop.is_set():
+            now = time.monotonic()
+            for path in watcher.wait(poll_interval):
+                if is_image_path(path):
+                    inbox.add(path, now)
+
+            for path in inbox.pop_ready(time.monotonic()):
+                slots.acquire()
+                future = executor.submit(handler, path)
+                future.add_done_callback(lambda future: slots.release())
+
+
+class Inbox:
+    """
+    Files which are being written into a watched directory.
+
+    A file is ready when its size and modification time have not changed for
+    debounce seconds. A file which is ready once is not ready again until it
+    is changed.
+    """
+
+    def __init__(self, debounce):
+        """
+        param: float debounce seconds
+        """
+
+        self.debounce = debounce
+        self._pending = {}  # path -> (signature, time when the signature was seen first)
+        self._done = {}  # path -> signature when it got ready
+
+    def add(self, path, now):
+        """
+        Add a file which may have been changed.
+
+        param: str path
+        param: float now
+        """
+
+        if path not in self._pending:
+            self._pending[path] = (None, now)
+
+    def pop_ready(self, now):
+        """
+        Remove ready files from the inbox.
+
+        param: float now
+        return: list of paths
+        rtype: list
+        """
+
+        ready = []
+        for path, (signature, since) in list(self._pending.items()):
+            current = _signature(path)
+            if current is None:
+                del self._pending[path]  # Removed or renamed.
+                self._done.pop(path, None)
+            elif current != signature:
+                self._pending[path] = (current, now)
+            elif now - since >= self.debounce:
+                del self._pending[path]
+                if self._done.get(path) != current:
+                    self._done[path] = current
+                    ready.append(path)
+
+        return ready
+
+
+class PollingWatcher:
+    """
+    Watcher finding changed files by scanning a directory periodically.
+    """
+
+    def __init__(self, directory):
+        """
+        param: str directory
+        """
+
+        self.directory = directory
+        self._signatures = None
+
+    def wait(self, timeout):
+        """
+        Wait for files to be changed.
+
+        All the files in the directory are returned at the first call.
+
+        param: float timeout seconds
+        return: list of paths which may have been changed
+        rtype: list
+        """
+
+        if self._signatures is not None:
+            time.sleep(timeout)
+
+        signatures = {path: _signature(path) for path in list_files(self.directory)}
+        previous = self._signatures or {}
+        self._signatures = signatures
+        return [path for path, signature in signatures.items()
+                if previous.get(path) != signature]
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """
+    Watcher notified of changed files by Linux's inotify.
+    """
+
+    def __init__(self, directory):
+        """
+        param: str directory
+        raise: OSError if inotify is not available
+        """
+
+        self.directory = directory
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError(errno.ENOSYS, 'inotify is not available')
+
+        self._fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+
+        mask = _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE
+        if libc.inotify_add_watch(self._fd, os.fsencode(directory), mask) < 0:
+            error = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(error, 'inotify_add_watch failed', directory)
+
+        self._first = True
+
+    def wait(self, timeout):
+        """
+        Wait for files to be changed.
+
+        All the files in the directory are returned at the first call, and when
+        events are lost because of an overflow of the event queue.
+
+        param: float timeout seconds
+        return: list of paths which may have been changed
+        rtype: list
+        """
+
+        if self._first:
+            self._first = False
+            return list_files(self.directory)
+
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return []
+
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        paths = []
+        offset = 0
+        while offset < len(data):
+            _, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+
+            if mask & _IN_Q_OVERFLOW:
+                return list_files(self.directory)
+            if name:
+                path = os.path.join(self.directory, os.fsdecode(name))
+                if path not in paths:
+                    paths.append(path)
+
+        return paths
+
+    def close(self):
+        os.close(self._fd)
+
+
+def create_watcher(directory, poll_interval, polling=False):
+    """
+    Create a watcher of a directory, which uses inotify if available.
+
+    param: str directory
+    param: float poll_interval
+    param: bool polling whether to scan the directory instead of using inotify
+    return: watcher
+    rtype: InotifyWatcher or PollingWatcher
+    """
+
+    if not polling and sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(directory)
+        except OSError as e:
+            print('Failed to use inotify, falling back to polling: {0}'.format(e),
+                  file=sys.stderr)
+
+    return PollingWatcher(directory)
+
+
+class ReloadingSecrets:
+    """
+    Secret regexes and literals which are reloaded when their files are changed.
+    """
+
+    def __init__(self, args):
+        """
+        param: Namespace args
+        """
+
+        self.args = args
+        self._paths = [path for path in [None if args.regex else args.secret_path,
+                                         args.literals_path] if path]
+        self._mtimes = None
+        self._secrets = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """
+        Get the current secrets, reloading them if their files have been changed.
+
+        When reloading fails, e.g. because of an invalid regex, the previous
+        secrets are kept.
+
+        return: tuple (SecretMatcher, LiteralMatcher or None)
+        rtype: tuple
+        raise: OSError or ValueError if the secrets cannot be loaded at first
+        """
+
+        with self._lock:
+            mtimes = [_mtime(path) for path in self._paths]
+            if mtimes == self._mtimes:
+                return self._secrets
+
+            try:
+                secrets = (SecretMatcher(get_secret_res(self.args)),
+                           get_literal_matcher(self.args))
+            except Exception as e:
+                if self._secrets is None:
+                    raise ValueError('Failed to load secrets: {0}'.format(e))
+                print('Failed to reload secrets, keeping previous ones: {0}'.format(e),
+                      file=sys.stderr)
+            else:
+                if self._secrets is not None:
+                    print('Reloaded secrets', file=sys.stderr)
+                self._secrets = secrets
+
+            self._mtimes = mtimes
+            return self._secrets
+
+
+def needs_masking(input_path, output_path):
+    """
+    Whether an input has not been masked since it was changed.
+
+    param: str input_path
+    param: str output_path
+    rtype: bool
+    """
+
+    try:
+        return os.path.getmtime(output_path) < os.path.getmtime(input_path)
+    except OSError:
+        return True
+
+
+def is_image_path(path):
+    """
+    Whether a path looks like an image file, excluding hidden files, which
+    are often temporary files being written.
+
+    param: str path
+    rtype: bool
+    """
+
+    name = os.path.basename(path)
+    return not name.startswith('.') and os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+
+
+def list_files(directory):
+    """
+    List regular files directly in a directory.
+
+    param: str directory
+    return: list of paths
+    rtype: list
+    """
+
+    try:
+        return [entry.path for entry in os.scandir(directory) if entry.is_file()]
+    except OSError:
+        return []
+
+
+def _signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
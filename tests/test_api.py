@@ -0,0 +1,111 @@
+import unittest
+
+import io
+
+from PIL import Image
+
+from masecret.api import Masker, MaskResult, Secret, open_image
+from masecret.backends import FakeBackend, draw_fake_text
+
+
+def fake_image():
+    image = Image.new('RGB', (300, 70), (255, 255, 255))
+    draw_fake_text(image, (10, 10), 'ID 1234-5678-9012')
+    draw_fake_text(image, (10, 40), 'host db01')
+    return image
+
+
+def fake_animation():
+    frames = [Image.new('RGB', (300, 40), (255, 255, 255)) for _ in range(2)]
+    draw_fake_text(frames[1], (10, 10), 'ID 1234-5678-9012')
+    output = io.BytesIO()
+    frames[0].save(output, format='GIF', save_all=True, append_images=frames[1:],
+                   duration=[100, 200])
+    return output.getvalue()
+
+
+def encode(image, format='PNG'):
+    output = io.BytesIO()
+    image.save(output, format=format)
+    return output.getvalue()
+
+
+class TestMasker(unittest.TestCase):
+
+    def setUp(self):
+        self.masker = Masker([r'[-\d]{12,}'], literals=['db01'], fill_color=(255, 0, 255),
+                             ocr_backend=FakeBackend())
+
+    def test_find(self):
+        self.assertEqual(self.masker.find(encode(fake_image())), [
+            Secret('1234-5678-9012', r'[-\d]{12,}', [((44, 8), (214, 32))]),
+            Secret('db01', 'db01', [((68, 38), (118, 62))]),
+        ])
+
+    def test_mask_image(self):
+        image = fake_image()
+        result = self.masker.mask(image)
+
+        self.assertIsInstance(result, MaskResult)
+        self.assertEqual(result.rects, [((44, 8), (214, 32)), ((68, 38), (118, 62))])
+        self.assertEqual(result.image.getpixel((100, 20)), (255, 0, 255))
+        self.assertNotEqual(image.getpixel((100, 20)), (255, 0, 255))
+
+        self.masker.mask(image, in_place=True)
+        self.assertEqual(image.getpixel((100, 20)), (255, 0, 255))
+
+    def test_mask_bytes(self):
+        data, secrets = self.masker.mask_bytes(io.BytesIO(encode(fake_image(), 'BMP')))
+
+        self.assertEqual(len(secrets), 2)
+        image = Image.open(io.BytesIO(data))
+        self.assertEqual(image.format, 'BMP')
+        self.assertEqual(image.getpixel((80, 50)), (255, 0, 255))
+
+        data, _ = self.masker.mask_bytes(fake_image(), format='PNG', optimize=True)
+        self.assertEqual(Image.open(io.BytesIO(data)).format, 'PNG')
+
+    def test_multi_frame(self):
+        data, secrets = self.masker.mask_bytes(fake_animation())
+
+        self.assertEqual(secrets, [
+            Secret('1234-5678-9012', r'[-\d]{12,}', [((44, 8), (214, 32))], frame=1),
+        ])
+        self.assertEqual(self.masker.find(fake_animation()), secrets)
+        image = Image.open(io.BytesIO(data))
+        self.assertEqual(image.format, 'GIF')
+        self.assertEqual(image.n_frames, 2)
+        pixels = []
+        for i in range(2):
+            image.seek(i)
+            pixels.append((image.convert('RGB').getpixel((100, 20)), image.info['duration']))
+        self.assertEqual(pixels, [((255, 255, 255), 100), ((255, 0, 255), 200)])
+
+    def test_to_dict(self):
+        secret = Secret('db01', 'db01', [((68, 38), (118, 62))])
+        self.assertEqual(secret.to_dict(), {'text': 'db01', 'pattern': 'db01',
+                                            'rects': [[[68, 38], [118, 62]]], 'frame': 0})
+
+    def test_no_secrets(self):
+        with self.assertRaises(ValueError):
+            Masker([], literals=[''], ocr_backend=FakeBackend())
+
+
+class TestOpenImage(unittest.TestCase):
+
+    def test_open_image(self):
+        image, image_format = open_image(encode(fake_image()))
+        self.assertEqual(image.size, (300, 70))
+        self.assertEqual(image_format, 'PNG')
+
+        image = fake_image()
+        self.assertEqual(open_image(image), (image, None))
+
+        with self.assertRaises(TypeError):
+            open_image('/path/to/image.png')
+        with self.assertRaises(OSError):
+            open_image(b'not an image')
+
+
+if __name__ == '__main__':
+    unittest.main()
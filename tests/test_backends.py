@@ -0,0 +1,121 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+import ctypes
+
+from PIL import Image
+
+from masecret.backends import (FakeBackend, LibTesseractBackend, PyOCRBackend, draw_fake_text,
+                               get_backend, _create_backend, _parse_tesseract_configs)
+
+
+class TestFakeBackend(unittest.TestCase):
+
+    def setUp(self):
+        self.image = Image.new('RGB', (200, 100), (255, 255, 255))
+        self.rects = draw_fake_text(self.image, (10, 10), 'ID 12')
+        self.rects += draw_fake_text(self.image, (10, 50), 'Ωx')
+
+    def test_recognize(self):
+        boxes = FakeBackend().image_to_char_boxes(self.image, 'eng', [])
+
+        self.assertEqual(boxes.content, 'ID12Ωx')
+        self.assertEqual(list(boxes.rects()), self.rects)
+
+    def test_cropped(self):
+        image = self.image.crop((0, 40, 200, 100))
+
+        boxes = FakeBackend().image_to_char_boxes(image, 'eng', [])
+
+        self.assertEqual(boxes.content, 'Ωx')
+        self.assertEqual(list(boxes.rects()), [((10, 10), (20, 30)), ((22, 10), (32, 30))])
+
+
+class TestLibTesseractBackend(unittest.TestCase):
+
+    def setUp(self):
+        self.box_text = ctypes.create_string_buffer(b'A 1 2 5 8 0\n')
+        self.lib = MagicMock()
+        self.lib.TessBaseAPIInit1.return_value = 0
+        self.lib.TessBaseAPIRecognize.return_value = 0
+        self.lib.TessBaseAPIGetBoxText.return_value = ctypes.addressof(self.box_text)
+
+        with patch('masecret.backends._load_libtesseract', return_value=self.lib):
+            self.backend = LibTesseractBackend()
+
+    def test_recognize(self):
+        image = Image.new('RGBA', (20, 10))
+
+        boxes = self.backend.image_to_char_boxes(image, 'eng', ['--psm', '6', 'makebox'])
+
+        self.assertEqual(boxes.content, 'A')
+        self.assertEqual(list(boxes.rects()), [((1, 2), (5, 8))])
+        self.lib.TessBaseAPISetPageSegMode.assert_called_once_with(self.lib.TessBaseAPICreate(), 6)
+        args = self.lib.TessBaseAPISetImage.call_args[0]
+        self.assertEqual(args[2:], (20, 10, 3, 60))
+        self.lib.TessDeleteText.assert_called_once_with(ctypes.addressof(self.box_text))
+
+    def test_handle_reused(self):
+        image = Image.new('L', (20, 10))
+
+        self.backend.image_to_char_boxes(image, 'eng', ['makebox'])
+        self.backend.image_to_char_boxes(image, 'eng', ['makebox'])
+        self.backend.image_to_char_boxes(image, 'jpn', ['makebox'])
+
+        self.assertEqual(self.lib.TessBaseAPIInit1.call_count, 2)
+
+    def test_psm_reset_on_reused_handle(self):
+        image = Image.new('L', (20, 10))
+
+        self.backend.image_to_char_boxes(image, 'eng', ['--psm', '6'])
+        self.backend.image_to_char_boxes(image, 'eng', [])
+        self.backend.image_to_char_boxes(image, 'eng', ['--psm', '7'])
+        self.backend.image_to_char_boxes(image, 'eng', [])
+
+        self.assertEqual(self.lib.TessBaseAPIInit1.call_count, 1)
+        modes = [args[0][1] for args in self.lib.TessBaseAPISetPageSegMode.call_args_list]
+        self.assertEqual(modes, [6, 3, 7, 3])
+
+    def test_init_failure(self):
+        self.lib.TessBaseAPIInit1.return_value = -1
+
+        with self.assertRaises(Exception):
+            self.backend.image_to_char_boxes(Image.new('L', (20, 10)), 'xxx', [])
+        self.lib.TessBaseAPIDelete.assert_called_once_with(self.lib.TessBaseAPICreate())
+
+
+class TestGetBackend(unittest.TestCase):
+
+    def test_shared(self):
+        self.assertIs(get_backend('pyocr'), get_backend('pyocr'))
+
+    def test_unknown(self):
+        # The fake backend is only given as an instance, e.g. in tests.
+        with self.assertRaises(ValueError):
+            get_backend('fake')
+
+    def test_instance(self):
+        backend = FakeBackend()
+        self.assertIs(get_backend(backend), backend)
+
+    def test_auto_fallback(self):
+        with patch('masecret.backends._load_libtesseract', side_effect=OSError):
+            self.assertIsInstance(_create_backend('auto'), PyOCRBackend)
+
+    def test_unknown(self):
+        with self.assertRaises(ValueError):
+            _create_backend('unknown')
+
+
+class TestParseTesseractConfigs(unittest.TestCase):
+
+    def test_parse(self):
+        self.assertEqual(
+            _parse_tesseract_configs(['-psm', '6', 'makebox', '-c', 'a=b', 'digits']),
+            (6, 3, [('a', 'b')], ['digits']))
+        self.assertEqual(_parse_tesseract_configs(['--psm', '4', '--oem', '1']), (4, 1, [], []))
+        self.assertEqual(_parse_tesseract_configs(['makebox']), (3, 3, [], []))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+from unittest.mock import patch
+
+import io
+
+from masecret.builders import CharBoxTable, ModifiedCharBoxBuilder
+
+
+class TestCharBoxTable(unittest.TestCase):
+
+    def setUp(self):
+        self.table = CharBoxTable('AB1', [0, 10, 20], [5, 5, 6], [10, 20, 30], [25, 25, 24])
+
+    def test_len(self):
+        self.assertEqual(len(self.table), 3)
+
+    def test_rects(self):
+        self.assertEqual(list(self.table.rects()),
+                         [((0, 5), (10, 25)), ((10, 5), (20, 25)), ((20, 6), (30, 24))])
+
+    def test_iter(self):
+        self.assertEqual(list(self.table)[0], ('A', ((0, 5), (10, 25))))
+
+    def test_slice(self):
+        self.assertEqual(self.table[1:3],
+                         CharBoxTable('B1', [10, 20], [5, 6], [20, 30], [25, 24]))
+
+    def test_scaled(self):
+        self.assertEqual(self.table.scaled(0.5),
+                         CharBoxTable('AB1', [0, 5, 10], [2, 2, 3], [5, 10, 15], [13, 13, 12]))
+
+
+@patch('masecret.builders.psm_parameter', return_value='--psm')
+class TestModifiedCharBoxBuilder(unittest.TestCase):
+
+    def test_tesseract_configs(self, psm_parameter):
+        builder = ModifiedCharBoxBuilder(100)
+        self.assertEqual(builder.tesseract_configs, ['--psm', '6', 'makebox'])
+
+    def test_read_file(self, psm_parameter):
+        builder = ModifiedCharBoxBuilder(100)
+        box_file = io.StringIO('A 10 70 20 90 0\n'
+                               '\n'
+                               'fi 20 70 32 92 0\n')
+
+        table = builder.read_file(box_file)
+
+        self.assertEqual(table.content, 'Afi')
+        self.assertEqual(list(table.rects()),
+                         [((10, 10), (20, 30)), ((20, 8), (32, 30)), ((20, 8), (32, 30))])
+
+    def test_read_pages(self, psm_parameter):
+        builder = ModifiedCharBoxBuilder(0)
+        box_file = io.StringIO('A 10 70 20 90 0\n'
+                               'B 10 10 20 30 2\n')
+
+        tables = builder.read_pages(box_file, [100, 50, 40])
+
+        self.assertEqual([table.content for table in tables], ['A', '', 'B'])
+        self.assertEqual(list(tables[0].rects()), [((10, 10), (20, 30))])
+        self.assertEqual(list(tables[2].rects()), [((10, 10), (20, 30))])
+
+
+if __name__ == '__main__':
+    unittest.main()
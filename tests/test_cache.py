@@ -0,0 +1,92 @@
+import unittest
+
+import os
+import tempfile
+
+from PIL import Image
+
+from masecret.builders import CharBoxTable
+from masecret.cache import OCRCache, image_digest
+
+
+class TestImageDigest(unittest.TestCase):
+
+    def test_same_pixels(self):
+        image1 = Image.new('RGB', (10, 10), (255, 255, 255))
+        image2 = Image.new('RGB', (10, 10), (255, 255, 255))
+        self.assertEqual(image_digest(image1), image_digest(image2))
+
+    def test_different_pixels(self):
+        image1 = Image.new('RGB', (10, 10), (255, 255, 255))
+        image2 = Image.new('RGB', (10, 10), (255, 255, 254))
+        self.assertNotEqual(image_digest(image1), image_digest(image2))
+
+    def test_different_sizes(self):
+        image1 = Image.new('RGB', (10, 20), (255, 255, 255))
+        image2 = Image.new('RGB', (20, 10), (255, 255, 255))
+        self.assertNotEqual(image_digest(image1), image_digest(image2))
+
+
+class TestOCRCache(unittest.TestCase):
+
+    def setUp(self):
+        self.image = Image.new('RGB', (10, 10), (255, 255, 255))
+        self.boxes = CharBoxTable('A1', [1, 5], [2, 6], [3, 7], [4, 8])
+
+    def test_key(self):
+        cache = OCRCache()
+        key = cache.key(self.image, 'eng', ['-psm', '6', 'makebox'])
+        self.assertEqual(key, cache.key(self.image, 'eng', ['-psm', '6', 'makebox']))
+        self.assertNotEqual(key, cache.key(self.image, 'jpn', ['-psm', '6', 'makebox']))
+        self.assertNotEqual(key, cache.key(self.image, 'eng', ['-psm', '3', 'makebox']))
+
+    def test_memory(self):
+        cache = OCRCache()
+        self.assertIsNone(cache.get('key'))
+        cache.put('key', self.boxes)
+        self.assertIs(cache.get('key'), self.boxes)
+        cache.clear_memory()
+        self.assertIsNone(cache.get('key'))
+
+    def test_directory(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            OCRCache(tempdir).put('abcdef', self.boxes)
+
+            boxes = OCRCache(tempdir).get('abcdef')
+
+            self.assertEqual(boxes, self.boxes)
+
+    def test_decision(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            decision = {'whole': False, 'lines': [[10, 30]]}
+            OCRCache(tempdir).put_decision('abcdef', decision)
+
+            self.assertEqual(OCRCache(tempdir).get_decision('abcdef'), decision)
+            self.assertIsNone(OCRCache(tempdir).get_decision('abcdeg'))
+
+    def test_evict(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            cache = OCRCache(tempdir)
+            cache.put('aa1', self.boxes)
+            path = os.path.join(tempdir, 'aa', 'aa1.json')
+            os.utime(path, (0, 0))
+            # Only one file fits in the cache.
+            cache.max_size = os.path.getsize(path) * 3 // 2
+            cache.put('bb1', self.boxes)
+            cache.clear_memory()
+
+            self.assertIsNone(cache.get('aa1'))
+            self.assertIsNotNone(cache.get('bb1'))
+
+    def test_overwrite(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            cache = OCRCache(tempdir)
+            for _ in range(3):
+                cache.put('aa1', self.boxes)
+
+            path = os.path.join(tempdir, 'aa', 'aa1.json')
+            self.assertEqual(cache._total_size, os.path.getsize(path))
+
+
+if __name__ == '__main__':
+    unittest.main()
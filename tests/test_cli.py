@@ -1,13 +1,18 @@
 import unittest
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 
 import re
 import os
+import sys
 import tempfile
+import subprocess
 
 from PIL import Image, ImageColor
 
-from masecret.cli import parser, parse_args, get_secret_res, input_output_pairs, find_secret_rects, mask_rect
+import masecret.cli
+from masecret.cli import (parser, parse_args, get_secret_res, input_output_pairs, largest_first,
+                          group_duplicates, make_batches, build_options, get_tesseract_configs,
+                          find_secret_rects, mask_rect)
 
 FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
 
@@ -63,6 +68,35 @@ class TestParseArgs(unittest.TestCase):
                         'original.png', '-o', 'masked.png'])
         parser.error.assert_called_once_with('You MUST NOT specify both -r and -s options.')
 
+    def test_jobs(self):
+        args = parse_args(['-j', '4', '-i', 'original.png'])
+        self.assertEqual(args.jobs, 4)
+
+    def test_non_positive_jobs(self):
+        with self.assertRaises(SystemExit):
+            parse_args(['-j', '0', '-i', 'original.png'])
+        parser.error.assert_called_once_with('JOBS must be a positive integer.')
+
+    def test_batch_size(self):
+        args = parse_args(['-b', '8', '-i', 'original.png'])
+        self.assertEqual(args.batch_size, 8)
+
+    def test_non_positive_batch_size(self):
+        with self.assertRaises(SystemExit):
+            parse_args(['-b', '0', '-i', 'original.png'])
+        parser.error.assert_called_once_with('Batch size must be a positive integer.')
+
+    def test_pipeline_with_batch_size(self):
+        with self.assertRaises(SystemExit):
+            parse_args(['--pipeline', '-b', '8', '-i', 'original.png'])
+        parser.error.assert_called_once_with('You MUST NOT specify both --pipeline and -b options.')
+
+    def test_fold_confusables_without_literals(self):
+        with self.assertRaises(SystemExit):
+            parse_args(['--fold-confusables', '-i', 'original.png'])
+        parser.error.assert_called_once_with(
+            'You MUST specify --literals option with --fold-confusables.')
+
 
 class TestGetSecretRes(unittest.TestCase):
 
@@ -77,6 +111,16 @@ class TestGetSecretRes(unittest.TestCase):
         patterns = [r.pattern for r in get_secret_res(args)]
         self.assertEqual(patterns, ['PA.*RD'])
 
+    def test_literals_only(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            original_dir = os.getcwd()
+            os.chdir(tempdir)
+            try:
+                args = parse_args(['--literals', 'literals.txt', 'original.png', '-o', 'masked.png'])
+                self.assertEqual(get_secret_res(args), [])
+            finally:
+                os.chdir(original_dir)
+
 
 class TestInputOutputPairs(unittest.TestCase):
 
@@ -111,6 +155,65 @@ class TestInputOutputPairs(unittest.TestCase):
         ])
 
 
+class TestLargestFirst(unittest.TestCase):
+
+    def test_largest_first(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            small = os.path.join(tempdir, 'small.png')
+            large = os.path.join(tempdir, 'large.png')
+            missing = os.path.join(tempdir, 'missing.png')
+            with open(small, 'wb') as f:
+                f.write(b'x')
+            with open(large, 'wb') as f:
+                f.write(b'x' * 100)
+
+            pairs = [(small, 'a'), (missing, 'b'), (large, 'c')]
+            self.assertEqual(largest_first(pairs), [(large, 'c'), (small, 'a'), (missing, 'b')])
+
+
+class TestGroupDuplicates(unittest.TestCase):
+
+    def test_group_duplicates(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            paths = [os.path.join(tempdir, name) for name in ['a.png', 'b.png', 'c.png']]
+            for path, content in zip(paths, [b'x', b'y', b'x']):
+                with open(path, 'wb') as f:
+                    f.write(content)
+            missing = os.path.join(tempdir, 'missing.png')
+
+            pairs = [(paths[0], 'a'), (paths[1], 'b'), (missing, 'm'), (paths[2], 'c')]
+            self.assertEqual(group_duplicates(pairs), [
+                [(paths[0], 'a'), (paths[2], 'c')],
+                [(paths[1], 'b')],
+                [(missing, 'm')],
+            ])
+
+
+    @patch('masecret.cli.file_digest', side_effect=lambda path: 'digest of ' + path)
+    def test_reads_only_same_sizes(self, file_digest):
+        with tempfile.TemporaryDirectory() as tempdir:
+            paths = [os.path.join(tempdir, name) for name in ['a.png', 'b.png', 'c.png']]
+            for path, content in zip(paths, [b'x', b'yy', b'z']):
+                with open(path, 'wb') as f:
+                    f.write(content)
+
+            pairs = [(path, path) for path in paths]
+            known_digests = {paths[0]: 'digest'}
+            self.assertEqual(len(group_duplicates(pairs, known_digests.get)), 3)
+            # The digest of a.png is known, and b.png has no other input of its size.
+            file_digest.assert_called_once_with(paths[2])
+
+
+class TestMakeBatches(unittest.TestCase):
+
+    def test_make_batches(self):
+        groups = [[('a', 'a'), ('c', 'c')], [('b', 'b')], [('d', 'd')]]
+        self.assertEqual(make_batches(groups, 2), [
+            [('a', 'a'), ('c', 'c'), ('b', 'b')],
+            [('d', 'd')],
+        ])
+
+
 class TestFindSecretRects(unittest.TestCase):
 
     def test_find_secret_rects(self):
@@ -148,5 +251,44 @@ class TestFindSecretRects(unittest.TestCase):
         image.save(os.path.join(FIXTURES_DIR, filename))
 
 
+class TestGetTesseractConfigs(unittest.TestCase):
+
+    @patch('masecret.builders.psm_parameter', side_effect=AssertionError)
+    def test_default(self, psm_parameter):
+        # The version of tesseract is not checked before the backend needs it.
+        args = parse_args(['-i', 'a.png'])
+        self.assertIsNone(get_tesseract_configs(args))
+        self.assertIsNone(build_options(args, 1)['tesseract_configs'])
+
+    def test_given(self):
+        args = parse_args(['-i', 'a.png', '--tesseract-params', '--psm 4 -c a="b c"'])
+        self.assertEqual(get_tesseract_configs(args), ['--psm', '4', '-c', 'a=b c'])
+
+
+class TestLazyImports(unittest.TestCase):
+
+    def test_no_ocr_stack(self):
+        # Run in another process, as this one has already imported the OCR stack.
+        code = """
+import sys
+from masecret.cli import parse_args
+for args in (['--help'], ['--version'], ['-j', '0', '-i', 'a.png']):
+    try:
+        parse_args(args)
+    except SystemExit:
+        pass
+print(sorted({name.split('.')[0] for name in sys.modules} & {'PIL', 'pyocr'}))
+"""
+        result = subprocess.run([sys.executable, '-c', code], stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL, universal_newlines=True,
+                                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        self.assertEqual(result.stdout.splitlines()[-1], '[]')
+
+    @patch('masecret.masking.find_secret_rects', return_value=[])
+    def test_masking_functions(self, find_secret_rects):
+        self.assertEqual(masecret.cli.find_secret_rects('image', [], 'eng'), [])
+        find_secret_rects.assert_called_once_with('image', [], 'eng')
+
+
 if __name__ == '__main__':
     unittest.main()
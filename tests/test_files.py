@@ -0,0 +1,101 @@
+import unittest
+from unittest.mock import patch
+
+import os
+import stat
+import tempfile
+
+from PIL import Image
+
+from masecret.files import (save_image_atomically, copy_file_atomically, image_format_of,
+                            is_same_file)
+
+
+class TempDirTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.dir = self.tempdir.name
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+
+class TestSaveImageAtomically(TempDirTestCase):
+
+    def test_save(self):
+        path = os.path.join(self.dir, 'a.png')
+        save_image_atomically(Image.new('RGB', (10, 10), (255, 0, 0)), path, compress_level=1)
+
+        self.assertEqual(Image.open(path).getpixel((0, 0)), (255, 0, 0))
+        self.assertEqual(os.listdir(self.dir), ['a.png'])
+        self.assertNotEqual(stat.S_IMODE(os.stat(path).st_mode), 0o600)
+
+    def test_frames(self):
+        frames = [Image.new('RGB', (10, 10), (255, 0, 0)), Image.new('RGB', (10, 10))]
+        for name, n_frames in [('a.tif', 2), ('a.jpg', 1)]:
+            path = os.path.join(self.dir, name)
+            save_image_atomically(frames[0], path, save_all=True, append_images=frames[1:])
+            self.assertEqual(getattr(Image.open(path), 'n_frames', 1), n_frames)
+
+    def test_umask(self):
+        path = os.path.join(self.dir, 'a.png')
+        umask = os.umask(0o027)
+        try:
+            save_image_atomically(Image.new('RGB', (10, 10)), path)
+        finally:
+            os.umask(umask)
+        self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o640)
+
+    def test_keep_mode(self):
+        path = os.path.join(self.dir, 'a.png')
+        Image.new('RGB', (10, 10)).save(path)
+        os.chmod(path, 0o640)
+
+        save_image_atomically(Image.new('RGB', (10, 10)), path)
+        self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o640)
+
+    def test_failure(self):
+        path = os.path.join(self.dir, 'a.png')
+        with open(path, 'wb') as f:
+            f.write(b'original')
+
+        image = Image.new('RGB', (10, 10))
+        with patch.object(image, 'save', side_effect=OSError('disk full')):
+            with self.assertRaises(OSError):
+                save_image_atomically(image, path)
+
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), b'original')
+        self.assertEqual(os.listdir(self.dir), ['a.png'])
+
+
+class TestCopyFileAtomically(TempDirTestCase):
+
+    def test_copy_and_link(self):
+        source_path = os.path.join(self.dir, 'a.png')
+        with open(source_path, 'wb') as f:
+            f.write(b'data')
+        copy_path = os.path.join(self.dir, 'copy.png')
+        link_path = os.path.join(self.dir, 'link.png')
+
+        copy_file_atomically(source_path, copy_path)
+        copy_file_atomically(source_path, link_path, link=True)
+
+        with open(copy_path, 'rb') as f:
+            self.assertEqual(f.read(), b'data')
+        self.assertFalse(is_same_file(source_path, copy_path))
+        self.assertTrue(is_same_file(source_path, link_path))
+        self.assertEqual(sorted(os.listdir(self.dir)), ['a.png', 'copy.png', 'link.png'])
+
+
+class TestImageFormatOf(unittest.TestCase):
+
+    def test_image_format_of(self):
+        self.assertEqual(image_format_of('a/b.PNG'), 'PNG')
+        self.assertEqual(image_format_of('b.jpg'), 'JPEG')
+        self.assertIsNone(image_format_of('b.unknown'))
+
+
+if __name__ == '__main__':
+    unittest.main()
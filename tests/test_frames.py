@@ -0,0 +1,46 @@
+import unittest
+
+import os
+import tempfile
+
+from PIL import Image
+
+from masecret.frames import is_multi_frame, iter_frames, changed_rows, frame_save_params
+
+
+class TestFrames(unittest.TestCase):
+
+    def setUp(self):
+        self.frames = [Image.new('RGB', (100, 100), (255, 255, 255)) for _ in range(3)]
+        self.frames[1].paste((0, 0, 0), (10, 30, 20, 40))
+        self.frames[2].paste((250, 250, 250), (10, 60, 20, 70))  # Too subtle to be changed.
+
+    def test_changed_rows(self):
+        self.assertEqual(changed_rows(self.frames[0], self.frames[1]), (30, 40))
+        self.assertIsNone(changed_rows(self.frames[0], self.frames[2]))
+
+    def test_iter_frames(self):
+        tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        path = os.path.join(tempdir.name, 'animation.gif')
+        self.frames[0].save(path, save_all=True, append_images=self.frames[1:],
+                            duration=[100, 200, 300], loop=0)
+        image = Image.open(path)
+
+        self.assertTrue(is_multi_frame(image))
+        frames = list(iter_frames(image))
+        self.assertEqual([duration for _, duration in frames], [100, 200, 300])
+        self.assertEqual([frame.mode for frame, _ in frames], ['RGB'] * 3)
+        self.assertEqual(frames[1][0].getpixel((15, 35)), (0, 0, 0))
+
+        params = frame_save_params(image, [frame for frame, _ in frames], [100, 200, 300])
+        self.assertEqual(params['duration'], [100, 200, 300])
+        self.assertEqual(params['loop'], 0)
+        self.assertEqual(len(params['append_images']), 2)
+
+    def test_single_frame(self):
+        self.assertFalse(is_multi_frame(self.frames[0]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+import unittest
+
+import os
+import argparse
+import tempfile
+
+from masecret.journal import (Journal, read_journal, merge_entries, merge_main, parse_shard,
+                              select_shard, file_digest, settings_digest)
+from masecret.matching import SecretMatcher
+from masecret.templates import LayoutTemplates
+
+
+class TestJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.journal_path = os.path.join(self.tempdir.name, 'journal.jsonl')
+        self.input_path = self.path('input.png')
+        self.output_path = self.path('output.png')
+        self.write(self.input_path, b'original')
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.tempdir.name, name)
+
+    def write(self, path, data):
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    def run_journal(self, pairs, settings='s1', error=None, output=b'masked'):
+        journal = Journal(self.journal_path, settings)
+        processed = []
+        for input_path, output_path in journal.pending(pairs):
+            self.write(output_path, output)
+            journal.record(input_path, error)
+            processed.append(input_path)
+        journal.close()
+        return processed, journal.num_skipped
+
+    def test_skip_done(self):
+        pairs = [(self.input_path, self.output_path)]
+        self.assertEqual(self.run_journal(pairs), ([self.input_path], 0))
+        self.assertEqual(self.run_journal(pairs), ([], 1))
+
+        entry = read_journal(self.journal_path)[self.input_path]
+        self.assertEqual(entry['digest'], file_digest(self.input_path))
+        self.assertEqual(entry['output_digest'], file_digest(self.output_path))
+
+    def test_digest(self):
+        journal = Journal(self.journal_path, 's1')
+        self.assertIsNone(journal.digest(self.input_path))
+        list(journal.pending([(self.input_path, self.output_path)]))
+        self.assertEqual(journal.digest(self.input_path), file_digest(self.input_path))
+        journal.close()
+
+    def test_redo(self):
+        pairs = [(self.input_path, self.output_path)]
+        self.run_journal(pairs, error='OSError: failed')
+        # A failed input is retried.
+        self.assertEqual(self.run_journal(pairs), ([self.input_path], 0))
+        # An input is masked again with other settings.
+        self.assertEqual(self.run_journal(pairs, settings='s2'), ([self.input_path], 0))
+        # A changed input is masked again.
+        self.write(self.input_path, b'changed')
+        self.assertEqual(self.run_journal(pairs, settings='s2'), ([self.input_path], 0))
+        # A removed output is written again.
+        os.remove(self.output_path)
+        self.assertEqual(self.run_journal(pairs, settings='s2'), ([self.input_path], 0))
+
+    def test_in_place(self):
+        pairs = [(self.input_path, self.input_path)]
+        self.run_journal(pairs)
+        self.assertEqual(self.run_journal(pairs), ([], 1))
+
+    def test_partial_line(self):
+        pairs = [(self.input_path, self.output_path)]
+        with open(self.journal_path, 'w') as f:
+            f.write('{"input": "crash')
+
+        self.run_journal(pairs)
+
+        self.assertEqual(list(read_journal(self.journal_path)), [self.input_path])
+
+
+class TestSettingsDigest(unittest.TestCase):
+
+    def test_settings_digest(self):
+        secret_res = SecretMatcher([])
+        options = {'lang': 'eng', 'fill_color': (0, 0, 0)}
+        digests = {settings_digest(secret_res, dict(options, layout_templates=layout_templates))
+                   for layout_templates in [None, LayoutTemplates('templates1'),
+                                            LayoutTemplates('templates2'),
+                                            LayoutTemplates('templates2', full_pass=True)]}
+        self.assertEqual(len(digests), 4)
+
+
+class TestShard(unittest.TestCase):
+
+    def test_parse_shard(self):
+        self.assertEqual(parse_shard('2/4'), (2, 4))
+        for value in ['0/4', '5/4', '2', 'a/b']:
+            with self.assertRaises(argparse.ArgumentTypeError):
+                parse_shard(value)
+
+    def test_select_shard(self):
+        pairs = [('image{0}.png'.format(i), 'image{0}.png'.format(i)) for i in range(100)]
+        shards = [list(select_shard(pairs, k, 3)) for k in range(1, 4)]
+
+        self.assertEqual(sorted(pair for shard in shards for pair in shard), sorted(pairs))
+        self.assertTrue(all(shards))
+        self.assertEqual(list(select_shard(reversed(pairs), 1, 3)), shards[0][::-1])
+
+
+class TestMergeJournals(unittest.TestCase):
+
+    def test_merge_entries(self):
+        entries = {'a': {'error': None, 'run': 1}, 'b': {'error': 'failed', 'run': 1}}
+        merge_entries(entries, {'a': {'error': 'failed', 'run': 2},
+                                'b': {'error': None, 'run': 2},
+                                'c': {'error': 'failed', 'run': 2}})
+
+        self.assertEqual({input_path: entry['run'] for input_path, entry in entries.items()},
+                         {'a': 1, 'b': 2, 'c': 2})
+
+    def test_merge_main(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            paths = []
+            for i in range(2):
+                input_path = os.path.join(tempdir, 'input{0}.png'.format(i))
+                with open(input_path, 'wb') as f:
+                    f.write(b'original')
+                paths.append(os.path.join(tempdir, 'journal{0}.jsonl'.format(i)))
+                journal = Journal(paths[-1], 's1')
+                for pending_path, _ in journal.pending([(input_path, input_path)]):
+                    journal.record(pending_path, None)
+                journal.close()
+            output_path = os.path.join(tempdir, 'merged.jsonl')
+
+            self.assertEqual(merge_main(paths + ['-o', output_path]), 0)
+
+            self.assertEqual(sorted(read_journal(output_path)),
+                             [os.path.join(tempdir, 'input0.png'),
+                              os.path.join(tempdir, 'input1.png')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+
+import os
+import random
+import tempfile
+
+from masecret.literals import LiteralMatcher, read_literals_from_file
+
+
+class TestLiteralMatcher(unittest.TestCase):
+
+    def test_finditer(self):
+        matcher = LiteralMatcher(['123456789012', 'example.com'])
+        self.assertEqual(list(matcher.finditer('ID:123456789012host.example.com')),
+                         [(0, 3, 15), (1, 20, 31)])
+
+    def test_overlapping(self):
+        matcher = LiteralMatcher(['he', 'she', 'his', 'hers'])
+        self.assertEqual(sorted(matcher.finditer('ushers')),
+                         [(0, 2, 4), (1, 1, 4), (3, 2, 6)])
+
+    def test_same_as_naive_search(self):
+        rand = random.Random(0)
+        for _ in range(500):
+            literals = [''.join(rand.choice('abc') for _ in range(rand.randint(1, 4)))
+                        for _ in range(rand.randint(1, 6))]
+            content = ''.join(rand.choice('abcd') for _ in range(rand.randint(0, 30)))
+            expected = sorted((index, start, start + len(literal))
+                              for index, literal in enumerate(literals)
+                              for start in range(len(content))
+                              if content.startswith(literal, start))
+            self.assertEqual(sorted(LiteralMatcher(literals).finditer(content)), expected)
+
+    def test_fold_confusables(self):
+        matcher = LiteralMatcher(['1O0-S5'], fold_confusables=True)
+        self.assertEqual(list(matcher.finditer('l00-55|Oo-Ss')), [(0, 0, 6), (0, 6, 12)])
+
+    def test_no_fold_confusables(self):
+        matcher = LiteralMatcher(['1O0-S5'])
+        self.assertEqual(list(matcher.finditer('l00-55|Oo-Ss')), [])
+
+    def test_requirements(self):
+        self.assertEqual(LiteralMatcher(['ab', 'cde']).requirements(),
+                         [(frozenset('abcde'), 2)])
+        self.assertEqual(LiteralMatcher([]).requirements(), [])
+
+
+class TestReadLiteralsFromFile(unittest.TestCase):
+
+    def test_read_literals_from_file(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            path = os.path.join(tempdir, 'literals.txt')
+            with open(path, 'w') as f:
+                f.write('1234-5678-9012\n\nmy host.example.com \n')
+
+            self.assertEqual(read_literals_from_file(path),
+                             ['1234-5678-9012', 'myhost.example.com'])
+
+
+if __name__ == '__main__':
+    unittest.main()
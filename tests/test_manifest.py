@@ -0,0 +1,105 @@
+import unittest
+
+import os
+import re
+import tempfile
+
+from PIL import Image
+
+from masecret.backends import FakeBackend, draw_fake_text
+from masecret.matching import SecretMatcher
+from masecret.manifest import (detect_image_safely, apply_entry, write_manifest, read_manifest,
+                               manifest_settings, MANIFEST_VERSION)
+
+
+class TestDetectAndApply(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.input_path = os.path.join(self.tempdir.name, 'original.png')
+        image = Image.new('RGB', (300, 40), (255, 255, 255))
+        draw_fake_text(image, (10, 10), 'ID 1234-5678-9012')
+        image.save(self.input_path)
+        self.options = {'lang': 'eng', 'fill_color': (255, 0, 255), 'ocr_backend': FakeBackend()}
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_detect_and_apply(self):
+        secret_res = SecretMatcher([re.compile(r'[-\d]{12,}')])
+        input_path, entry, error = detect_image_safely(self.input_path, secret_res, self.options)
+
+        self.assertIsNone(error)
+        self.assertEqual(entry['size'], [300, 40])
+        self.assertEqual(entry['rects'], [[[44, 8], [214, 32]]])
+
+        output_path = os.path.join(self.tempdir.name, 'masked.png')
+        apply_entry(entry, self.input_path, output_path, (0, 0, 255))
+        self.assertEqual(Image.open(output_path).getpixel((100, 20)), (0, 0, 255))
+
+        apply_entry(entry, self.input_path, output_path, (0, 0, 255), outline=True)
+        masked = Image.open(output_path)
+        self.assertEqual(masked.getpixel((44, 20)), (0, 0, 255))
+        self.assertNotEqual(masked.getpixel((100, 20)), (0, 0, 255))
+
+    def test_multi_frame(self):
+        frames = [Image.new('RGB', (300, 40), (255, 255, 255)) for _ in range(2)]
+        draw_fake_text(frames[1], (10, 10), 'ID 1234-5678-9012')
+        input_path = os.path.join(self.tempdir.name, 'recording.gif')
+        frames[0].save(input_path, save_all=True, append_images=frames[1:])
+        secret_res = SecretMatcher([re.compile(r'[-\d]{12,}')])
+
+        _, entry, error = detect_image_safely(input_path, secret_res, self.options)
+
+        self.assertIsNone(error)
+        self.assertEqual(entry['rects'], [])
+        self.assertEqual([frame['rects'] for frame in entry['frames']],
+                         [[], [[[44, 8], [214, 32]]]])
+
+        output_path = os.path.join(self.tempdir.name, 'masked.gif')
+        apply_entry(entry, input_path, output_path, (0, 0, 255))
+        masked = Image.open(output_path)
+        self.assertEqual(masked.n_frames, 2)
+        masked.seek(1)
+        self.assertEqual(masked.convert('RGB').getpixel((100, 20)), (0, 0, 255))
+
+        # An entry of version 1 has no rects of frames other than the first one.
+        del entry['frames']
+        with self.assertRaises(ValueError):
+            apply_entry(entry, input_path, output_path, (0, 0, 255))
+
+    def test_changed_image(self):
+        _, entry, _ = detect_image_safely(self.input_path, SecretMatcher([]), self.options)
+        image = Image.open(self.input_path)
+        image.putpixel((0, 0), (0, 0, 0))
+        image.save(self.input_path)
+
+        with self.assertRaises(ValueError):
+            apply_entry(entry, self.input_path, self.input_path, (0, 0, 0))
+
+    def test_missing_image(self):
+        path = os.path.join(self.tempdir.name, 'missing.png')
+        _, entry, error = detect_image_safely(path, SecretMatcher([]), self.options)
+        self.assertIsNone(entry)
+        self.assertTrue(error.startswith('FileNotFoundError: '))
+
+
+class TestManifest(unittest.TestCase):
+
+    def test_write_and_read(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            path = os.path.join(tempdir, 'manifest.json')
+            settings = manifest_settings({'lang': 'eng', 'fill_color': (255, 0, 255)})
+            self.assertEqual(settings['fill_color'], '#ff00ff')
+
+            write_manifest(path, {'version': MANIFEST_VERSION, 'settings': settings, 'images': []})
+            self.assertEqual(read_manifest(path)['settings'], settings)
+            self.assertEqual(os.listdir(tempdir), ['manifest.json'])
+
+            write_manifest(path, {'version': MANIFEST_VERSION + 1})
+            with self.assertRaises(ValueError):
+                read_manifest(path)
+
+
+if __name__ == '__main__':
+    unittest.main()
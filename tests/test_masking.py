@@ -0,0 +1,238 @@
+import unittest
+from unittest.mock import patch
+
+import re
+import os
+import tempfile
+
+from PIL import Image
+
+from masecret.backends import OCRBackend, FakeBackend, draw_fake_text
+from masecret.builders import CharBoxTable
+from masecret.cache import OCRCache
+from masecret.masking import (mask_secrets_safely, mask_secrets_batch, mask_secrets,
+                              find_secret_rects)
+from masecret.report import StageTimer, STAGES
+from masecret.templates import LayoutTemplates
+
+class TestMaskSecretsSafely(unittest.TestCase):
+
+    def test_failure(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            input_path = os.path.join(tempdir, 'missing.png')
+            options = {'lang': 'eng', 'fill_color': (0, 0, 0)}
+
+            path, log, error = mask_secrets_safely(input_path, input_path, [], options,
+                                                   capture_log=True)
+
+            self.assertEqual(path, input_path)
+            self.assertIn('Processing {0}...'.format(input_path), log)
+            self.assertTrue(error.startswith('FileNotFoundError: '))
+
+    def test_timer(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            input_path = os.path.join(tempdir, 'original.png')
+            image = Image.new('RGB', (300, 40), (255, 255, 255))
+            draw_fake_text(image, (10, 10), 'ID 1234-5678-9012')
+            image.save(input_path)
+            options = {'lang': 'eng', 'fill_color': (0, 0, 0), 'ocr_backend': FakeBackend()}
+            timer = StageTimer()
+
+            _, _, error = mask_secrets_safely(input_path, os.path.join(tempdir, 'masked.png'),
+                                              [re.compile(r'[-\d]{12,}')], options,
+                                              capture_log=True, timer=timer)
+
+            self.assertIsNone(error)
+            record = timer.record()
+            self.assertEqual(sorted(record['stages']), sorted(STAGES))
+            self.assertEqual(record['counts']['chars'], 16)
+            self.assertEqual(record['counts']['matches'], 1)
+            self.assertEqual(record['counts']['rects'], 1)
+            self.assertEqual(record['counts']['pixels'], 300 * 40)
+
+
+class CountingBackend(FakeBackend):
+    """
+    Fake backend posing as pyocr, whose results are prefetched in batches.
+    """
+
+    name = 'pyocr'
+
+    def __init__(self):
+        self.calls = 0
+
+    def image_to_char_boxes(self, image, lang, tesseract_configs):
+        self.calls += 1
+        return super().image_to_char_boxes(image, lang, tesseract_configs)
+
+
+class TestMaskSecretsBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.batch = []
+        for i in range(2):
+            image = Image.new('RGB', (400, 300), (255, 255, 255))
+            draw_fake_text(image, (10, 10 + i * 100), 'ID 1234-5678-9012')
+            input_path = os.path.join(self.tempdir.name, '{0}.png'.format(i))
+            image.save(input_path)
+            output_path = os.path.join(self.tempdir.name, '{0}.masked.png'.format(i))
+            self.batch.append((input_path, output_path))
+
+        self.backend = CountingBackend()
+        self.options = {'lang': 'eng+jpn', 'fill_color': (0, 0, 0), 'ocr_backend': self.backend,
+                        'tesseract_configs': ['--psm', '6', 'makebox'], 'ocr_cache': OCRCache()}
+
+        def images_to_char_boxes(images, lang, tesseract_configs):
+            return [FakeBackend().image_to_char_boxes(image, lang, tesseract_configs)
+                    for image in images]
+
+        patcher = patch('masecret.ocr.images_to_char_boxes', side_effect=images_to_char_boxes)
+        self.images_to_char_boxes = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_prefetch(self):
+        results = mask_secrets_batch(self.batch, [re.compile(r'[-\d]{12,}')], self.options)
+
+        self.assertEqual([error for _, _, error, _ in results], [None, None])
+        self.assertEqual(self.images_to_char_boxes.call_count, 1)
+        # Every image hits the prefetched results.
+        self.assertEqual(self.backend.calls, 0)
+        self.assertEqual(Image.open(self.batch[1][1]).getpixel((100, 120)), (0, 0, 0))
+
+    def test_no_prefetch(self):
+        # Prefetched results would never be read with these options.
+        for key, value in [('lang_cascade', True), ('coarse_scale', 0.5), ('text_height', 24),
+                           ('layout_templates', LayoutTemplates(self.tempdir.name))]:
+            with self.subTest(key):
+                self.images_to_char_boxes.reset_mock()
+                self.backend.calls = 0
+
+                options = dict(self.options, ocr_cache=OCRCache(), **{key: value})
+                results = mask_secrets_batch(self.batch, [re.compile(r'[-\d]{12,}')], options)
+
+                self.assertEqual([error for _, _, error, _ in results], [None, None])
+                self.images_to_char_boxes.assert_not_called()
+                self.assertGreaterEqual(self.backend.calls, 2)
+
+
+class TestMaskSecrets(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.input_path = os.path.join(self.tempdir.name, 'original.png')
+        image = Image.new('RGB', (300, 40), (255, 255, 255))
+        draw_fake_text(image, (10, 10), 'ID 1234')
+        image.save(self.input_path)
+        os.utime(self.input_path, (100, 100))
+        self.options = {'lang': 'eng', 'fill_color': (0, 0, 0), 'ocr_backend': FakeBackend()}
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_unchanged_in_place(self):
+        mask_secrets(self.input_path, self.input_path, [re.compile(r'\d{12,}')], **self.options)
+        self.assertEqual(os.path.getmtime(self.input_path), 100)
+
+    def test_unchanged_copied(self):
+        output_path = os.path.join(self.tempdir.name, 'masked.png')
+        mask_secrets(self.input_path, output_path, [re.compile(r'\d{12,}')], **self.options)
+
+        with open(self.input_path, 'rb') as f1, open(output_path, 'rb') as f2:
+            self.assertEqual(f1.read(), f2.read())
+
+    def test_multi_frame(self):
+        frames = [Image.new('RGB', (300, 200), (255, 255, 255)) for _ in range(3)]
+        for frame in frames:
+            draw_fake_text(frame, (10, 10), 'ID 1234-5678-9012')
+        draw_fake_text(frames[2], (10, 100), 'ID 2345-6789-0123')
+        input_path = os.path.join(self.tempdir.name, 'recording.tif')
+        frames[0].save(input_path, save_all=True, append_images=frames[1:])
+        output_path = os.path.join(self.tempdir.name, 'masked.tif')
+        timer = StageTimer()
+
+        mask_secrets(input_path, output_path, [re.compile(r'[-\d]{12,}')], timer=timer,
+                     **self.options)
+
+        masked = Image.open(output_path)
+        self.assertEqual(masked.n_frames, 3)
+        pixels = []
+        for i in range(3):
+            masked.seek(i)
+            pixels.append((masked.getpixel((100, 20)), masked.getpixel((100, 110))))
+        self.assertEqual(pixels, [((0, 0, 0), (255, 255, 255))] * 2 + [((0, 0, 0), (0, 0, 0))])
+        self.assertEqual(timer.counts['frames'], 3)
+        self.assertEqual(timer.counts['reused_frames'], 1)
+        # Only the rows around the new secret are recognized in the last frame.
+        self.assertEqual(timer.counts['chars'], 16 * 2)
+
+    def test_masked(self):
+        output_path = os.path.join(self.tempdir.name, 'masked.png')
+        mask_secrets(self.input_path, output_path, [re.compile(r'\d{4}')],
+                     save_options={'compress_level': 1}, **self.options)
+
+        self.assertEqual(Image.open(output_path).getpixel((70, 20)), (0, 0, 0))
+
+
+class TestFindSecretRectsWithFakeBackend(unittest.TestCase):
+
+    def test_wrapped_secrets(self):
+        image = Image.new('RGB', (300, 100), (255, 255, 255))
+        draw_fake_text(image, (10, 10), 'ID 1234-5678')
+        draw_fake_text(image, (10, 40), '9012 end')
+
+        secret_rects = find_secret_rects(image, [re.compile(r'[-\d]{12,}')], 'eng',
+                                         ocr_backend=FakeBackend())
+
+        self.assertEqual(secret_rects, [((44, 8), (154, 32)), ((8, 38), (58, 62))])
+
+    def test_adaptive_resolution(self):
+        class RecordingBackend(OCRBackend):
+            name = 'recording'
+            sizes = []
+
+            def image_to_char_boxes(self, image, lang, tesseract_configs):
+                self.sizes.append(image.size)
+                return CharBoxTable('12345678', [10, 15, 20, 25, 30, 35, 40, 45], [5] * 8,
+                                    [15, 20, 25, 30, 35, 40, 45, 50], [25] * 8)
+
+        image = Image.new('RGB', (400, 200), (255, 255, 255))
+        for y in range(10, 180, 60):
+            draw_fake_text(image, (10, y), '1234 5678', glyph_size=(20, 40))
+        backend = RecordingBackend()
+
+        secret_rects = find_secret_rects(image, [re.compile(r'\d{8}')], 'eng',
+                                         ocr_backend=backend, text_height=20)
+
+        self.assertEqual(backend.sizes, [(200, 100)])
+        self.assertEqual(secret_rects, [((18, 8), (102, 52))])
+
+    def test_lang_cascade(self):
+        class RecordingBackend(FakeBackend):
+            name = 'recording'
+            langs = []
+
+            def image_to_char_boxes(self, image, lang, tesseract_configs):
+                self.langs.append(lang)
+                return super().image_to_char_boxes(image, lang, tesseract_configs)
+
+        image = Image.new('RGB', (300, 40), (255, 255, 255))
+        draw_fake_text(image, (10, 10), 'ID 1234-5678')
+        backend = RecordingBackend()
+
+        secret_rects = find_secret_rects(image, [re.compile(r'[-\d]{9,}')], 'eng+jpn',
+                                         ocr_backend=backend, lang_cascade=True)
+        self.assertEqual(backend.langs, ['eng'])
+        self.assertEqual(secret_rects, [((44, 8), (154, 32))])
+
+        # Secrets in Japanese cannot be read by eng, so every line is recognized by eng+jpn.
+        find_secret_rects(image, [re.compile('\u5c71\u7530')], 'eng+jpn', ocr_backend=backend,
+                          lang_cascade=True)
+        self.assertEqual(backend.langs, ['eng', 'eng+jpn'])
+
+
+if __name__ == '__main__':
+    unittest.main()
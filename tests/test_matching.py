@@ -0,0 +1,115 @@
+import unittest
+from unittest.mock import patch
+
+import re
+import random
+
+from masecret.matching import (SecretMatcher, CandidateFilter, literal_prefix, pattern_alphabet,
+                               min_match_length)
+
+
+def find_one_by_one(secret_res, content):
+    return [(index, m.start(), m.end())
+            for index, secret_re in enumerate(secret_res)
+            for m in secret_re.finditer(content) if m.start() != m.end()]
+
+
+class TestLiteralPrefix(unittest.TestCase):
+
+    def test_literal_prefix(self):
+        self.assertEqual(literal_prefix(re.compile(r'AKIA[0-9A-Z]{16}')), ('AKIA', False))
+
+    def test_no_literal_prefix(self):
+        self.assertEqual(literal_prefix(re.compile(r'[-\d]{12,}')), ('', False))
+        self.assertEqual(literal_prefix(re.compile(r'(PA)SS')), ('', False))
+
+    def test_quantified_literal(self):
+        self.assertEqual(literal_prefix(re.compile(r'PA*SS')), ('P', False))
+
+    def test_ignore_case(self):
+        self.assertEqual(literal_prefix(re.compile(r'(?i)PASS')), ('pass', True))
+        self.assertEqual(literal_prefix(re.compile(r'PASS', re.IGNORECASE)), ('pass', True))
+
+    def test_ignore_case_non_ascii(self):
+        self.assertEqual(literal_prefix(re.compile(r'(?i)Paß')), ('pa', True))
+
+
+class TestSecretMatcher(unittest.TestCase):
+
+    patterns = [
+        r'[-\d]{4,}', r'PA.*RD', r'PAR', r'\d\d', r'(?i)key', r'kEy\d', r'(a)(b)?',
+        r'(\w)\1', r'(?P<x>zz)', r'a|ab', r'(?x) a b  # comment', r'x*', r'ab+', r'a',
+        r'(?<=a)b', r'Ke', r'aa', r'(?i)Sİ', r'(?ai)k', r'(?i)PAR', r'ıs',
+    ]
+
+    def test_few_regexes(self):
+        secret_res = [re.compile(r'[-\d]{12,}'), re.compile(r'PA.*RD')]
+        matcher = SecretMatcher(secret_res)
+        content = 'PASSWORD:1234-5678-9012PA'
+        self.assertEqual(list(matcher.finditer(content)), [(0, 9, 23), (1, 0, 8)])
+
+    @patch('masecret.matching.MIN_TRIE_SIZE', 0)
+    def test_overlapping_matches(self):
+        secret_res = [re.compile(r'ab'), re.compile(r'abc'), re.compile(r'bcd'), re.compile(r'b')]
+        matcher = SecretMatcher(secret_res)
+        self.assertEqual(list(matcher.finditer('xabcdab')),
+                         [(0, 1, 3), (0, 5, 7), (1, 1, 4), (2, 2, 5), (3, 2, 3), (3, 6, 7)])
+
+    @patch('masecret.matching.MIN_TRIE_SIZE', 0)
+    def test_same_as_one_by_one(self):
+        secret_res = [re.compile(p) for p in self.patterns]
+        matcher = SecretMatcher(secret_res)
+        rand = random.Random(0)
+        for alphabet in ['0123-aAbBzZxKeyPARDFE ſkKıİsS', '0123-aAbBzZxKeyPARDFEkKsS']:
+            for _ in range(1000):
+                content = ''.join(rand.choice(alphabet) for _ in range(rand.randint(0, 80)))
+                self.assertEqual(list(matcher.finditer(content)),
+                                 find_one_by_one(secret_res, content), content)
+
+
+class TestPatternAlphabet(unittest.TestCase):
+
+    def test_digits(self):
+        self.assertEqual(pattern_alphabet(re.compile(r'[-\d]{12,}')), frozenset('-0123456789'))
+
+    def test_ignore_case(self):
+        self.assertEqual(pattern_alphabet(re.compile(r'key(?:[ab]|c)', re.IGNORECASE)),
+                         frozenset('keyabcKEYABC'))
+
+    def test_lookahead(self):
+        self.assertEqual(pattern_alphabet(re.compile(r'\d+(?=x)')), frozenset('0123456789'))
+
+    def test_any_character(self):
+        for pattern in [r'key.*', r'\w+', r'[^a]', r'[\u0000-\uffff]']:
+            self.assertIsNone(pattern_alphabet(re.compile(pattern)), pattern)
+
+
+class TestMinMatchLength(unittest.TestCase):
+
+    def test_min_match_length(self):
+        self.assertEqual(min_match_length(re.compile(r'AKIA[0-9A-Z]{16}')), 20)
+        self.assertEqual(min_match_length(re.compile(r'a|bc+')), 1)
+
+
+class TestCandidateFilter(unittest.TestCase):
+
+    def setUp(self):
+        self.filter = CandidateFilter([(frozenset('-0123456789'), 12), (frozenset('AKI'), 20)])
+
+    def test_candidate(self):
+        self.assertTrue(self.filter.is_candidate('ID:1234-5X'))
+
+    def test_confusables_and_fullwidth(self):
+        self.assertTrue(self.filter.is_candidate('ID:l2３4O5'))
+
+    def test_not_candidate(self):
+        self.assertFalse(self.filter.is_candidate('Name:12-ab34'))
+
+    def test_any_character(self):
+        candidate_filter = CandidateFilter([(None, 4)])
+        self.assertTrue(candidate_filter.is_candidate('ab'))
+        self.assertFalse(candidate_filter.is_candidate('a'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,312 @@
+import unittest
+from unittest.mock import patch
+
+import os
+import tempfile
+
+from PIL import Image
+
+from masecret.backends import FakeBackend, draw_fake_text
+from masecret.builders import CharBoxTable
+from masecret.cache import OCRCache
+from masecret.matching import CandidateFilter
+from masecret.ocr import (flatten_transparency, tiles, image_to_char_boxes_tiled,
+                          image_to_char_boxes_coarse_to_fine, candidate_bands,
+                          images_to_char_boxes, prefetch_char_boxes, estimate_text_height,
+                          adaptive_scale, image_to_char_boxes_cascade, cascade_decision,
+                          is_unreadable_line, needs_all_languages)
+
+
+def fake_document(image_size, line_height=20, line_gap=10):
+    """
+    Get a fake OCR function recognizing lines of a virtual document that fit in an image.
+    """
+
+    lines = []
+    y = 5
+    while y + line_height <= image_size[1]:
+        lines.append((y, 'line{0}'.format(len(lines))))
+        y += line_height + line_gap
+
+    def image_to_char_boxes(image, lang, tesseract_configs=None, ocr_cache=None, backend=None):
+        top = image.info.get('top', 0)
+        tables = []
+        for y, text in lines:
+            if top <= y and y + line_height <= top + image.size[1]:
+                lefts = [10 * i for i in range(len(text))]
+                tables.append(CharBoxTable(text, lefts, [y - top] * len(text),
+                                           [x + 8 for x in lefts], [y - top + line_height] * len(text)))
+        return CharBoxTable.concat(tables)
+
+    return lines, image_to_char_boxes
+
+
+class CroppableImage:
+    """
+    Image whose crop() remembers top of the cropped area.
+    """
+
+    def __init__(self, size):
+        self.size = size
+
+    def crop(self, box):
+        image = Image.new('RGB', (box[2] - box[0], box[3] - box[1]))
+        image.info['top'] = box[1]
+        return image
+
+
+class TestFlattenTransparency(unittest.TestCase):
+
+    def test_rgba(self):
+        image = Image.new('RGBA', (2, 1), (0, 0, 0, 0))
+        self.assertEqual(flatten_transparency(image).getpixel((0, 0)), (255, 255, 255))
+
+    def test_rgb(self):
+        image = Image.new('RGB', (2, 1))
+        self.assertIs(flatten_transparency(image), image)
+
+
+class TestTiles(unittest.TestCase):
+
+    def test_tiles(self):
+        self.assertEqual(tiles(250, 100, 20), [
+            (0, 100, 0, 90),
+            (80, 180, 90, 170),
+            (160, 250, 170, 250),
+        ])
+
+    def test_single_tile(self):
+        self.assertEqual(tiles(50, 100, 20), [(0, 50, 0, 50)])
+
+    def test_too_large_overlap(self):
+        with self.assertRaises(ValueError):
+            tiles(250, 100, 100)
+
+
+class TestImageToCharBoxesTiled(unittest.TestCase):
+
+    def test_no_tiles(self):
+        image = CroppableImage((100, 1000))
+        with patch('masecret.ocr.image_to_char_boxes',
+                   return_value=CharBoxTable()) as image_to_char_boxes:
+            image_to_char_boxes_tiled(image, 'eng')
+            image_to_char_boxes.assert_called_once_with(image, 'eng', None, None, None)
+
+    def test_same_as_whole_image(self):
+        image = CroppableImage((100, 1000))
+        lines, fake = fake_document(image.size)
+        with patch('masecret.ocr.image_to_char_boxes', side_effect=fake):
+            boxes = image_to_char_boxes_tiled(image, 'eng', tile_height=170, tile_overlap=50,
+                                              jobs=2)
+
+        self.assertEqual(boxes.content, ''.join(text for _, text in lines))
+        self.assertEqual(boxes.tops.tolist(),
+                         [y for y, text in lines for _ in text])
+
+
+class TestCandidateBands(unittest.TestCase):
+
+    def setUp(self):
+        self.filter = CandidateFilter([(frozenset('0123456789'), 8)])
+
+    def boxes(self, lines):
+        return CharBoxTable.concat(
+            CharBoxTable(text, [5 * i for i in range(len(text))], [top] * len(text),
+                         [5 * i + 4 for i in range(len(text))], [top + 10] * len(text))
+            for top, text in lines)
+
+    def test_bands(self):
+        boxes = self.boxes([(0, 'a'), (20, 'b'), (40, 'id1234'), (60, 'c'), (80, 'd'),
+                            (100, 'e'), (120, 'f'), (140, 'pin5678')])
+
+        # Each line is padded by half of its height in the original scale.
+        self.assertEqual(candidate_bands(boxes, self.filter, 0.5, 400),
+                         [(29, 151), (229, 311)])
+
+    def test_all_candidates(self):
+        boxes = self.boxes([(0, 'a'), (20, 'id1234')])
+        self.assertIsNone(candidate_bands(boxes, self.filter, 0.5, 100))
+
+    def test_no_lines(self):
+        self.assertIsNone(candidate_bands(CharBoxTable(), self.filter, 0.5, 100))
+
+    def test_no_candidates(self):
+        boxes = self.boxes([(0, 'a'), (20, 'b')])
+        self.assertEqual(candidate_bands(boxes, self.filter, 0.5, 100), [])
+
+
+class TestImageToCharBoxesCoarseToFine(unittest.TestCase):
+
+    def test_same_as_whole_image(self):
+        image = Image.new('RGB', (300, 300), (255, 255, 255))
+        for i, text in enumerate(['Name: foo', 'Account', 'ID 1234-5678-9012', 'Region',
+                                  'Zone', 'Owner', 'Tags']):
+            draw_fake_text(image, (10, 10 + 40 * i), text)
+        backend = FakeBackend()
+        whole = backend.image_to_char_boxes(image, 'eng', [])
+
+        boxes = image_to_char_boxes_coarse_to_fine(
+            image, 'eng', CandidateFilter([(frozenset('-0123456789'), 12)]), backend=backend,
+            scale=1)
+
+        self.assertEqual(boxes.content, 'Account' + 'ID1234-5678-9012' + 'Region')
+        start = whole.content.index('Account')
+        self.assertEqual(boxes, whole[start:start + len(boxes)])
+
+
+class TestImageToCharBoxesCascade(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = FakeBackend()
+        self.calls = []
+
+    def recognize(self, image, lang):
+        self.calls.append((image.size, lang))
+        return self.backend.image_to_char_boxes(image, lang, [])
+
+    def test_unreadable_lines(self):
+        image = Image.new('RGB', (300, 100), (255, 255, 255))
+        draw_fake_text(image, (10, 10), 'ID 1234-5678')
+        draw_fake_text(image, (10, 40), '\u5c71\u7530 \u592a\u90ce', glyph_size=(20, 20))
+        draw_fake_text(image, (10, 70), 'Region')
+
+        boxes = image_to_char_boxes_cascade(image, 'eng+jpn', self.recognize)
+
+        self.assertEqual(boxes.content, 'ID1234-5678' + '\u5c71\u7530\u592a\u90ce' + 'Region')
+        self.assertEqual(list(boxes[11:12].rects()), [((10, 40), (30, 60))])
+        # Only the band around the second line is recognized with all the languages.
+        self.assertEqual([lang for _, lang in self.calls], ['eng', 'eng+jpn'])
+        self.assertEqual(self.calls[1][0], (300, 20 + 11 * 2 + 10 * 2))
+
+    def test_readable(self):
+        image = Image.new('RGB', (300, 40), (255, 255, 255))
+        draw_fake_text(image, (10, 10), 'ID 1234-5678')
+
+        boxes = image_to_char_boxes_cascade(image, 'eng+jpn', self.recognize)
+
+        self.assertEqual(boxes.content, 'ID1234-5678')
+        self.assertEqual(self.calls, [((300, 40), 'eng')])
+
+    def test_cached_decision(self):
+        image = Image.new('RGB', (300, 40), (255, 255, 255))
+        draw_fake_text(image, (10, 10), '\u5c71\u7530', glyph_size=(20, 20))
+        ocr_cache = OCRCache()
+
+        image_to_char_boxes_cascade(image, 'eng+jpn', self.recognize, ocr_cache=ocr_cache,
+                                    backend=self.backend)
+        image_to_char_boxes_cascade(image, 'eng+jpn', self.recognize, ocr_cache=ocr_cache,
+                                    backend=self.backend)
+
+        # The whole image is unreadable, so the first pass is skipped at the second time.
+        self.assertEqual([lang for _, lang in self.calls], ['eng', 'eng+jpn', 'eng+jpn'])
+
+    def test_single_language(self):
+        image_to_char_boxes_cascade(Image.new('RGB', (10, 10)), 'eng', self.recognize)
+        self.assertEqual(self.calls, [((10, 10), 'eng')])
+
+    def test_cascade_decision(self):
+        boxes = CharBoxTable.concat([CharBoxTable('abc', [0, 10, 20], [0] * 3, [8, 18, 28], [20] * 3),
+                                     CharBoxTable('~^', [0, 20], [30] * 2, [18, 38], [50] * 2),
+                                     CharBoxTable('def', [0, 10, 20], [60] * 3, [8, 18, 28], [80] * 3)])
+        self.assertEqual(cascade_decision(boxes), {'whole': False, 'lines': [[30, 50]]})
+        self.assertEqual(cascade_decision(boxes[3:5]), {'whole': True, 'lines': []})
+        self.assertEqual(cascade_decision(CharBoxTable()), {'whole': False, 'lines': []})
+
+    def test_is_unreadable_line(self):
+        self.assertFalse(is_unreadable_line(CharBoxTable('ab1', [0, 10, 20], [0] * 3,
+                                                         [8, 18, 28], [20] * 3)))
+        self.assertTrue(is_unreadable_line(CharBoxTable('a|~', [0, 10, 20], [0] * 3,
+                                                        [8, 18, 28], [20] * 3)))
+        # Glyphs as wide as high are of CJK scripts, even if read as plain characters.
+        self.assertTrue(is_unreadable_line(CharBoxTable('ab1', [0, 20, 40], [0] * 3,
+                                                        [18, 38, 48], [20] * 3)))
+
+    def test_needs_all_languages(self):
+        self.assertFalse(needs_all_languages([(frozenset('0123456789'), 12), (None, 8)]))
+        self.assertTrue(needs_all_languages([(frozenset('\u5c71\u7530'), 2)]))
+
+
+class TestAdaptiveScale(unittest.TestCase):
+
+    def setUp(self):
+        self.image = Image.new('RGB', (400, 400), (255, 255, 255))
+        self.image.paste((0, 0, 0), (0, 0, 400, 2))  # A rule is ignored.
+        for y in range(10, 380, 60):
+            draw_fake_text(self.image, (10, y), 'Account ID', glyph_size=(20, 40))
+
+    def test_estimate_text_height(self):
+        self.assertEqual(estimate_text_height(self.image), 40)
+        self.assertIsNone(estimate_text_height(Image.new('RGB', (100, 100), (255, 255, 255))))
+
+    def test_adaptive_scale(self):
+        self.assertEqual(adaptive_scale(self.image, 20), 0.5)
+        self.assertEqual(adaptive_scale(self.image, 36), 1)  # Not worth downscaling.
+        self.assertEqual(adaptive_scale(self.image, 80), 1)  # Never upscaled.
+        self.assertEqual(adaptive_scale(self.image, 1), 0.25)
+
+
+def fake_run_tesseract(input_filename, output_filename_base, cwd, lang, flags, configs):
+    """
+    Fake run_tesseract() writing a box file with a box of 'X' per page of a list file.
+    """
+
+    with open(os.path.join(cwd, input_filename)) as f:
+        filenames = f.read().splitlines()
+
+    with open(os.path.join(cwd, output_filename_base + '.box'), 'w') as f:
+        for page, filename in enumerate(filenames):
+            height = Image.open(os.path.join(cwd, filename)).size[1]
+            f.write('X 1 {0} 5 {1} {2}\n'.format(height - 10, height - 2, page))
+
+    return 0, ''
+
+
+@patch('masecret.ocr.run_tesseract', side_effect=fake_run_tesseract)
+class TestImagesToCharBoxes(unittest.TestCase):
+
+    def test_pages(self, run_tesseract):
+        images = [Image.new('RGB', (20, 30)), Image.new('L', (20, 40))]
+
+        tables = images_to_char_boxes(images, 'eng', ['makebox'])
+
+        self.assertEqual(run_tesseract.call_count, 1)
+        self.assertEqual([list(table.rects()) for table in tables],
+                         [[((1, 2), (5, 10))], [((1, 2), (5, 10))]])
+
+
+@patch('masecret.ocr.run_tesseract', side_effect=fake_run_tesseract)
+class TestPrefetchCharBoxes(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.paths = []
+        for i, size in enumerate([(20, 30), (20, 40), (20, 30), (20, 500)]):
+            path = os.path.join(self.tmpdir.name, '{0}.png'.format(i))
+            Image.new('RGB', size).save(path)
+            self.paths.append(path)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_prefetch(self, run_tesseract):
+        ocr_cache = OCRCache()
+        missing_path = os.path.join(self.tmpdir.name, 'missing.png')
+
+        count = prefetch_char_boxes(self.paths + [missing_path], 'eng', ['makebox'], ocr_cache,
+                                    tile_height=100)
+
+        # The third is a duplicate of the first, and the last is split into tiles.
+        self.assertEqual(count, 2)
+        self.assertEqual(run_tesseract.call_count, 1)
+        key = ocr_cache.key(Image.open(self.paths[1]), 'eng', ['makebox'])
+        self.assertEqual(ocr_cache.get(key).content, 'X')
+
+    def test_single_image(self, run_tesseract):
+        count = prefetch_char_boxes(self.paths[:1], 'eng', ['makebox'], OCRCache())
+
+        self.assertEqual(count, 0)
+        run_tesseract.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+
+import re
+import os
+import tempfile
+import threading
+
+from PIL import Image
+
+from masecret.backends import FakeBackend, draw_fake_text
+from masecret.cache import OCRCache
+from masecret.pipeline import mask_secrets_pipelined
+from masecret.report import STAGES
+
+
+class TestMaskSecretsPipelined(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.pairs = []
+        for i in range(5):
+            input_path = os.path.join(self.tempdir.name, 'original{0}.png'.format(i))
+            image = Image.new('RGB', (300, 40), (255, 255, 255))
+            draw_fake_text(image, (10, 10), 'ID 1234-5678-901{0}'.format(i))
+            image.save(input_path)
+            self.pairs.append((input_path, os.path.join(self.tempdir.name,
+                                                        'masked{0}.png'.format(i))))
+        self.secret_res = [re.compile(r'[-\d]{12,}')]
+        self.options = {'lang': 'eng', 'fill_color': (0, 0, 0), 'ocr_backend': FakeBackend(),
+                        'ocr_cache': OCRCache()}
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_pipeline(self):
+        missing_path = os.path.join(self.tempdir.name, 'missing.png')
+        pairs = self.pairs + [(missing_path, missing_path)]
+
+        results = list(mask_secrets_pipelined(iter(pairs), self.secret_res, self.options,
+                                              ocr_workers=2, depth=1, report=True))
+
+        self.assertEqual(sorted(result[0] for result in results),
+                         sorted(input_path for input_path, _ in pairs))
+        for input_path, log, error, record in results:
+            self.assertIn('Processing {0}...'.format(input_path), log)
+            if input_path == missing_path:
+                self.assertTrue(error.startswith('FileNotFoundError: '))
+                continue
+            self.assertIsNone(error)
+            self.assertEqual(sorted(record['stages']), sorted(STAGES))
+        for _, output_path in self.pairs:
+            self.assertEqual(Image.open(output_path).getpixel((60, 20)), (0, 0, 0))
+
+    def test_stop_early(self):
+        num_threads = threading.active_count()
+        results = mask_secrets_pipelined(iter(self.pairs), self.secret_res, self.options, depth=1)
+        next(results)
+        results.close()
+
+        self.assertEqual(threading.active_count(), num_threads)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,8 @@
 import unittest
 
 from masecret.position_utils import (add_positions, offset_rect, bounding_box,
-                                     padding_box, bounding_boxes_by_line)
+                                     padding_box, bounding_boxes_by_line,
+                                     offset_rects, padding_boxes, merge_rects)
 
 
 class TestPositionUtils(unittest.TestCase):
@@ -57,6 +58,58 @@ class TestPositionUtils(unittest.TestCase):
         self.assertEqual(list(bounding_boxes_by_line(rects)),
                          [((100, 0), (135, 20)), ((0, 20), (35, 40))])
 
+    def test_bounding_boxes_by_line_no_vertical_overlap(self):
+        rects = [
+            ((0, 0), (10, 20)),
+            ((10, 0), (20, 20)),
+            ((25, 30), (35, 50)),
+            ((35, 30), (45, 50)),
+        ]
+        self.assertEqual(list(bounding_boxes_by_line(rects)),
+                         [((0, 0), (20, 20)), ((25, 30), (45, 50))])
+
+    def test_bounding_boxes_by_line_iterator(self):
+        rects = iter([((0, 0), (10, 20)), ((10, 0), (20, 20))])
+        self.assertEqual(list(bounding_boxes_by_line(rects)), [((0, 0), (20, 20))])
+
+    def test_bounding_boxes_by_line_empty(self):
+        self.assertEqual(list(bounding_boxes_by_line([])), [])
+
+    def test_offset_rects(self):
+        rects = [((10, 20), (40, 60)), ((0, 0), (5, 5))]
+        self.assertEqual(offset_rects((15, 20), rects),
+                         [((25, 40), (55, 80)), ((15, 20), (20, 25))])
+
+    def test_padding_boxes(self):
+        rects = [((10, 20), (40, 60)), ((5, 5), (6, 6))]
+        self.assertEqual(padding_boxes(rects, 5),
+                         [((5, 15), (45, 65)), ((0, 0), (11, 11))])
+
+    def test_merge_rects_separate(self):
+        rects = [((50, 0), (60, 10)), ((0, 0), (10, 10)), ((0, 20), (10, 30))]
+        self.assertEqual(merge_rects(rects),
+                         [((0, 0), (10, 10)), ((50, 0), (60, 10)), ((0, 20), (10, 30))])
+
+    def test_merge_rects_overlapping(self):
+        rects = [((0, 0), (20, 10)), ((10, 0), (30, 10)), ((30, 0), (40, 10)), ((0, 10), (40, 20))]
+        self.assertEqual(merge_rects(rects), [((0, 0), (40, 20))])
+
+    def test_merge_rects_contained(self):
+        rects = [((0, 0), (100, 100)), ((10, 10), (20, 20))]
+        self.assertEqual(merge_rects(rects), [((0, 0), (100, 100))])
+
+    def test_merge_rects_bounding_box_overlapping(self):
+        # Bounding box of the rects is larger than their union, which is kept as it is.
+        rects = [((0, 0), (10, 10)), ((10, 5), (20, 30)), ((0, 25), (5, 28))]
+        self.assertEqual(merge_rects(rects),
+                         [((0, 0), (10, 10)), ((10, 5), (20, 30)), ((0, 25), (5, 28))])
+
+    def test_merge_rects_wrapped_lines(self):
+        rects = [((100, 10), (300, 32)), ((250, 32), (600, 54))]
+        self.assertEqual(merge_rects(rects), rects)
+
+        rects = [((0, 0), (50, 20)), ((40, 20), (400, 40)), ((390, 40), (900, 60))]
+        self.assertEqual(merge_rects(rects), rects)
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+
+import os
+import json
+import pstats
+import tempfile
+
+from masecret.report import StageTimer, NULL_TIMER, ReportWriter, Profiler
+
+
+class TestStageTimer(unittest.TestCase):
+
+    def test_record(self):
+        timer = StageTimer()
+        with timer.stage('ocr'):
+            pass
+        with timer.stage('ocr'):
+            pass
+        timer.count('chars', 3)
+        timer.count('chars', 4)
+
+        record = timer.record()
+        self.assertEqual(list(record['stages']), ['ocr'])
+        self.assertGreaterEqual(record['stages']['ocr'], 0)
+        self.assertGreaterEqual(record['total'], record['stages']['ocr'])
+        self.assertEqual(record['counts'], {'chars': 7})
+
+    def test_stage_with_exception(self):
+        timer = StageTimer()
+        with self.assertRaises(ValueError):
+            with timer.stage('decode'):
+                raise ValueError()
+        self.assertIn('decode', timer.record()['stages'])
+
+    def test_null_timer(self):
+        with NULL_TIMER.stage('ocr'):
+            NULL_TIMER.count('chars', 1)
+
+
+class TestReportWriter(unittest.TestCase):
+
+    def test_write(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            path = os.path.join(tempdir, 'report.jsonl')
+            writer = ReportWriter(path)
+            writer.write({'input': 'a.png', 'total': 1.0})
+            writer.write({'input': 'b.png', 'total': 2.0})
+            writer.close()
+
+            with open(path) as f:
+                self.assertEqual([json.loads(line)['input'] for line in f], ['a.png', 'b.png'])
+
+
+class TestProfiler(unittest.TestCase):
+
+    def test_profile(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            path = os.path.join(tempdir, 'masecret.prof')
+            with Profiler(path):
+                sorted(range(100))
+
+            self.assertGreater(pstats.Stats(path).total_calls, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
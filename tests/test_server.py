@@ -0,0 +1,199 @@
+import unittest
+from unittest.mock import patch
+
+import io
+import re
+import json
+import time
+import base64
+import asyncio
+import functools
+
+from PIL import Image
+
+from masecret.backends import FakeBackend, draw_fake_text
+from masecret.cache import OCRCache
+from masecret.matching import SecretMatcher
+from masecret.server import MaskingServer
+
+
+def fake_image_bytes():
+    image = Image.new('RGB', (300, 40), (255, 255, 255))
+    draw_fake_text(image, (10, 10), 'ID 1234-5678-9012')
+    output = io.BytesIO()
+    image.save(output, format='PNG')
+    return output.getvalue()
+
+
+async def request(port, method, target, body=b'', headers=None):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        lines = ['{0} {1} HTTP/1.1'.format(method, target), 'Host: localhost',
+                 'Content-Length: {0}'.format(len(body)), 'Connection: close']
+        lines.extend(headers or [])
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+        await writer.drain()
+
+        status = int((await reader.readline()).split()[1])
+        response_headers = {}
+        while True:
+            line = (await reader.readline()).decode('latin-1')
+            if line == '\r\n':
+                break
+            name, _, value = line.partition(':')
+            response_headers[name.lower()] = value.strip()
+        response_body = await reader.readexactly(int(response_headers['content-length']))
+        return status, response_headers, response_body
+    finally:
+        writer.close()
+
+
+def async_test(f):
+    """
+    Run a coroutine test method in the event loop of the test case.
+    """
+
+    @functools.wraps(f)
+    def wrapper(self):
+        return self.loop.run_until_complete(f(self))
+    return wrapper
+
+
+class TestMaskingServer(unittest.TestCase):
+
+    def setUp(self):
+        # IsolatedAsyncioTestCase is not available before Python 3.8.
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        secret_matcher = SecretMatcher([re.compile(r'[-\d]{12,}')])
+        options = {
+            'lang': 'eng',
+            'fill_color': (255, 0, 255),
+            'ocr_backend': FakeBackend(),
+            'ocr_cache': OCRCache(),
+        }
+        self.server = MaskingServer(lambda: (secret_matcher, None), options, jobs=1,
+                                    queue_size=0, timeout=1, max_body_size=1024 * 1024)
+        self.listener = self.loop.run_until_complete(
+            asyncio.start_server(self.server.handle_connection, '127.0.0.1', 0))
+        self.port = self.listener.sockets[0].getsockname()[1]
+
+    def tearDown(self):
+        self.listener.close()
+        self.loop.run_until_complete(self.listener.wait_closed())
+        # Cancel handlers of connections left open, as IsolatedAsyncioTestCase does.
+        # asyncio.all_tasks() is not available before Python 3.7.
+        all_tasks = getattr(asyncio, 'all_tasks', None) or asyncio.Task.all_tasks
+        tasks = [task for task in all_tasks(self.loop) if not task.done()]
+        for task in tasks:
+            task.cancel()
+        self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        self.server.close()
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    @async_test
+    async def test_mask(self):
+        status, headers, body = await request(self.port, 'POST', '/mask', fake_image_bytes())
+
+        self.assertEqual(status, 200)
+        self.assertEqual(headers['content-type'], 'image/png')
+        self.assertEqual(json.loads(headers['x-secret-rects']), [[[44, 8], [214, 32]]])
+        image = Image.open(io.BytesIO(body))
+        self.assertEqual(image.getpixel((100, 20)), (255, 0, 255))
+
+    @async_test
+    async def test_mask_json(self):
+        status, _, body = await request(self.port, 'POST', '/mask?format=json',
+                                        fake_image_bytes())
+
+        self.assertEqual(status, 200)
+        result = json.loads(body.decode('utf-8'))
+        self.assertEqual(result['rects'], [[[44, 8], [214, 32]]])
+        self.assertEqual(result['content_type'], 'image/png')
+        Image.open(io.BytesIO(base64.b64decode(result['image'])))
+
+    @async_test
+    async def test_multi_frame(self):
+        frames = [Image.new('RGB', (300, 40), (255, 255, 255)) for _ in range(2)]
+        draw_fake_text(frames[1], (10, 10), 'ID 1234-5678-9012')
+        output = io.BytesIO()
+        frames[0].save(output, format='GIF', save_all=True, append_images=frames[1:])
+
+        status, headers, body = await request(self.port, 'POST', '/mask', output.getvalue())
+
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(headers['x-secret-rects']), [[[44, 8], [214, 32]]])
+        image = Image.open(io.BytesIO(body))
+        self.assertEqual(image.n_frames, 2)
+        image.seek(1)
+        self.assertEqual(image.convert('RGB').getpixel((100, 20)), (255, 0, 255))
+
+    @async_test
+    async def test_no_secrets(self):
+        image = Image.new('RGB', (100, 40), (255, 255, 255))
+        draw_fake_text(image, (10, 10), 'ID')
+        output = io.BytesIO()
+        image.save(output, format='PNG')
+
+        status, headers, body = await request(self.port, 'POST', '/mask', output.getvalue())
+
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(headers['x-secret-rects']), [])
+        self.assertEqual(body, output.getvalue())
+
+    @async_test
+    async def test_invalid_image(self):
+        status, _, body = await request(self.port, 'POST', '/mask', b'not an image')
+        self.assertEqual(status, 400)
+        self.assertIn('Invalid image', json.loads(body.decode('utf-8'))['error'])
+
+    @async_test
+    async def test_not_found_and_method(self):
+        self.assertEqual((await request(self.port, 'POST', '/unknown'))[0], 404)
+        self.assertEqual((await request(self.port, 'GET', '/mask'))[0], 405)
+        self.assertEqual((await request(self.port, 'GET', '/health'))[0], 200)
+
+    @async_test
+    async def test_too_large(self):
+        status, _, _ = await request(self.port, 'POST', '/mask', b'x' * (1024 * 1024 + 1))
+        self.assertEqual(status, 413)
+
+    @async_test
+    async def test_busy_and_timeout(self):
+        def slow_mask_bytes(data):
+            time.sleep(1.5)
+            return b'', [], 'image/png'
+
+        with patch.object(self.server, 'mask_bytes', side_effect=slow_mask_bytes):
+            first = asyncio.ensure_future(request(self.port, 'POST', '/mask', b'x'))
+            await asyncio.sleep(0.2)
+            # No queue, so the second request is rejected while the first is running.
+            status, headers, _ = await request(self.port, 'POST', '/mask', b'x')
+            self.assertEqual(status, 503)
+            self.assertEqual(headers['retry-after'], '1')
+
+            self.assertEqual((await first)[0], 504)
+
+    @async_test
+    async def test_keep_alive(self):
+        reader, writer = await asyncio.open_connection('127.0.0.1', self.port)
+        try:
+            for _ in range(2):
+                writer.write(b'GET /health HTTP/1.1\r\nHost: localhost\r\n\r\n')
+                await writer.drain()
+                self.assertEqual(await reader.readline(), b'HTTP/1.1 200 OK\r\n')
+                length = 0
+                while True:
+                    line = await reader.readline()
+                    if line == b'\r\n':
+                        break
+                    if line.lower().startswith(b'content-length:'):
+                        length = int(line.split(b':')[1])
+                await reader.readexactly(length)
+        finally:
+            writer.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
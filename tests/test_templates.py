@@ -0,0 +1,129 @@
+import unittest
+
+import os
+import re
+import tempfile
+
+from PIL import Image, ImageDraw
+
+from masecret.backends import FakeBackend, draw_fake_text
+from masecret.masking import find_secret_rects
+from masecret.matching import SecretMatcher
+from masecret.templates import (LayoutTemplates, template_scope, image_fingerprint, merge_regions,
+                                region_bands, MIN_FULL_PASSES, MAX_DISTANCE,
+                                FULL_PASS_INTERVAL)
+
+
+def screenshot(secret_top, text='ID 1234-5678-9012', sidebar_left=0):
+    image = Image.new('RGB', (1280, 800), (255, 255, 255))
+    draw = ImageDraw.Draw(image)
+    draw.rectangle(((0, 0), (1279, 60)), fill=(40, 40, 120))
+    draw.rectangle(((sidebar_left, 61), (sidebar_left + 240, 799)), fill=(220, 220, 220))
+    draw_fake_text(image, (300, secret_top), text)
+    return image
+
+
+class TestLayoutTemplates(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.secret_res = SecretMatcher([re.compile(r'[-\d]{12,}')])
+        self.options = {'lang': 'eng', 'ocr_backend': FakeBackend()}
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def find(self, image, layout_templates):
+        return find_secret_rects(image, self.secret_res, layout_templates=layout_templates,
+                                 **self.options)
+
+    def test_learn_and_recognize_regions(self):
+        layout_templates = LayoutTemplates(self.tempdir.name)
+        scope = template_scope(self.secret_res)
+
+        for _ in range(MIN_FULL_PASSES):
+            layout = layout_templates.plan(screenshot(300), scope)
+            self.assertIsNone(layout.bands)
+            self.assertEqual(self.find(screenshot(300), layout_templates),
+                             [((334, 298), (504, 322))])
+
+        layout = layout_templates.plan(screenshot(300), scope)
+        self.assertEqual(layout.template['full_passes'], MIN_FULL_PASSES)
+        self.assertEqual(layout.template['regions'], [[298, 322, MIN_FULL_PASSES]])
+        self.assertEqual(layout.bands, [(248, 372)])
+
+        # Only the learned region is recognized.
+        self.assertEqual(self.find(screenshot(310, 'ID 9876-5432-1098'), layout_templates),
+                         [((334, 308), (504, 332))])
+        self.assertEqual(self.find(screenshot(600), layout_templates), [])
+
+        self.assertEqual(self.find(screenshot(600), LayoutTemplates(self.tempdir.name, True)),
+                         [((334, 598), (504, 622))])
+
+    def test_no_regions(self):
+        layout_templates = LayoutTemplates(self.tempdir.name)
+        for _ in range(MIN_FULL_PASSES):
+            self.assertEqual(self.find(screenshot(300, 'ID'), layout_templates), [])
+
+        # A layout without secrets so far is still recognized as a whole.
+        self.assertEqual(self.find(screenshot(600), layout_templates),
+                         [((334, 598), (504, 622))])
+
+    def test_periodic_full_pass(self):
+        layout_templates = LayoutTemplates(self.tempdir.name)
+        scope = template_scope(self.secret_res)
+        for _ in range(MIN_FULL_PASSES):
+            self.find(screenshot(300), layout_templates)
+
+        found = []
+        for _ in range(FULL_PASS_INTERVAL - MIN_FULL_PASSES):
+            self.assertIsNotNone(layout_templates.plan(screenshot(600), scope).bands)
+            found.append(self.find(screenshot(600), layout_templates))
+        self.assertEqual(found, [[]] * (FULL_PASS_INTERVAL - MIN_FULL_PASSES))
+
+        # A secret in a new place is found and learned by a periodic full pass.
+        self.assertEqual(self.find(screenshot(600), layout_templates),
+                         [((334, 598), (504, 622))])
+        self.assertEqual(self.find(screenshot(600), layout_templates),
+                         [((334, 598), (504, 622))])
+
+    def test_weak_match(self):
+        layout_templates = LayoutTemplates(self.tempdir.name)
+        scope = template_scope(self.secret_res)
+        for _ in range(MIN_FULL_PASSES):
+            self.find(screenshot(300), layout_templates)
+
+        self.assertIsNone(layout_templates.plan(screenshot(300, sidebar_left=1039), scope).template)
+        self.assertIsNone(layout_templates.plan(screenshot(300).resize((1280, 801)),
+                                                scope).template)
+        self.assertIsNone(layout_templates.plan(screenshot(300), 'other').template)
+
+        # A weak match is recognized as a whole and learned as another layout.
+        self.assertEqual(len(self.find(screenshot(600, sidebar_left=1039), layout_templates)), 1)
+        self.assertEqual(len(os.listdir(os.path.join(self.tempdir.name, scope, '1280x800'))), 2)
+
+    def test_fingerprint(self):
+        def distance(a, b):
+            return bin(image_fingerprint(a) ^ image_fingerprint(b)).count('1')
+
+        self.assertLessEqual(distance(screenshot(300), screenshot(500, 'ID 9876-5432-1098')),
+                             MAX_DISTANCE)
+        self.assertLessEqual(distance(screenshot(300), screenshot(300, '')), MAX_DISTANCE)
+        self.assertGreater(distance(screenshot(300), screenshot(300, sidebar_left=1039)),
+                           MAX_DISTANCE)
+
+
+class TestRegions(unittest.TestCase):
+
+    def test_merge_regions(self):
+        self.assertEqual(merge_regions([[50, 60, 1], [10, 20, 2], [15, 30, 1]]),
+                         [[10, 30, 3], [50, 60, 1]])
+
+    def test_region_bands(self):
+        regions = [[10, 20, 1], [100, 120, 1], [150, 160, 1]]
+        self.assertEqual(region_bands(regions, 170, 20), [(0, 40), (80, 170)])
+        self.assertEqual(region_bands([], 170), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
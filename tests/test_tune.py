@@ -0,0 +1,134 @@
+import unittest
+from unittest.mock import patch
+
+import os
+import re
+import json
+import tempfile
+
+from PIL import Image
+
+from masecret.backends import FakeBackend, draw_fake_text, get_backend
+from masecret.cache import image_digest
+from masecret.matching import SecretMatcher
+from masecret.manifest import write_manifest, MANIFEST_VERSION
+from masecret.tune import (tune_main, parse_tune_args, candidate_params, load_corpus, evaluate,
+                           coverage, pareto_front, select)
+
+
+class TestTune(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        image = Image.new('RGB', (300, 40), (255, 255, 255))
+        draw_fake_text(image, (10, 10), 'ID 1234-5678-9012')
+        image.save(os.path.join(self.tempdir.name, 'a.png'))
+        self.manifest_path = os.path.join(self.tempdir.name, 'manifest.json')
+        self.manifest = {
+            'version': MANIFEST_VERSION,
+            'settings': {},
+            'images': [{
+                'path': 'a.png',
+                'digest': image_digest(image),
+                'size': [300, 40],
+                'rects': [[[44, 8], [214, 32]]],
+            }],
+        }
+        write_manifest(self.manifest_path, self.manifest)
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_evaluate(self):
+        corpus = load_corpus(self.manifest, self.tempdir.name)
+        self.assertEqual(corpus[0][2], [((44, 8), (214, 32))])
+
+        options = {'lang': 'eng', 'ocr_backend': FakeBackend()}
+        result = evaluate(corpus, SecretMatcher([re.compile(r'[-\d]{12,}')]), options)
+        self.assertEqual((result['recalled'], result['expected'], result['recall']), (1, 1, 1.0))
+
+        result = evaluate(corpus, SecretMatcher([re.compile(r'\d{5}')]), options)
+        self.assertEqual((result['recalled'], result['expected'], result['recall']), (0, 1, 0.0))
+
+    def test_evaluate_warms_up(self):
+        corpus = load_corpus(self.manifest, self.tempdir.name)
+        options = {'lang': 'eng', 'ocr_backend': FakeBackend()}
+        with patch('masecret.tune.find_secret_rects', return_value=[]) as find:
+            evaluate(corpus, SecretMatcher([re.compile(r'\d{5}')]), options)
+        self.assertEqual(find.call_count, len(corpus) + 1)
+
+    def test_changed_image(self):
+        self.manifest['images'][0]['digest'] = 'x'
+        with self.assertRaises(ValueError):
+            load_corpus(self.manifest, self.tempdir.name)
+
+    def test_tune_main(self):
+        config_path = os.path.join(self.tempdir.name, 'tuned.args')
+        results_path = os.path.join(self.tempdir.name, 'results.json')
+        backend = FakeBackend()
+        # The fake backend cannot be chosen by name, so it is loaded as the default.
+        with patch.dict('masecret.backends._backends', {'auto': backend, backend.name: backend}):
+            status = tune_main([self.manifest_path, '-o', config_path, '-r', r'[-\d]{12,}',
+                                '--candidate', '--psm 6 makebox',
+                                '--candidate', '--psm 11 makebox', '--results', results_path])
+        self.assertEqual(status, 0)
+
+        with open(config_path) as f:
+            config = f.read()
+        self.assertRegex(config, r'^--tesseract-params=--psm (6|11) makebox\n$')
+
+        with open(results_path) as f:
+            results = json.load(f)
+        self.assertEqual([r['params'] for r in results['results']],
+                         ['--psm 6 makebox', '--psm 11 makebox'])
+        self.assertIn(results['selected'], config)
+
+        args = parse_tune_args(['@' + config_path, self.manifest_path, '-o', config_path])
+        self.assertEqual(args.tesseract_params, results['selected'])
+
+
+class TestCandidateParams(unittest.TestCase):
+
+    def test_default(self):
+        args = parse_tune_args(['manifest.json', '-o', 'tuned.args'])
+        candidates = candidate_params(args)
+        self.assertEqual(candidates[0], ' '.join(get_backend(args.ocr_backend).default_configs()))
+        self.assertEqual(len(candidates), len(set(candidates)))
+        self.assertEqual(len(candidates), 12)
+
+    def test_given(self):
+        args = parse_tune_args(['manifest.json', '-o', 'tuned.args', '--candidate', '--psm 4'])
+        self.assertEqual(candidate_params(args), ['--psm 4'])
+
+    def test_not_pyocr(self):
+        args = parse_tune_args(['manifest.json', '-o', 'tuned.args'])
+        backend = FakeBackend()
+        with patch.dict('masecret.backends._backends', {'auto': backend}), \
+                patch('masecret.tune.psm_parameter', return_value='-psm'):
+            candidates = candidate_params(args)
+        self.assertTrue(all(params.startswith('--psm ') for params in candidates[1:]))
+
+
+class TestParetoFront(unittest.TestCase):
+
+    def test_pareto_front(self):
+        fast = {'latency': 0.1, 'recall': 0.5}
+        slow = {'latency': 0.3, 'recall': 1.0}
+        dominated = {'latency': 0.2, 'recall': 0.5}
+        middle = {'latency': 0.2, 'recall': 0.9}
+        front = pareto_front([slow, dominated, fast, middle])
+        self.assertEqual(front, [fast, middle, slow])
+
+        self.assertIs(select(front), slow)
+        self.assertIs(select(front, 0.8), middle)
+        self.assertIs(select(front, 0.5), fast)
+
+    def test_coverage(self):
+        rect = ((0, 0), (10, 10))
+        self.assertEqual(coverage(rect, []), 0)
+        self.assertEqual(coverage(rect, [((-5, -5), (20, 20))]), 1)
+        self.assertAlmostEqual(coverage(rect, [((0, 0), (4, 9))]), 0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,196 @@
+import unittest
+from unittest.mock import MagicMock
+
+import os
+import time
+import tempfile
+import threading
+from argparse import Namespace
+
+from masecret.watch import (parser, parse_args, watch, Inbox, PollingWatcher, InotifyWatcher,
+                            ReloadingSecrets, needs_masking, is_image_path)
+
+
+def write_file(path, content=b'x', mtime=None):
+    with open(path, 'wb') as f:
+        f.write(content)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+class TempDirTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.dir = self.tempdir.name
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+
+class TestParseArgs(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.original_error = parser.error
+        parser.error = MagicMock(side_effect=SystemExit())
+
+    def tearDown(self):
+        parser.error = self.original_error
+        super().tearDown()
+
+    def test_parse_args(self):
+        args = parse_args([self.dir, '-o', os.path.dirname(self.dir), '-j', '2', '-r', r'\d+'])
+        self.assertEqual(args.directory, self.dir)
+        self.assertEqual(args.jobs, 2)
+
+    def test_same_output_dir(self):
+        with self.assertRaises(SystemExit):
+            parse_args([self.dir, '-o', self.dir])
+        parser.error.assert_called_once_with('OUTPUT_DIR must be different from DIR.')
+
+
+class TestInbox(TempDirTestCase):
+
+    def test_debounce(self):
+        path = os.path.join(self.dir, 'a.png')
+        write_file(path, mtime=100)
+        inbox = Inbox(1.0)
+
+        inbox.add(path, 0.0)
+        self.assertEqual(inbox.pop_ready(0.0), [])
+        self.assertEqual(inbox.pop_ready(0.5), [])
+        write_file(path, b'xy', mtime=101)  # Still being written.
+        self.assertEqual(inbox.pop_ready(1.2), [])
+        self.assertEqual(inbox.pop_ready(2.0), [])
+        self.assertEqual(inbox.pop_ready(2.2), [path])
+        self.assertEqual(inbox.pop_ready(5.0), [])
+
+    def test_unchanged(self):
+        path = os.path.join(self.dir, 'a.png')
+        write_file(path, mtime=100)
+        inbox = Inbox(0)
+        inbox.add(path, 0.0)
+        self.assertEqual(inbox.pop_ready(0.0), [])
+        self.assertEqual(inbox.pop_ready(0.0), [path])
+
+        inbox.add(path, 1.0)
+        inbox.pop_ready(1.0)
+        self.assertEqual(inbox.pop_ready(1.0), [])
+
+        write_file(path, b'xy', mtime=101)
+        inbox.add(path, 2.0)
+        inbox.pop_ready(2.0)
+        self.assertEqual(inbox.pop_ready(2.0), [path])
+
+    def test_removed(self):
+        inbox = Inbox(0)
+        inbox.add(os.path.join(self.dir, 'missing.png'), 0.0)
+        self.assertEqual(inbox.pop_ready(0.0), [])
+        self.assertEqual(inbox.pop_ready(0.0), [])
+
+
+class TestPollingWatcher(TempDirTestCase):
+
+    def test_wait(self):
+        a = os.path.join(self.dir, 'a.png')
+        b = os.path.join(self.dir, 'b.png')
+        write_file(a, mtime=100)
+        watcher = PollingWatcher(self.dir)
+
+        self.assertEqual(watcher.wait(0), [a])
+        self.assertEqual(watcher.wait(0), [])
+        write_file(a, mtime=101)
+        write_file(b)
+        self.assertEqual(sorted(watcher.wait(0)), [a, b])
+
+
+class TestInotifyWatcher(TempDirTestCase):
+
+    def test_wait(self):
+        try:
+            watcher = InotifyWatcher(self.dir)
+        except OSError as e:
+            self.skipTest(str(e))
+
+        try:
+            self.assertEqual(watcher.wait(0), [])
+            path = os.path.join(self.dir, 'a.png')
+            write_file(path)
+            self.assertEqual(watcher.wait(1), [path])
+            self.assertEqual(watcher.wait(0), [])
+        finally:
+            watcher.close()
+
+
+class TestWatch(TempDirTestCase):
+
+    def test_watch(self):
+        handled = []
+        done = threading.Event()
+
+        def handler(path):
+            handled.append(path)
+            done.set()
+
+        stop = threading.Event()
+        thread = threading.Thread(target=watch, args=(PollingWatcher(self.dir), handler, 0.05,
+                                                      0.01, 2, 1, stop))
+        thread.start()
+        try:
+            write_file(os.path.join(self.dir, 'notes.txt'))
+            write_file(os.path.join(self.dir, 'a.png'))
+            self.assertTrue(done.wait(5))
+            time.sleep(0.2)
+        finally:
+            stop.set()
+            thread.join()
+
+        self.assertEqual(handled, [os.path.join(self.dir, 'a.png')])
+
+
+class TestReloadingSecrets(TempDirTestCase):
+
+    def test_reload(self):
+        secret_path = os.path.join(self.dir, 'SECRETS.txt')
+        write_file(secret_path, b'\\d+\n', mtime=100)
+        secrets = ReloadingSecrets(Namespace(regex=None, secret_path=secret_path,
+                                             literals_path=None, fold_confusables=False))
+
+        secret_res, literal_matcher = secrets.get()
+        self.assertEqual([r.pattern for r in secret_res.secret_res], [r'\d+'])
+        self.assertIsNone(literal_matcher)
+        self.assertIs(secrets.get()[0], secret_res)
+
+        write_file(secret_path, b'[a-z]+\n', mtime=101)
+        self.assertEqual([r.pattern for r in secrets.get()[0].secret_res], ['[a-z]+'])
+
+        write_file(secret_path, b'(\n', mtime=102)  # Invalid regex keeps previous secrets.
+        self.assertEqual([r.pattern for r in secrets.get()[0].secret_res], ['[a-z]+'])
+
+
+class TestNeedsMasking(TempDirTestCase):
+
+    def test_needs_masking(self):
+        input_path = os.path.join(self.dir, 'a.png')
+        output_path = os.path.join(self.dir, 'b.png')
+        write_file(input_path, mtime=100)
+        self.assertTrue(needs_masking(input_path, output_path))
+
+        write_file(output_path, mtime=101)
+        self.assertFalse(needs_masking(input_path, output_path))
+
+        write_file(input_path, mtime=102)
+        self.assertTrue(needs_masking(input_path, output_path))
+
+
+class TestIsImagePath(unittest.TestCase):
+
+    def test_is_image_path(self):
+        self.assertTrue(is_image_path('/inbox/Screen Shot.PNG'))
+        self.assertFalse(is_image_path('/inbox/.Screen Shot.png'))
+        self.assertFalse(is_image_path('/inbox/a.png.part'))
+
+
+if __name__ == '__main__':
+    unittest.main()